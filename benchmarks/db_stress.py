@@ -0,0 +1,160 @@
+"""
+Нагрузочный тест хранилища: два потока со своими циклами событий (как бот и
+проверка цен в run_bot.py) одновременно меняют одну базу через AsyncDatabase.
+
+Проверяет, что не было исключений, обратный индекс совпадает с данными,
+а база после перезапуска (снимок + журнал) совпадает с состоянием в памяти.
+Печатает максимальную задержку циклов событий.
+
+Запуск: python benchmarks/db_stress.py [json|sqlite] [секунд]
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from config import Config  # noqa: E402
+from database import AsyncDatabase, Database  # noqa: E402
+from sqlite_database import SQLiteDatabase  # noqa: E402
+
+USERS = 500
+COINS = [f"coin-{i}" for i in range(100)]
+WORKERS_PER_LOOP = 20
+
+
+def open_store(backend, path):
+    if backend == 'sqlite':
+        return SQLiteDatabase(path + '.sqlite3', import_existing=False)
+    return Database(path + '.json')
+
+
+async def bot_worker(adb, rnd, deadline, counter):
+    """Действия пользователей: монеты, пороги, просмотр"""
+    while time.monotonic() < deadline:
+        user_id = rnd.randrange(USERS)
+        coin = rnd.choice(COINS)
+        action = rnd.random()
+        await adb.add_user(user_id, f"user{user_id}")
+        if action < 0.3:
+            await adb.add_coin(user_id, coin)
+        elif action < 0.45:
+            await adb.remove_coin(user_id, coin)
+        elif action < 0.6:
+            await adb.set_coin_threshold(user_id, coin, rnd.choice([0.5, 1, 2, 5]))
+        elif action < 0.7:
+            await adb.set_threshold(user_id, rnd.choice([0.5, 1, 2, 5]))
+        elif action < 0.75:
+            await adb.remove_individual_threshold(user_id, coin)
+        elif action < 0.77:
+            await adb.clear_user_data(user_id)
+        else:
+            await adb.get_user(user_id)
+            await adb.get_user_coins(user_id)
+        counter[0] += 1
+
+
+async def checker_worker(adb, rnd, deadline, counter):
+    """Тики проверки цен: подписчики монеты и обновление последних цен"""
+    while time.monotonic() < deadline:
+        coin = rnd.choice(await adb.get_all_users_coins() or COINS)
+        for user_info in await adb.get_users_for_coin(coin):
+            await adb.update_price(user_info['user_id'], coin, rnd.uniform(1, 100))
+        counter[0] += 1
+
+
+async def lag_monitor(deadline, interval=0.01):
+    """Максимальное опоздание пробуждения - насколько цикл событий был занят"""
+    worst = 0.0
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.monotonic() - started - interval)
+    return worst
+
+
+def run_loop(name, worker, adb, seconds, results, errors):
+    async def main():
+        deadline = time.monotonic() + seconds
+        counter = [0]
+        rnd = random.Random(name)
+        tasks = [worker(adb, rnd, deadline, counter) for _ in range(WORKERS_PER_LOOP)]
+        lag, *outcomes = await asyncio.gather(lag_monitor(deadline), *tasks, return_exceptions=True)
+        errors.extend(o for o in outcomes if isinstance(o, Exception))
+        results[name] = (counter[0], lag)
+
+    asyncio.run(main())
+
+
+def snapshot(store):
+    """Данные в формате JSON с отсортированными монетами (для сравнения)"""
+    users = {}
+    for user_id in store.get_all_users():
+        user = store.get_user(user_id)
+        user['coins'] = sorted(user['coins'])
+        users[str(user_id)] = user
+    return users
+
+
+def check_index(store):
+    """Подписчики из индекса совпадают с монетами пользователей"""
+    expected = {}
+    for user_id in store.get_all_users():
+        for coin in store.get_user_coins(user_id):
+            expected.setdefault(coin, set()).add(int(user_id))
+    actual = {coin: {u['user_id'] for u in store.get_users_for_coin(coin)}
+              for coin in store.get_all_users_coins()}
+    return expected == actual
+
+
+def main():
+    backend = sys.argv[1] if len(sys.argv) > 1 else 'json'
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    logging.basicConfig(level=logging.WARNING)
+    # Предупреждения о пользователях, удаленных соседним циклом, здесь ожидаемы
+    logging.getLogger('database').setLevel(logging.ERROR)
+    logging.getLogger('sqlite_database').setLevel(logging.ERROR)
+    # Частое сжатие журнала, чтобы снимки делались прямо под нагрузкой
+    Config.DB_JOURNAL_MAX_BYTES = 256 * 1024
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'stress')
+        store = open_store(backend, path)
+        adb = AsyncDatabase(store)
+        results, errors = {}, []
+
+        threads = [
+            threading.Thread(target=run_loop, args=('bot', bot_worker, adb, seconds, results, errors)),
+            threading.Thread(target=run_loop, args=('checker', checker_worker, adb, seconds, results, errors)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        index_ok = check_index(store)
+        before = snapshot(store)
+        store.close()
+        reopened = open_store(backend, path)
+        restored_ok = snapshot(reopened) == before
+        reopened.close()
+
+    print(f"хранилище: {backend}, {seconds:.0f} с")
+    for name, (operations, lag) in sorted(results.items()):
+        print(f"  {name:<8} операций: {operations:>8}  макс. задержка цикла: {lag * 1000:.1f} мс")
+    print(f"  вызовов сразу / в пуле потоков: {adb.stats['inline']} / {adb.stats['offloaded']}")
+    if backend == 'json':
+        print(f"  сбросов журнала: {store.stats['flushes']}, сжатий: {store.stats['compactions']}")
+    print(f"  исключений: {len(errors)}", *errors[:3])
+    print(f"  индекс согласован: {index_ok}, данные после перезапуска совпадают: {restored_ok}")
+    if errors or not index_ok or not restored_ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Бенчмарк: память на одну подписку - прежнее представление Database (вложенные
+словари users_data.json плюс обратный индекс из словарей) против компактного
+
+Запуск: python benchmarks/memory_subscriptions.py [число подписок ...]
+"""
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database  # noqa: E402
+
+SUBSCRIPTION_COUNTS = [10_000, 100_000, 1_000_000]
+COINS_PER_USER = 5
+COIN_UNIVERSE = 2000
+
+
+def generate(subscriptions):
+    """Данные в формате users_data.json: у части монет индивидуальный порог"""
+    rnd = random.Random(subscriptions)
+    coins = [f"coin-{i}" for i in range(COIN_UNIVERSE)]
+    users = {}
+    for user_id in range(subscriptions // COINS_PER_USER):
+        user_coins = rnd.sample(coins, COINS_PER_USER)
+        users[str(10 ** 8 + user_id)] = {
+            'username': f"user{user_id}",
+            'coins': user_coins,
+            'threshold': 1.0,
+            'coin_thresholds': {c: 2.5 for c in user_coins[:1]},
+            'last_prices': {c: rnd.uniform(0.01, 70000) for c in user_coins}
+        }
+    return {'users': users}
+
+
+def build_dict_index(data):
+    """Обратный индекс в прежнем виде: монета -> {user_id: словарь подписки}"""
+    index = {}
+    for user_id_str, user in data['users'].items():
+        for coin_name in user['coins']:
+            index.setdefault(coin_name, {})[user_id_str] = {
+                'user_id': int(user_id_str),
+                'threshold': user['coin_thresholds'].get(coin_name, user['threshold']),
+                'last_price': user['last_prices'].get(coin_name)
+            }
+    return index
+
+
+def measure(build):
+    """Прирост памяти (байт) при построении структуры"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, used
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or SUBSCRIPTION_COUNTS
+    print(f"{'подписок':>10} {'dict, Б/подп.':>14} {'compact, Б/подп.':>17} {'выигрыш':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in counts:
+            path = os.path.join(tmp, f"users_{count}.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(generate(count), f)
+
+            def load_dicts():
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+                return data, build_dict_index(data)
+
+            def load_compact():
+                return Database(path)
+
+            dicts, dict_bytes = measure(load_dicts)
+            del dicts
+            store, compact_bytes = measure(load_compact)
+            store.close()
+            del store
+
+            print(f"{count:>10} {dict_bytes / count:>14.0f} {compact_bytes / count:>17.0f} "
+                  f"{dict_bytes / compact_bytes:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
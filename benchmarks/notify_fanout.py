@@ -0,0 +1,183 @@
+"""
+Бенчмарк рассылки уведомлений: прежняя последовательная отправка против
+Notifier на локальном поддельном Bot API
+
+Сервер отвечает с задержкой, ограничивает частоту как Telegram (общий лимит
+в секунду и сообщение в секунду на чат, сверх лимита - 429 с retry_after),
+часть чатов медленные, часть заблокировали бота. Печатает скорость
+доставки, p50/p99 задержки от обнаружения до доставки и потерянные сообщения.
+
+Запуск: python benchmarks/notify_fanout.py [уведомлений]
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from telegram import Bot  # noqa: E402
+from telegram.request import HTTPXRequest  # noqa: E402
+
+from notifier import Notifier  # noqa: E402
+
+ALERTS = 400
+ALERTS_PER_CHAT = 4          # у пользователя сработало несколько монет сразу
+GLOBAL_LIMIT = 30            # сообщений в секунду на бота
+CHAT_INTERVAL = 1.0          # не чаще сообщения в секунду в один чат
+LATENCY = (0.02, 0.08)       # обычная задержка ответа, сек
+SLOW_LATENCY = 2.0           # медленные чаты
+SLOW_SHARE = 0.02
+BLOCKED_SHARE = 0.02
+TOKEN = '123456:benchmark'
+
+
+class FakeBotApi:
+    """Минимальный HTTP сервер с методами getMe и sendMessage"""
+
+    def __init__(self, slow_chats, blocked_chats):
+        self.slow_chats = slow_chats
+        self.blocked_chats = blocked_chats
+        self.sent = deque()
+        self.chat_last = {}
+        self.delivered = defaultdict(list)  # чат -> время доставки (time.monotonic)
+        self.rejected = 0
+        self.port = None
+        self._ready = threading.Event()
+
+    def start(self):
+        threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True).start()
+        self._ready.wait()
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._client, '127.0.0.1', 0)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with server:
+            await server.serve_forever()
+
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b''):
+                        break
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, payload = await self._handle(request_line.decode().split()[1], headers, body)
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, path, headers, body):
+        method = path.rsplit('/', 1)[-1]
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'bench',
+                                                'username': 'bench_bot'}}
+
+        if 'json' in headers.get('content-type', ''):
+            params = json.loads(body or b'{}')
+        else:
+            params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        chat_id = int(params['chat_id'])
+
+        await asyncio.sleep(SLOW_LATENCY if chat_id in self.slow_chats else random.uniform(*LATENCY))
+        if chat_id in self.blocked_chats:
+            return 403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}
+
+        now = time.monotonic()
+        while self.sent and now - self.sent[0] > 1.0:
+            self.sent.popleft()
+        if len(self.sent) >= GLOBAL_LIMIT or now - self.chat_last.get(chat_id, -10) < CHAT_INTERVAL:
+            self.rejected += 1
+            return 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                         'parameters': {'retry_after': 1}}
+
+        self.sent.append(now)
+        self.chat_last[chat_id] = now
+        self.delivered[chat_id].append(now)
+        return 200, {'ok': True, 'result': {'message_id': len(self.sent), 'date': int(time.time()),
+                                            'chat': {'id': chat_id, 'type': 'private'},
+                                            'text': params.get('text', '')}}
+
+
+def make_alerts(count):
+    rnd = random.Random(count)
+    chats = [10 ** 6 + i for i in range(max(1, count // ALERTS_PER_CHAT))]
+    alerts = [rnd.choice(chats) for _ in range(count)]
+    slow = set(rnd.sample(chats, max(1, int(len(chats) * SLOW_SHARE))))
+    blocked = set(rnd.sample(chats, max(1, int(len(chats) * BLOCKED_SHARE))))
+    return alerts, slow, blocked
+
+
+async def serial(bot, alerts):
+    """Прежний путь: каждое уведомление ждет отправки предыдущего, ошибки только в лог"""
+    for chat_id in alerts:
+        try:
+            await bot.send_message(chat_id=chat_id, text='alert', parse_mode='Markdown')
+        except Exception:
+            pass
+
+
+async def fanout(bot, alerts):
+    notifier = Notifier(bot, chat_interval=CHAT_INTERVAL)
+    for chat_id in alerts:
+        notifier.notify(chat_id, 'alert')
+    await notifier.close(timeout=600)
+    return notifier.get_stats()
+
+
+async def run(variant, alerts, slow, blocked):
+    server = FakeBotApi(slow, blocked)
+    server.start()
+    bot = Bot(TOKEN, base_url=f"http://127.0.0.1:{server.port}/bot",
+              request=HTTPXRequest(connection_pool_size=64, read_timeout=30))
+    async with bot:
+        started = time.monotonic()
+        extra = await variant(bot, alerts)
+        elapsed = time.monotonic() - started
+
+    delays = sorted(t - started for times in server.delivered.values() for t in times)
+    delivered = len(delays)
+    expected = sum(1 for chat_id in alerts if chat_id not in blocked)
+
+    def percentile(p):
+        return delays[min(len(delays) - 1, int(len(delays) * p / 100))] if delays else float('nan')
+
+    print(f"  {variant.__name__:<8} доставлено: {delivered}/{expected}  за {elapsed:.1f} с "
+          f"({delivered / elapsed:.1f} в сек)  p50: {percentile(50):.1f} с  p99: {percentile(99):.1f} с  "
+          f"ответов 429: {server.rejected}")
+    if extra:
+        print(f"           {extra}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else ALERTS
+    logging.basicConfig(level=logging.ERROR)
+    alerts, slow, blocked = make_alerts(count)
+    print(f"уведомлений: {count}, чатов: {len(set(alerts))}, медленных: {len(slow)}, "
+          f"заблокировали бота: {len(blocked)}")
+    # Все уведомления обнаружены в начале тика, задержка считается от него
+    for variant in (serial, fanout):
+        asyncio.run(run(variant, alerts, slow, blocked))
+
+
+if __name__ == '__main__':
+    main()
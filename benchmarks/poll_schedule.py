@@ -0,0 +1,181 @@
+"""
+Бенчмарк опроса цен: фиксированный интервал 60 с против PollScheduler
+
+Симуляция на виртуальных часах: у монет разная волатильность (стейблкоины,
+крупные, альткоины, мемкоины) и разные самые маленькие пороги подписчиков.
+Цены идут случайным блужданием по сетке 5 с. Для каждого способа опроса
+печатает число запросов к API, число уведомлений, задержку обнаружения
+(от первого пересечения порога на сетке до опроса, который его увидел) и
+пропущенные выбросы (цена пересекла порог и вернулась между опросами).
+
+Запуск: python benchmarks/poll_schedule.py [монет] [часов]
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from config import Config  # noqa: E402
+from poll_scheduler import PollScheduler  # noqa: E402
+
+COINS = 2000
+HOURS = 2
+STEP = 5  # сек, шаг сетки цен
+FIXED_INTERVAL = 60
+# (доля монет, дневная волатильность %, пороги подписчиков %)
+PROFILES = [
+    (0.10, 0.2, (5.0, 10.0)),   # стейблкоины
+    (0.30, 3.0, (1.0, 3.0)),    # крупные
+    (0.45, 6.0, (2.0, 5.0)),    # альткоины
+    (0.15, 15.0, (0.5, 2.0)),   # мемкоины
+]
+
+
+class Market:
+    """Цены всех монет на сетке и учет срабатываний одного способа опроса"""
+
+    def __init__(self, coins, hours, seed=1):
+        rnd = random.Random(seed)
+        self.steps = int(hours * 3600 / STEP)
+        self.paths, self.thresholds = {}, {}
+        for i in range(coins):
+            share = rnd.random()
+            for fraction, daily, (low, high) in PROFILES:
+                share -= fraction
+                if share < 0:
+                    break
+            sigma = daily / 100 * math.sqrt(STEP / 86400)
+            coin = f"coin-{i}"
+            price, path = 100.0, []
+            for _ in range(self.steps + 1):
+                path.append(price)
+                price *= math.exp(rnd.gauss(0, sigma))
+            self.paths[coin] = path
+            self.thresholds[coin] = rnd.choice([low, (low + high) / 2, high])
+
+    def reset(self):
+        self.anchor = {coin: path[0] for coin, path in self.paths.items()}
+        self.last_poll = {coin: 0.0 for coin in self.paths}
+        self.requests = 0
+        self.alerts = 0
+        self.missed = 0
+        self.lags = []
+
+    def poll(self, coins, now):
+        """Цены монет в момент now; проверка порога относительно последней цены уведомления"""
+        self.requests += math.ceil(len(coins) / Config.PRICE_BATCH_MAX_IDS)
+        step = min(self.steps, int(now // STEP))
+        prices = {}
+        for coin in coins:
+            path, anchor, threshold = self.paths[coin], self.anchor[coin], self.thresholds[coin]
+            price = prices[coin] = path[step]
+            crossed = None
+            for s in range(int(self.last_poll[coin] // STEP) + 1, step + 1):
+                if abs(path[s] / anchor - 1) * 100 >= threshold:
+                    crossed = s * STEP
+                    break
+            self.last_poll[coin] = now
+            if abs(price / anchor - 1) * 100 >= threshold:
+                self.alerts += 1
+                self.lags.append(now - crossed)
+                self.anchor[coin] = price
+            elif crossed is not None:
+                self.missed += 1
+        return prices
+
+
+class FakeEngine:
+    def __init__(self, market):
+        self.market = market
+
+    def coin_state(self, coin):
+        return 0, self.market.thresholds[coin]
+
+
+class FakeChecker:
+    def __init__(self, market, clock):
+        self.market = market
+        self.clock = clock
+        self.engine = FakeEngine(market)
+
+    async def check_coins(self, coins):
+        return self.market.poll(coins, self.clock.now)
+
+
+class FakeDatabase:
+    def __init__(self, coins):
+        self.coins = list(coins)
+
+    async def get_all_users_coins(self):
+        return self.coins
+
+    async def get_subscription_versions(self, coins):
+        return {coin: 0 for coin in coins}
+
+
+class NoHistory:
+    def points(self, coin, seconds=None):
+        return []
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fixed(market, duration):
+    coins = list(market.paths)
+    now = 0.0
+    while now <= duration:
+        market.poll(coins, now)
+        now += FIXED_INTERVAL
+
+
+def adaptive(market, duration):
+    clock = Clock()
+    scheduler = PollScheduler(FakeChecker(market, clock), FakeDatabase(market.paths), NoHistory(), clock)
+
+    async def run():
+        while clock.now <= duration:
+            await scheduler.poll_due()
+            clock.now = max(clock.now + 1, scheduler.next_due() or clock.now + 1)
+
+    asyncio.run(run())
+    return scheduler.get_stats()
+
+
+def report(name, market, duration, extra=None):
+    lags = sorted(market.lags)
+    p95 = lags[int(len(lags) * 0.95)] if lags else float('nan')
+    mean = sum(lags) / len(lags) if lags else float('nan')
+    print(f"  {name:<9} запросов в минуту: {market.requests / duration * 60:>5.1f}  уведомлений: {market.alerts:>5}  "
+          f"задержка: средняя {mean:>5.1f} с, p95 {p95:>5.1f} с  пропущено выбросов: {market.missed}")
+    if extra:
+        print(f"            {extra}")
+
+
+def main():
+    coins = int(sys.argv[1]) if len(sys.argv) > 1 else COINS
+    hours = float(sys.argv[2]) if len(sys.argv) > 2 else HOURS
+    logging.basicConfig(level=logging.WARNING)
+    market = Market(coins, hours)
+    duration = hours * 3600
+    print(f"монет: {coins}, часов: {hours}, пачка: {Config.PRICE_BATCH_MAX_IDS} монет")
+
+    market.reset()
+    fixed(market, duration)
+    report('60 с', market, duration)
+
+    market.reset()
+    stats = adaptive(market, duration)
+    report('адаптивно', market, duration, stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Проверка хедж-запросов и фейловера между провайдерами на локальных заглушках
+
+Запуск: python benchmarks/provider_failover.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from crypto_api import AsyncCryptoAPI  # noqa: E402
+from providers import CoinGeckoProvider, CoinCapProvider  # noqa: E402
+from rate_limiter import RequestScheduler  # noqa: E402
+from stub_server import StubPriceServer  # noqa: E402
+
+REQUESTS = 40
+
+
+def fast_scheduler():
+    return RequestScheduler(rate_per_minute=10 ** 6, burst=1000, max_retries=0)
+
+
+async def measure(api, title):
+    latencies = []
+    for i in range(REQUESTS):
+        started = time.perf_counter()
+        prices = await api._fetch_prices([f'coin-{i}'], 0)
+        latencies.append(time.perf_counter() - started)
+        assert prices, "пустой ответ"
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{title:<40} p50={latencies[len(latencies) // 2] * 1000:7.1f} мс  p99={p99 * 1000:7.1f} мс")
+
+
+async def run():
+    gecko = StubPriceServer(latency=0.02).start()
+    coincap = StubPriceServer(latency=0.03).start()
+    primary = CoinGeckoProvider(gecko.base_url, fast_scheduler())
+    secondary = CoinCapProvider(coincap.coincap_url, fast_scheduler())
+    api = AsyncCryptoAPI(providers=[primary, secondary], http2=False)
+    
+    try:
+        await measure(api, "оба провайдера в норме")
+        
+        gecko.latency = 1.0
+        await measure(api, "основной тормозит (хедж-запросы)")
+        
+        gecko.latency = 0.02
+        gecko.error_status = 500
+        await measure(api, "основной падает (фейловер)")
+        print(f"основной в ротации: {primary.is_available()}")
+        print(f"запросов: coingecko={gecko.request_count}, coincap={coincap.request_count}")
+    finally:
+        await api.close()
+        gecko.stop()
+        coincap.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
@@ -0,0 +1,67 @@
+"""
+Бенчмарк холодного старта Database: снимок users_data.json против двоичного
+снимка (с обычной и ленивой загрузкой имен пользователей)
+
+Запуск: python benchmarks/startup.py [число подписок ...]
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from config import Config  # noqa: E402
+from database import Database  # noqa: E402
+from memory_subscriptions import generate  # noqa: E402
+
+SUBSCRIPTION_COUNTS = [10_000, 100_000, 1_000_000]
+RUNS = 3
+
+
+def load_time(path, snapshot_format, lazy):
+    """Лучшее из нескольких время открытия базы до готовности к первой проверке цен"""
+    Config.DB_SNAPSHOT_FORMAT = snapshot_format
+    Config.DB_LAZY_USERS = lazy
+    best = None
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        store = Database(path)
+        store.get_all_users_coins()
+        elapsed = time.perf_counter() - started
+        store.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or SUBSCRIPTION_COUNTS
+    logging.basicConfig(level=logging.WARNING)
+    print(f"{'подписок':>10} {'json, с':>9} {'binary, с':>10} {'lazy, с':>9} "
+          f"{'json, МБ':>9} {'binary, МБ':>11}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in counts:
+            json_path = os.path.join(tmp, f"json_{count}.json")
+            binary_path = os.path.join(tmp, f"binary_{count}.json")
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(generate(count), f, indent=2, ensure_ascii=False)
+            with open(binary_path, 'w', encoding='utf-8') as f:
+                json.dump(generate(count), f)
+
+            # Первое открытие в двоичном режиме переписывает JSON в двоичный снимок
+            Config.DB_SNAPSHOT_FORMAT = 'binary'
+            Database(binary_path).close()
+            snapshot_path = os.path.splitext(binary_path)[0] + '.snap'
+
+            json_seconds = load_time(json_path, 'json', False)
+            binary_seconds = load_time(binary_path, 'binary', False)
+            lazy_seconds = load_time(binary_path, 'binary', True)
+            print(f"{count:>10} {json_seconds:>9.3f} {binary_seconds:>10.3f} {lazy_seconds:>9.3f} "
+                  f"{os.path.getsize(json_path) / 2 ** 20:>9.1f} {os.path.getsize(snapshot_path) / 2 ** 20:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
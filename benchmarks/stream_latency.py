@@ -0,0 +1,66 @@
+"""
+Бенчмарк потокового режима: задержка от отправки тика до проверки порогов
+
+Запуск: python benchmarks/stream_latency.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from config import Config  # noqa: E402
+from price_stream import PriceStream  # noqa: E402
+from ws_replay_server import ReplayServer, generate_ticks  # noqa: E402
+
+COINS = [f"coin-{i}" for i in range(50)]
+SECONDS = 5.0
+RATE = 500  # тиков в секунду
+
+
+class FakeDatabase:
+    def get_all_users_coins(self):
+        return COINS
+
+
+class RecordingChecker:
+    """Вместо рассылки уведомлений запоминает момент проверки каждого тика"""
+    
+    def __init__(self):
+        self.evaluated = []
+    
+    async def check_coin_price(self, coin_name, current_price):
+        self.evaluated.append((coin_name, current_price, time.monotonic()))
+
+
+async def run():
+    Config.PRICE_STREAM_RESUBSCRIBE_CHECK = 0.5
+    server = await ReplayServer(generate_ticks(COINS, SECONDS, RATE)).start()
+    checker = RecordingChecker()
+    stream = PriceStream(checker, url=server.url, id_map={}, database=FakeDatabase())
+    
+    task = asyncio.create_task(stream.run())
+    await asyncio.sleep(SECONDS + 1)
+    stream.stop()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await server.stop()
+    
+    latencies = sorted(
+        evaluated_at - server.sent_at[(coin, price)]
+        for coin, price, evaluated_at in checker.evaluated
+        if (coin, price) in server.sent_at
+    )
+    if not latencies:
+        print("Нет обработанных тиков")
+        return
+    
+    print(f"тиков отправлено:  {len(server.sent_at)}")
+    print(f"тиков проверено:   {len(latencies)} (остальные объединены с более свежими)")
+    print(f"задержка p50:      {latencies[len(latencies) // 2] * 1000:.2f} мс")
+    print(f"задержка p99:      {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} мс")
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
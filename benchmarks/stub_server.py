@@ -0,0 +1,83 @@
+"""Локальные HTTP серверы-заглушки провайдеров цен (CoinGecko и CoinCap)"""
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+
+class StubPriceHandler(BaseHTTPRequestHandler):
+    """Отвечает фиксированными ценами с искусственной задержкой"""
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+    
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        server = self.server
+        server.request_count += 1
+        
+        if server.latency:
+            time.sleep(server.latency)
+        
+        if server.error_status:
+            self._reply(server.error_status, {'error': 'stub error'})
+            return
+        
+        ids = [coin_id for coin_id in params.get('ids', [''])[0].split(',') if coin_id]
+        if url.path.endswith('/simple/price'):
+            body = {coin_id: {'usd': server.price_for(coin_id)} for coin_id in ids}
+            self._reply(200, body)
+        elif url.path.endswith('/assets'):
+            body = {'data': [{'id': coin_id, 'priceUsd': str(server.price_for(coin_id))} for coin_id in ids]}
+            self._reply(200, body)
+        else:
+            self._reply(404, {'error': 'not found'})
+    
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class StubPriceServer(ThreadingHTTPServer):
+    """Сервер-заглушка цен, работающий в фоновом потоке"""
+    daemon_threads = True
+    
+    def __init__(self, latency: float = 0.0, handler=StubPriceHandler):
+        super().__init__(('127.0.0.1', 0), handler)
+        self.latency = latency
+        self.error_status = None  # например 500 или 429 для имитации сбоя
+        self.request_count = 0
+        self._thread = None
+    
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api/v3"
+    
+    @property
+    def coincap_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v2"
+    
+    def handle_error(self, request, client_address):
+        # Клиент закрыл соединение (например, отмененный хедж-запрос) - это нормально
+        pass
+    
+    def price_for(self, coin_id: str) -> float:
+        # Детерминированная "цена" для каждой монеты
+        return float(sum(coin_id.encode()) % 1000) + 1.0
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,114 @@
+"""
+Бенчмарк проверки порогов за тик: построчный цикл по подписчикам (как раньше
+в PriceChecker) против ThresholdEngine: полный проход по колонкам (с NumPy
+и без него) и индекс границ срабатывания
+
+Запуск: python benchmarks/threshold_tick.py [число подписок]
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import AsyncDatabase, Database  # noqa: E402
+from threshold_engine import NUMPY_AVAILABLE, ThresholdEngine  # noqa: E402
+
+SUBSCRIPTIONS = 1_000_000
+COINS_PER_USER = 5
+COIN_UNIVERSE = 2000
+TICK_MOVE = 0.01  # цена монеты за тик меняется в пределах ±1%
+
+
+def generate(subscriptions, base_prices):
+    """Пользователи с последними ценами около текущей цены монеты"""
+    rnd = random.Random(subscriptions)
+    coins = list(base_prices)
+    users = {}
+    for user_id in range(subscriptions // COINS_PER_USER):
+        user_coins = rnd.sample(coins, COINS_PER_USER)
+        users[str(10 ** 8 + user_id)] = {
+            'username': f"user{user_id}",
+            'coins': user_coins,
+            'threshold': rnd.choice([1.0, 2.0, 5.0]),
+            'coin_thresholds': {c: 0.5 for c in user_coins[:1]},
+            'last_prices': {c: base_prices[c] * rnd.uniform(0.99, 1.01) for c in user_coins}
+        }
+    return {'users': users}
+
+
+def legacy_tick(store, prices):
+    """Прежний путь: словари подписчиков и проверка каждого по очереди"""
+    fired = 0
+    for coin_name, current_price in prices.items():
+        for user_info in store.get_users_for_coin(coin_name):
+            last_price = user_info['last_price']
+            if last_price is None:
+                continue
+            if abs((current_price - last_price) / last_price * 100) >= user_info['threshold']:
+                fired += 1
+    return fired
+
+
+async def engine_tick(engine, prices):
+    return len((await engine.evaluate(prices)).alerts)
+
+
+async def engine_save(engine, prices):
+    """Перенос последних цен сработавших подписок (как после отправки уведомлений)"""
+    result = await engine.evaluate(prices)
+    started = time.perf_counter()
+    await engine.save(result.anchors + [(a.user_id, a.coin, a.new_price) for a in result.alerts])
+    return time.perf_counter() - started
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    subscriptions = int(sys.argv[1]) if len(sys.argv) > 1 else SUBSCRIPTIONS
+    logging.basicConfig(level=logging.WARNING)
+    rnd = random.Random(0)
+    base_prices = {f"coin-{i}": rnd.uniform(0.01, 70000) for i in range(COIN_UNIVERSE)}
+    prices = {coin: price * rnd.uniform(1 - TICK_MOVE, 1 + TICK_MOVE) for coin, price in base_prices.items()}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'users.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(generate(subscriptions, base_prices), f)
+        store = Database(path)
+        adb = AsyncDatabase(store)
+
+        print(f"подписок: {subscriptions}, монет в тике: {len(prices)}, NumPy: {NUMPY_AVAILABLE}")
+        fired, seconds = timed(legacy_tick, store, prices)
+        print(f"  построчно:            {seconds * 1000:>8.1f} мс  сработало: {fired}")
+
+        variants = [('columns', 'columns', False), ('bands', 'bands', None)]
+        if NUMPY_AVAILABLE:
+            variants.insert(1, ('numpy', 'columns', True))
+        for name, index, use_numpy in variants:
+            engine = ThresholdEngine(adb, index=index, use_numpy=use_numpy)
+            fired, cold = timed(asyncio.run, engine_tick(engine, prices))
+            fired, warm = timed(asyncio.run, engine_tick(engine, prices))
+            print(f"  движок ({name:<7}):     {warm * 1000:>8.1f} мс  сработало: {fired}"
+                  f"  (первый тик с построением индекса: {cold * 1000:.0f} мс)")
+
+        # Сохранение меняет базу, поэтому замеряется последним
+        save_seconds = asyncio.run(engine_save(engine, prices))
+        print(f"  перенос границ сработавших подписок (bands): {save_seconds * 1000:.1f} мс")
+        fired, warm = timed(asyncio.run, engine_tick(engine, prices))
+        print(f"  повторный тик по тем же ценам (bands): {warm * 1000:.1f} мс  сработало: {fired}")
+
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
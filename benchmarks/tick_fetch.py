@@ -0,0 +1,43 @@
+"""
+Бенчмарк: время получения цен за один тик в зависимости от числа монет
+
+Запуск: python benchmarks/tick_fetch.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from crypto_api import AsyncCryptoAPI  # noqa: E402
+from providers import CoinGeckoProvider  # noqa: E402
+from rate_limiter import RequestScheduler  # noqa: E402
+from stub_server import StubPriceServer  # noqa: E402
+
+COIN_COUNTS = [10, 100, 1000, 10000]
+LATENCY = 0.05  # имитация задержки API, сек
+
+
+async def run():
+    server = StubPriceServer(latency=LATENCY).start()
+    # Меряем сам сбор цен, а не лимит бесплатного тарифа
+    provider = CoinGeckoProvider(server.base_url, RequestScheduler(rate_per_minute=10 ** 6, burst=1000))
+    api = AsyncCryptoAPI(providers=[provider], http2=False)
+    
+    print(f"{'монет':>8} {'пачек':>6} {'время, с':>10} {'получено':>9}")
+    try:
+        for count in COIN_COUNTS:
+            coin_ids = [f"coin-{i}" for i in range(count)]
+            started = time.perf_counter()
+            result = await api.get_multiple_prices_detailed(coin_ids)
+            elapsed = time.perf_counter() - started
+            chunks = len(api._split_ids(coin_ids))
+            print(f"{count:>8} {chunks:>6} {elapsed:>10.3f} {len(result.prices):>9}")
+    finally:
+        await api.close()
+        server.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
@@ -0,0 +1,96 @@
+"""
+Локальный WebSocket сервер, воспроизводящий записанные тики в формате ws.coincap.io/prices
+
+Запись - файл JSON Lines: {"t": смещение в секундах, "prices": {"bitcoin": "64000.1", ...}}
+Запуск: python benchmarks/ws_replay_server.py ticks.jsonl [--port 8765] [--speed 1.0]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit, parse_qs
+
+import websockets
+
+
+def load_ticks(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def generate_ticks(coins, seconds=10.0, rate=20, volatility=0.002, seed=1):
+    """Синтетическая запись: случайное блуждание цен с частотой rate тиков/сек"""
+    rng = random.Random(seed)
+    prices = {coin: 100.0 + i for i, coin in enumerate(coins)}
+    ticks = []
+    for step in range(int(seconds * rate)):
+        coin = rng.choice(coins)
+        prices[coin] *= 1 + rng.gauss(0, volatility)
+        ticks.append({'t': step / rate, 'prices': {coin: f"{prices[coin]:.6f}"}})
+    return ticks
+
+
+class ReplayServer:
+    """Отдает каждому подписчику тики по его списку assets с исходными интервалами"""
+    
+    def __init__(self, ticks, speed=1.0, port=0):
+        self.ticks = ticks
+        self.speed = speed
+        self.port = port
+        self.connections = 0
+        self.sent_at = {}  # (coin, цена) -> время отправки, для замера задержки
+        self._server = None
+    
+    async def _handler(self, ws, path=None):
+        path = path or ws.request.path
+        assets = set(parse_qs(urlsplit(path).query).get('assets', [''])[0].split(','))
+        self.connections += 1
+        started = time.monotonic()
+        
+        try:
+            for tick in self.ticks:
+                prices = {coin: price for coin, price in tick['prices'].items() if coin in assets}
+                if not prices:
+                    continue
+                delay = tick['t'] / self.speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                now = time.monotonic()
+                for coin, price in prices.items():
+                    self.sent_at[(coin, float(price))] = now
+                await ws.send(json.dumps(prices))
+            
+            # Запись закончилась - держим соединение, как настоящий поток без сделок
+            await ws.wait_closed()
+        except websockets.ConnectionClosed:
+            pass
+    
+    async def start(self):
+        self._server = await websockets.serve(self._handler, '127.0.0.1', self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+    
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self.port}/prices"
+    
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ticks')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--speed', type=float, default=1.0)
+    args = parser.parse_args()
+    
+    server = await ReplayServer(load_ticks(args.ticks), args.speed, args.port).start()
+    print(f"Воспроизведение тиков на {server.url}")
+    await asyncio.Future()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+import sys
+import struct
+from array import array
+from typing import List, Tuple
+
+# Двоичный снимок базы пользователей: заголовок и колонки фиксированной ширины.
+# Колонки читаются через array.frombytes (копирование памяти, без разбора текста).
+#
+#   заголовок   магия, версия, номер записи журнала, число монет/пользователей/подписок
+#   монеты      размер, смещения (Q, монет + 1) и названия в UTF-8
+#   пользователи id (q, по возрастанию), общий порог (d), число подписок (I)
+#   подписки    монета (I), отслеживается (B), порог (d), последняя цена (d); NaN - нет значения
+#   имена       размер, смещения (Q, пользователей + 1) и имена: b'' - None, иначе b'\x01' + UTF-8
+MAGIC = b'CTDB'
+VERSION = 1
+HEADER = struct.Struct('<4sHxxQIII')
+MISSING = float('nan')
+
+class NameTable:
+    """Имена пользователей снимка; строка создается только при обращении"""
+
+    __slots__ = ('_offsets', '_blob')
+
+    def __init__(self, offsets: array, blob: bytes):
+        self._offsets = offsets
+        self._blob = blob
+
+    def raw(self, index: int) -> bytes:
+        """Закодированное имя без преобразования в строку"""
+        return self._blob[self._offsets[index]:self._offsets[index + 1]]
+
+    def get(self, index: int):
+        entry = self.raw(index)
+        return entry[1:].decode('utf-8') if entry else None
+
+def encode_name(username) -> bytes:
+    return b'' if username is None else b'\x01' + username.encode('utf-8')
+
+class SnapshotColumns:
+    """Данные снимка по колонкам"""
+
+    __slots__ = ('coins', 'user_ids', 'thresholds', 'sub_counts',
+                 'sub_coins', 'sub_tracked', 'sub_thresholds', 'sub_prices', 'names')
+
+    def __init__(self):
+        self.coins: List[str] = []
+        self.user_ids = array('q')
+        self.thresholds = array('d')
+        self.sub_counts = array('I')
+        self.sub_coins = array('I')
+        self.sub_tracked = array('B')
+        self.sub_thresholds = array('d')
+        self.sub_prices = array('d')
+        self.names = []  # при записи - закодированные имена, при чтении - NameTable
+
+def _to_bytes(column: array) -> bytes:
+    if sys.byteorder != 'little':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+def _blob_with_offsets(items: List[bytes]) -> Tuple[bytes, bytes]:
+    offsets = array('Q', [0])
+    for item in items:
+        offsets.append(offsets[-1] + len(item))
+    return _to_bytes(offsets), b''.join(items)
+
+def encode(columns: SnapshotColumns, seq: int) -> bytes:
+    """Снимок в двоичном виде"""
+    coin_offsets, coin_blob = _blob_with_offsets([name.encode('utf-8') for name in columns.coins])
+    name_offsets, name_blob = _blob_with_offsets(columns.names)
+    parts = [
+        HEADER.pack(MAGIC, VERSION, seq, len(columns.coins), len(columns.user_ids), len(columns.sub_coins)),
+        struct.pack('<Q', len(coin_blob)), coin_offsets, coin_blob,
+        _to_bytes(columns.user_ids), _to_bytes(columns.thresholds), _to_bytes(columns.sub_counts),
+        _to_bytes(columns.sub_coins), _to_bytes(columns.sub_tracked),
+        _to_bytes(columns.sub_thresholds), _to_bytes(columns.sub_prices),
+        struct.pack('<Q', len(name_blob)), name_offsets, name_blob
+    ]
+    return b''.join(parts)
+
+class _Reader:
+    def __init__(self, buffer: bytes):
+        self.view = memoryview(buffer)
+        self.position = 0
+
+    def take(self, size: int) -> memoryview:
+        if self.position + size > len(self.view):
+            raise ValueError("снимок обрезан")
+        chunk = self.view[self.position:self.position + size]
+        self.position += size
+        return chunk
+
+    def column(self, typecode: str, count: int) -> array:
+        column = array(typecode)
+        column.frombytes(self.take(count * column.itemsize))
+        if sys.byteorder != 'little':
+            column.byteswap()
+        return column
+
+    def blob(self, count: int) -> Tuple[array, memoryview]:
+        (size,) = struct.unpack('<Q', self.take(8))
+        offsets = self.column('Q', count + 1)
+        return offsets, self.take(size)
+
+def decode(buffer: bytes) -> Tuple[SnapshotColumns, int]:
+    """
+    Разбирает двоичный снимок
+
+    Returns:
+        (колонки, номер последней записи журнала в снимке)
+
+    Raises:
+        ValueError: если файл не является снимком или поврежден
+    """
+    if len(buffer) < HEADER.size:
+        raise ValueError("снимок обрезан")
+    magic, version, seq, coin_count, user_count, sub_count = HEADER.unpack_from(buffer)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("неизвестный формат снимка")
+
+    reader = _Reader(buffer)
+    reader.take(HEADER.size)
+    columns = SnapshotColumns()
+
+    coin_offsets, coin_blob = reader.blob(coin_count)
+    columns.coins = [
+        bytes(coin_blob[coin_offsets[i]:coin_offsets[i + 1]]).decode('utf-8') for i in range(coin_count)
+    ]
+    columns.user_ids = reader.column('q', user_count)
+    columns.thresholds = reader.column('d', user_count)
+    columns.sub_counts = reader.column('I', user_count)
+    columns.sub_coins = reader.column('I', sub_count)
+    columns.sub_tracked = reader.column('B', sub_count)
+    columns.sub_thresholds = reader.column('d', sub_count)
+    columns.sub_prices = reader.column('d', sub_count)
+    name_offsets, name_blob = reader.blob(user_count)
+    # Копируем только имена, чтобы не держать в памяти весь файл
+    columns.names = NameTable(name_offsets, bytes(name_blob))
+
+    if sum(columns.sub_counts) != sub_count:
+        raise ValueError("число подписок не сходится")
+    return columns, seq
@@ -3,8 +3,13 @@ from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext, CallbackQueryHandler
 from config import Config
-from database import db
-from crypto_api import crypto_api
+from database import db, async_db
+from crypto_api import async_crypto_api
+from digest import format_change
+from price_checker import PriceChecker
+from price_history import price_history
+from rate_limiter import PRIORITY_INTERACTIVE
+from sharding import SnapshotPublisher, WorkerPool
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -130,12 +135,22 @@ def get_back_menu():
     """Простое меню назад"""
     return InlineKeyboardMarkup([[InlineKeyboardButton("🔙 В меню", callback_data='back_to_main')]])
 
+def format_price_age(quote):
+    """Подпись о возрасте цены, если она взята из кэша (например, при сбое API)"""
+    if not quote.stale:
+        return ""
+    
+    as_of = datetime.fromtimestamp(quote.as_of).strftime('%H:%M:%S')
+    minutes = int(quote.age // 60)
+    age_text = f"{minutes} мин назад" if minutes else f"{int(quote.age)} сек назад"
+    return f"⏱ _Цена на {as_of} ({age_text})_\n"
+
 # ========== ОБРАБОТЧИКИ КОМАНД ==========
 
 async def start(update: Update, context: CallbackContext) -> None:
     """Обработчик команды /start с кнопочным меню"""
     user = update.effective_user
-    db.add_user(user.id, user.username or user.first_name)
+    await async_db.add_user(user.id, user.username or user.first_name)
     
     await update.message.reply_text(
         f"👋 Привет, {user.first_name}!\n"
@@ -371,7 +386,7 @@ async def show_add_coin_menu(query):
 
 async def show_my_coins(query, user_id):
     """Показать мои монеты"""
-    coins = db.get_user_coins(user_id)
+    coins = await async_db.get_user_coins(user_id)
     
     if not coins:
         await query.edit_message_text(
@@ -403,8 +418,9 @@ async def show_thresholds_menu(query):
 
 async def process_add_coin(query, user_id, coin_name):
     """Обработать добавление монеты"""
-    # Проверяем существует ли монета
-    if not crypto_api.check_coin_exists(coin_name):
+    # Проверяем существует ли монета (по локальному каталогу)
+    coin_id = await async_crypto_api.resolve_coin_id(coin_name)
+    if not coin_id:
         await query.edit_message_text(
             f"❌ *Монета не найдена*\n\n"
             f"'{coin_name}' не найдена в базе данных.\n"
@@ -417,24 +433,23 @@ async def process_add_coin(query, user_id, coin_name):
             parse_mode='Markdown'
         )
         return
+    coin_name = coin_id
     
     # Добавляем монету
-    if db.add_coin(user_id, coin_name):
+    if await async_db.add_coin(user_id, coin_name):
         # Получаем цену
-        price = crypto_api.get_price(coin_name)
+        price = await async_crypto_api.get_price(coin_name)
         
         if price:
             # Сохраняем начальную цену
-            user_id_str = str(user_id)
-            db.data[user_id_str]['last_prices'][coin_name] = price
-            db._save_data()
+            await async_db.update_price(user_id, coin_name, price)
             
             price_text = f"\n💰 *Текущая цена:* ${price:,.4f}"
         else:
             price_text = ""
         
         # Показываем текущий порог
-        current_threshold = db.get_coin_threshold(user_id, coin_name)
+        current_threshold = await async_db.get_coin_threshold(user_id, coin_name)
         
         await query.edit_message_text(
             f"✅ *{coin_name.upper()} добавлена!*{price_text}\n"
@@ -463,14 +478,13 @@ async def process_add_coin(query, user_id, coin_name):
 async def show_coin_details(query, user_id, coin_name):
     """Показать детали монеты"""
     # Получаем текущую цену
-    price = crypto_api.get_price(coin_name)
-    threshold = db.get_coin_threshold(user_id, coin_name)
+    quote = await async_crypto_api.get_price_quote(coin_name)
+    threshold = await async_db.get_coin_threshold(user_id, coin_name)
     
     # Определяем тип порога
-    user_id_str = str(user_id)
-    threshold_type = "🔸 индивидуальный" if coin_name in db.data[user_id_str].get('coin_thresholds', {}) else "📊 общий"
+    threshold_type = "🔸 индивидуальный" if await async_db.has_individual_threshold(user_id, coin_name) else "📊 общий"
     
-    price_text = f"💰 *Цена:* ${price:,.4f}\n" if price else ""
+    price_text = f"💰 *Цена:* ${quote.price:,.4f}\n{format_price_age(quote)}" if quote else ""
     
     await query.edit_message_text(
         f"📊 *{coin_name.upper()}*\n\n"
@@ -489,20 +503,7 @@ async def show_coin_details(query, user_id, coin_name):
 
 async def check_price_changes(query, user_id):
     """Проверить изменения цен"""
-    user_id_str = str(user_id)
-    if user_id_str not in db.data:
-        await query.edit_message_text(
-            "📭 *У вас нет монет*\n\n"
-            "Сначала добавьте монеты:",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("➕ Добавить монету", callback_data='add_coin')],
-                [InlineKeyboardButton("🔙 В меню", callback_data='back_to_main')]
-            ]),
-            parse_mode='Markdown'
-        )
-        return
-    
-    coins = db.data[user_id_str].get('coins', [])
+    coins = await async_db.get_user_coins(user_id)
     
     if not coins:
         await query.edit_message_text(
@@ -526,31 +527,35 @@ async def check_price_changes(query, user_id):
     changes_text = ""
     changes_count = 0
     
+    # Все цены - одним запросом, данные пользователя - одним обращением к базе
+    current_prices = await async_crypto_api.get_multiple_prices(coins, priority=PRIORITY_INTERACTIVE)
+    user_data = await async_db.get_user(user_id) or {}
+    last_prices = user_data.get('last_prices', {})
+    coin_thresholds = user_data.get('coin_thresholds', {})
+    updates = []
+    
     for coin_name in coins:
-        current_price = crypto_api.get_price(coin_name)
+        current_price = current_prices.get(coin_name)
         if not current_price:
             continue
         
-        last_price = db.data[user_id_str].get('last_prices', {}).get(coin_name)
+        last_price = last_prices.get(coin_name)
         
         if last_price is not None:
             # Получаем порог
-            threshold = db.get_coin_threshold(user_id, coin_name)
+            threshold = coin_thresholds.get(coin_name, user_data.get('threshold', 1.0))
             
             price_change = abs((current_price - last_price) / last_price * 100)
             
             if price_change >= threshold:
                 changes_found = True
                 changes_count += 1
-                direction = "📈" if current_price > last_price else "📉"
-                dir_text = "РОСТ" if current_price > last_price else "ПАДЕНИЕ"
-                changes_text += f"\n{direction} *{coin_name.upper()}* - {dir_text}\n"
-                changes_text += f"   Изменение: *{price_change:.2f}%*\n"
-                changes_text += f"   Было: ${last_price:.4f}\n"
-                changes_text += f"   Стало: ${current_price:.4f}\n"
+                changes_text += format_change(coin_name, last_price, current_price, price_change)
         
         # Обновляем цену
-        db.update_price(user_id, coin_name, current_price)
+        updates.append((user_id, coin_name, current_price))
+    
+    await async_db.update_prices(updates)
     
     # Создаем клавиатуру для возврата
     keyboard = [
@@ -593,7 +598,7 @@ async def help_button(query):
 
 async def show_general_threshold_menu(query, user_id):
     """Показать меню общего порога"""
-    user_data = db.get_user(user_id)
+    user_data = await async_db.get_user(user_id)
     current_threshold = user_data['threshold'] if user_data else 1.0
     
     await query.edit_message_text(
@@ -607,7 +612,7 @@ async def show_general_threshold_menu(query, user_id):
 
 async def set_general_threshold(query, user_id, threshold):
     """Установить общий порог"""
-    if db.set_threshold(user_id, threshold):
+    if await async_db.set_threshold(user_id, threshold):
         await query.edit_message_text(
             f"✅ *Общий порог установлен!*\n\n"
             f"Теперь вы будете получать уведомления при изменении цены на *{threshold}%* или более.\n\n"
@@ -627,7 +632,7 @@ async def set_general_threshold(query, user_id, threshold):
 
 async def show_coin_threshold_selection(query, user_id):
     """Показать выбор монеты для установки порога"""
-    coins = db.get_user_coins(user_id)
+    coins = await async_db.get_user_coins(user_id)
     
     if not coins:
         await query.edit_message_text(
@@ -663,7 +668,7 @@ async def show_coin_threshold_selection(query, user_id):
 
 async def show_coin_threshold_menu(query, user_id, coin_name):
     """Показать меню порога для конкретной монеты"""
-    current_threshold = db.get_coin_threshold(user_id, coin_name)
+    current_threshold = await async_db.get_coin_threshold(user_id, coin_name)
     
     await query.edit_message_text(
         f"⚙️ *Индивидуальный порог для {coin_name.upper()}*\n\n"
@@ -676,7 +681,7 @@ async def show_coin_threshold_menu(query, user_id, coin_name):
 
 async def set_coin_threshold(query, user_id, coin_name, threshold):
     """Установить порог для конкретной монеты"""
-    if db.set_coin_threshold(user_id, coin_name, threshold):
+    if await async_db.set_coin_threshold(user_id, coin_name, threshold):
         await query.edit_message_text(
             f"✅ *Порог установлен!*\n\n"
             f"Для *{coin_name.upper()}* порог: *{threshold}%*\n\n"
@@ -699,23 +704,17 @@ async def set_coin_threshold(query, user_id, coin_name, threshold):
 
 async def remove_individual_threshold(query, user_id, coin_name):
     """Удалить индивидуальный порог"""
-    user_id_str = str(user_id)
-    if user_id_str in db.data:
-        coin_thresholds = db.data[user_id_str].get('coin_thresholds', {})
-        if coin_name in coin_thresholds:
-            del coin_thresholds[coin_name]
-            db._save_data()
-            
-            await query.edit_message_text(
-                f"✅ *Индивидуальный порог удалён*\n\n"
-                f"Для *{coin_name.upper()}* теперь будет применяться общий порог.",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🔙 К монете", callback_data=f'coin_{coin_name}')],
-                    [InlineKeyboardButton("🔙 В меню", callback_data='back_to_main')]
-                ]),
-                parse_mode='Markdown'
-            )
-            return
+    if await async_db.remove_individual_threshold(user_id, coin_name):
+        await query.edit_message_text(
+            f"✅ *Индивидуальный порог удалён*\n\n"
+            f"Для *{coin_name.upper()}* теперь будет применяться общий порог.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔙 К монете", callback_data=f'coin_{coin_name}')],
+                [InlineKeyboardButton("🔙 В меню", callback_data='back_to_main')]
+            ]),
+            parse_mode='Markdown'
+        )
+        return
     
     await query.edit_message_text(
         "❌ Индивидуальный порог не найден",
@@ -727,8 +726,8 @@ async def remove_individual_threshold(query, user_id, coin_name):
 
 async def show_user_thresholds(query, user_id):
     """Показать пороги пользователя"""
-    coins = db.get_user_coins(user_id)
-    user_data = db.get_user(user_id)
+    coins = await async_db.get_user_coins(user_id)
+    user_data = await async_db.get_user(user_id)
     general_threshold = user_data['threshold'] if user_data else 1.0
     
     if not coins:
@@ -747,7 +746,7 @@ async def show_user_thresholds(query, user_id):
     thresholds_text += "*Пороги по монетам:*\n"
     
     for coin in coins:
-        threshold = db.get_coin_threshold(user_id, coin)
+        threshold = await async_db.get_coin_threshold(user_id, coin)
         threshold_type = "🔸 инд." if coin in user_data.get('coin_thresholds', {}) else "📊 общ."
         thresholds_text += f"• *{coin}*: {threshold}% ({threshold_type})\n"
     
@@ -782,22 +781,9 @@ async def confirm_delete_coin(query, user_id, coin_name):
 
 async def delete_coin_from_button(query, user_id, coin_name):
     """Удалить монету после подтверждения"""
-    user_id_str = str(user_id)
-    if user_id_str in db.data and coin_name in db.data[user_id_str]['coins']:
-        # Удаляем монету
-        db.data[user_id_str]['coins'].remove(coin_name)
-        
-        # Удаляем индивидуальный порог если есть
-        if coin_name in db.data[user_id_str].get('coin_thresholds', {}):
-            del db.data[user_id_str]['coin_thresholds'][coin_name]
-        
-        # Удаляем последнюю цену если есть
-        if coin_name in db.data[user_id_str].get('last_prices', {}):
-            del db.data[user_id_str]['last_prices'][coin_name]
-        
-        db._save_data()
-        
-        remaining = len(db.data[user_id_str]['coins'])
+    # Удаляем монету вместе с индивидуальным порогом и последней ценой
+    if await async_db.remove_coin(user_id, coin_name):
+        remaining = len(await async_db.get_user_coins(user_id))
         
         await query.edit_message_text(
             f"✅ *{coin_name.upper()} удалена!*\n\n"
@@ -823,22 +809,25 @@ async def delete_coin_from_button(query, user_id, coin_name):
 async def check_single_price_from_button(query, user_id, coin_name):
     """Проверить цену одной монеты из кнопки"""
     # Проверяем существует ли монета
-    if not crypto_api.check_coin_exists(coin_name):
+    coin_id = await async_crypto_api.resolve_coin_id(coin_name)
+    if not coin_id:
         await query.edit_message_text(
             f"❌ Монета '{coin_name}' не найдена\n"
             f"Проверьте правильность написания.",
             reply_markup=get_back_menu()
         )
         return
+    coin_name = coin_id
     
     # Получаем цену
-    price = crypto_api.get_price(coin_name)
+    quote = await async_crypto_api.get_price_quote(coin_name)
     
-    if price:
+    if quote:
         await query.edit_message_text(
             f"💰 *{coin_name.upper()}*\n"
-            f"📈 Цена: *${price:,.4f}*\n\n"
-            f"🕐 {datetime.now().strftime('%H:%M:%S')}",
+            f"📈 Цена: *${quote.price:,.4f}*\n"
+            f"{format_price_age(quote)}\n"
+            f"🕐 {datetime.fromtimestamp(quote.as_of).strftime('%H:%M:%S')}",
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("➕ Добавить в отслеживание", callback_data=f'add_{coin_name}')],
                 [InlineKeyboardButton("💰 Узнать другую цену", callback_data='check_price')],
@@ -865,7 +854,7 @@ async def handle_message(update: Update, context: CallbackContext) -> None:
         return
     
     # Добавляем пользователя если его нет
-    db.add_user(user.id, user.username or user.first_name)
+    await async_db.add_user(user.id, user.username or user.first_name)
     
     # Проверяем состояние пользователя
     user_state = context.chat_data.get('user_states', {}).get(user.id)
@@ -877,7 +866,7 @@ async def handle_message(update: Update, context: CallbackContext) -> None:
             try:
                 threshold = float(message_text)
                 if 0.1 <= threshold <= 50:
-                    if db.set_coin_threshold(user.id, coin_name, threshold):
+                    if await async_db.set_coin_threshold(user.id, coin_name, threshold):
                         await update.message.reply_text(
                             f"✅ Для *{coin_name.upper()}* порог установлен: {threshold}%",
                             reply_markup=get_main_menu(),
@@ -915,7 +904,7 @@ async def handle_message(update: Update, context: CallbackContext) -> None:
         try:
             threshold = float(message_text)
             if 0.1 <= threshold <= 50:
-                if db.set_threshold(user.id, threshold):
+                if await async_db.set_threshold(user.id, threshold):
                     await update.message.reply_text(
                         f"✅ Общий порог установлен: {threshold}%",
                         reply_markup=get_main_menu()
@@ -948,7 +937,7 @@ async def handle_message(update: Update, context: CallbackContext) -> None:
             # Проверяем, является ли это числом (порог уведомлений)
             threshold = float(message_text)
             if 0.1 <= threshold <= 50:
-                db.set_threshold(user.id, threshold)
+                await async_db.set_threshold(user.id, threshold)
                 await update.message.reply_text(
                     f"✅ Общий порог установлен: {threshold}%",
                     reply_markup=get_main_menu()
@@ -959,16 +948,17 @@ async def handle_message(update: Update, context: CallbackContext) -> None:
                     reply_markup=get_main_menu()
                 )
         except ValueError:
-            # Проверяем, является ли это названием монеты
-            if crypto_api.check_coin_exists(message_text):
+            # Проверяем, является ли это названием или символом монеты
+            coin_id = await async_crypto_api.resolve_coin_id(message_text)
+            if coin_id:
                 # Предлагаем добавить монету
                 keyboard = [
-                    [InlineKeyboardButton(f"➕ Добавить {message_text}", callback_data=f'add_{message_text}')],
-                    [InlineKeyboardButton("💰 Узнать цену", callback_data=f'price_{message_text}')],
+                    [InlineKeyboardButton(f"➕ Добавить {coin_id}", callback_data=f'add_{coin_id}')],
+                    [InlineKeyboardButton("💰 Узнать цену", callback_data=f'price_{coin_id}')],
                     [InlineKeyboardButton("🔙 В меню", callback_data='back_to_main')]
                 ]
                 await update.message.reply_text(
-                    f"Найдена монета: *{message_text.upper()}*\n\nЧто вы хотите сделать?",
+                    f"Найдена монета: *{coin_id.upper()}*\n\nЧто вы хотите сделать?",
                     reply_markup=InlineKeyboardMarkup(keyboard),
                     parse_mode='Markdown'
                 )
@@ -987,7 +977,8 @@ async def handle_message(update: Update, context: CallbackContext) -> None:
 async def add_custom_coin(update, user_id, coin_name):
     """Добавить пользовательскую монету"""
     # Проверяем существует ли монета
-    if not crypto_api.check_coin_exists(coin_name):
+    coin_id = await async_crypto_api.resolve_coin_id(coin_name)
+    if not coin_id:
         await update.message.reply_text(
             f"❌ Монета '{coin_name}' не найдена\n"
             f"Проверьте правильность написания.\n\n"
@@ -995,17 +986,16 @@ async def add_custom_coin(update, user_id, coin_name):
             reply_markup=get_main_menu()
         )
         return
+    coin_name = coin_id
     
     # Добавляем монету
-    if db.add_coin(user_id, coin_name):
+    if await async_db.add_coin(user_id, coin_name):
         # Получаем цену
-        price = crypto_api.get_price(coin_name)
+        price = await async_crypto_api.get_price(coin_name)
         
         if price:
             # Сохраняем начальную цену
-            user_id_str = str(user_id)
-            db.data[user_id_str]['last_prices'][coin_name] = price
-            db._save_data()
+            await async_db.update_price(user_id, coin_name, price)
             
             price_text = f"\n💰 Текущая цена: ${price:,.4f}"
         else:
@@ -1027,7 +1017,8 @@ async def add_custom_coin(update, user_id, coin_name):
 async def check_single_price(update, coin_name):
     """Проверить цену одной монеты"""
     # Проверяем существует ли монета
-    if not crypto_api.check_coin_exists(coin_name):
+    coin_id = await async_crypto_api.resolve_coin_id(coin_name)
+    if not coin_id:
         await update.message.reply_text(
             f"❌ Монета '{coin_name}' не найдена\n"
             f"Проверьте правильность написания.\n\n"
@@ -1035,15 +1026,17 @@ async def check_single_price(update, coin_name):
             reply_markup=get_main_menu()
         )
         return
+    coin_name = coin_id
     
     # Получаем цену
-    price = crypto_api.get_price(coin_name)
+    quote = await async_crypto_api.get_price_quote(coin_name)
     
-    if price:
+    if quote:
         await update.message.reply_text(
             f"💰 *{coin_name.upper()}*\n"
-            f"📈 Цена: *${price:,.4f}*\n\n"
-            f"🕐 {datetime.now().strftime('%H:%M:%S')}",
+            f"📈 Цена: *${quote.price:,.4f}*\n"
+            f"{format_price_age(quote)}\n"
+            f"🕐 {datetime.fromtimestamp(quote.as_of).strftime('%H:%M:%S')}",
             reply_markup=get_main_menu(),
             parse_mode='Markdown'
         )
@@ -1057,22 +1050,9 @@ async def check_single_price(update, coin_name):
 
 async def delete_coin(update, user_id, coin_name):
     """Удалить монету"""
-    user_id_str = str(user_id)
-    if user_id_str in db.data and coin_name in db.data[user_id_str]['coins']:
-        # Удаляем монету
-        db.data[user_id_str]['coins'].remove(coin_name)
-        
-        # Удаляем индивидуальный порог если есть
-        if coin_name in db.data[user_id_str].get('coin_thresholds', {}):
-            del db.data[user_id_str]['coin_thresholds'][coin_name]
-        
-        # Удаляем последнюю цену если есть
-        if coin_name in db.data[user_id_str].get('last_prices', {}):
-            del db.data[user_id_str]['last_prices'][coin_name]
-        
-        db._save_data()
-        
-        remaining = len(db.data[user_id_str]['coins'])
+    # Удаляем монету вместе с индивидуальным порогом и последней ценой
+    if await async_db.remove_coin(user_id, coin_name):
+        remaining = len(await async_db.get_user_coins(user_id))
         
         await update.message.reply_text(
             f"✅ *{coin_name.upper()} удалена!*\n\n"
@@ -1090,26 +1070,67 @@ async def delete_coin(update, user_id, coin_name):
 
 # ========== ЗАПУСК БОТА ==========
 
+async def on_startup(application: Application) -> None:
+    """После инициализации бота: проверка цен запускается в том же цикле событий"""
+    if Config.SHARD_WORKERS > 0 and Config.DB_BACKEND == 'sqlite':
+        # Цены получает процесс бота, пороги проверяют воркеры, каждый - монеты своих шардов
+        price_checker = SnapshotPublisher(application)
+        worker_pool = WorkerPool()
+        worker_pool.start()
+        application.bot_data['worker_pool'] = worker_pool
+    else:
+        if Config.SHARD_WORKERS > 0:
+            logger.error("❌ Воркерам нужна общая база (DB_BACKEND=sqlite), проверка цен работает в процессе бота")
+        price_checker = PriceChecker(application)
+    application.bot_data['price_checker'] = price_checker
+    price_checker.start()
+
+async def on_stop(application: Application) -> None:
+    """После остановки обработчиков: бот еще работает, дорассылаем уведомления"""
+    price_checker = application.bot_data.pop('price_checker', None)
+    if price_checker is not None:
+        await price_checker.shutdown()
+    worker_pool = application.bot_data.pop('worker_pool', None)
+    if worker_pool is not None:
+        await worker_pool.stop()
+    await async_crypto_api.close()
+
+async def on_shutdown(application: Application) -> None:
+    """Перед выходом: сбрасываем историю цен и отложенные изменения базы"""
+    price_history.close()
+    db.close()
+
+def build_application() -> Application:
+    """Создает Application с обработчиками и проверкой цен"""
+    application = (
+        Application.builder()
+        .token(Config.TELEGRAM_TOKEN)
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+    
+    # Регистрируем обработчики команд
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("cancel", cancel_command))
+    
+    # Регистрируем обработчик кнопок
+    application.add_handler(CallbackQueryHandler(button_handler))
+    
+    # Регистрируем обработчик текстовых сообщений
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
+
 def main() -> None:
-    """Запуск бота с кнопками"""
+    """Запуск бота с кнопками и проверкой цен"""
     if not Config.TELEGRAM_TOKEN:
         logger.error("❌ ОШИБКА: TELEGRAM_TOKEN не найден!")
         return
     
     try:
-        # Создаем Application
-        application = Application.builder().token(Config.TELEGRAM_TOKEN).build()
-        
-        # Регистрируем обработчики команд
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CommandHandler("cancel", cancel_command))
-        
-        # Регистрируем обработчик кнопок
-        application.add_handler(CallbackQueryHandler(button_handler))
-        
-        # Регистрируем обработчик текстовых сообщений
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+        application = build_application()
         
         # Запускаем бота
         logger.info("🤖 Бот с кнопками запущен...")
@@ -1117,10 +1138,11 @@ def main() -> None:
         logger.info("🎛 Теперь есть кнопка Pepe и другие мем-коины!")
         logger.info("✅ Можно добавлять любые монеты через 'Ввести свою'")
         
+        # Проверка цен стартует и останавливается вместе с ботом (on_startup, on_stop)
         application.run_polling()
         
     except Exception as e:
         logger.error(f"❌ Ошибка при запуске бота: {e}")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Optional, Dict, List
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class CoinCatalog:
+    """Локальный каталог монет (id, символ, название) с индексом в памяти"""
+    
+    def __init__(self, path: str = None):
+        if path:
+            self.path = path
+        elif Config.COIN_CATALOG_PATH:
+            self.path = Config.COIN_CATALOG_PATH
+        elif os.path.exists('/tmp'):  # Railway использует /tmp для записи
+            self.path = '/tmp/coins_catalog.json'
+        else:
+            self.path = os.path.join(os.path.dirname(__file__), 'coins_catalog.json')
+        
+        self._by_id: Dict[str, dict] = {}
+        self._by_symbol: Dict[str, List[str]] = {}
+        self._by_name: Dict[str, str] = {}
+        self.load()
+    
+    @property
+    def is_loaded(self) -> bool:
+        """Есть ли в каталоге хотя бы одна монета"""
+        return bool(self._by_id)
+    
+    def load(self) -> bool:
+        """Загрузка каталога из файла"""
+        try:
+            if not os.path.exists(self.path):
+                logger.info("📝 Файл каталога монет не найден, будет загружен из API")
+                return False
+            
+            with open(self.path, 'r', encoding='utf-8') as f:
+                coins = json.load(f)
+            self._build_index(coins)
+            logger.info(f"📚 Каталог монет загружен: {len(self._by_id)} монет")
+            return True
+        except (json.JSONDecodeError, TypeError, KeyError):
+            logger.warning("⚠️ Файл каталога монет поврежден")
+        except Exception as e:
+            logger.error(f"❌ Ошибка при загрузке каталога монет: {e}")
+        return False
+    
+    def _build_index(self, coins: List[dict]):
+        """Строит хэш-индексы по id, символу и названию"""
+        by_id = {}
+        by_symbol = {}
+        by_name = {}
+        
+        for coin in coins:
+            coin_id = coin['id'].lower()
+            symbol = (coin.get('symbol') or '').lower()
+            name = (coin.get('name') or '').lower()
+            
+            by_id[coin_id] = {'id': coin_id, 'symbol': symbol, 'name': coin.get('name') or ''}
+            if symbol:
+                ids = by_symbol.setdefault(symbol, [])
+                # Основная монета (id совпадает с названием) идет первой
+                if coin_id == name.replace(' ', '-'):
+                    ids.insert(0, coin_id)
+                else:
+                    ids.append(coin_id)
+            if name:
+                by_name.setdefault(name, coin_id)
+        
+        # Подменяем индексы целиком, чтобы читатели не видели полусобранное состояние
+        self._by_id = by_id
+        self._by_symbol = by_symbol
+        self._by_name = by_name
+    
+    def exists(self, coin_id: str) -> bool:
+        """Проверяет, есть ли монета с таким id"""
+        return coin_id.lower() in self._by_id
+    
+    def get(self, coin_id: str) -> Optional[dict]:
+        """Возвращает запись монеты по id"""
+        return self._by_id.get(coin_id.lower())
+    
+    def resolve(self, query: str) -> Optional[str]:
+        """
+        Находит id монеты по id, символу или названию
+        
+        Args:
+            query: например 'bitcoin', 'btc' или 'Bitcoin'
+        
+        Returns:
+            id монеты или None если не найдена
+        """
+        query = query.strip().lower()
+        if query in self._by_id:
+            return query
+        
+        ids = self._by_symbol.get(query)
+        if ids:
+            return ids[0]
+        
+        return self._by_name.get(query)
+    
+    async def refresh(self, api) -> bool:
+        """Загружает свежий список монет из API и сохраняет его в файл"""
+        try:
+            coins = await api.get_coins_list()
+            if not coins:
+                logger.warning("⚠️ API вернул пустой список монет")
+                return False
+            
+            self._build_index(coins)
+            await asyncio.to_thread(self._save, coins)
+            logger.info(f"🔄 Каталог монет обновлен: {len(self._by_id)} монет")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления каталога монет: {e}")
+            return False
+    
+    def _save(self, coins: List[dict]):
+        """Сохранение каталога в файл через временный файл"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(coins, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+    
+    async def run_periodically(self, api, interval_seconds: int = None):
+        """Периодически обновляет каталог в фоне"""
+        interval_seconds = interval_seconds or Config.COIN_CATALOG_REFRESH
+        
+        # Свежий файл с прошлого запуска не перекачиваем сразу
+        if self.is_loaded:
+            age = time.time() - os.path.getmtime(self.path)
+            if age < interval_seconds:
+                await asyncio.sleep(interval_seconds - age)
+        
+        while True:
+            await self.refresh(api)
+            await asyncio.sleep(interval_seconds)
+
+# Создаем глобальный объект каталога
+coin_catalog = CoinCatalog()
@@ -9,6 +9,129 @@ class Config:
         print("⚠️  ВНИМАНИЕ: TELEGRAM_TOKEN не найден в переменных окружения!")
         print("💡 Добавьте TELEGRAM_TOKEN в Railway Variables")
     
+    # Настройки HTTP клиента для API цен
+    HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', '10'))
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5'))
+    HTTP_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', '20'))
+    HTTP_MAX_KEEPALIVE = int(os.environ.get('HTTP_MAX_KEEPALIVE', '10'))
+    HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('HTTP_KEEPALIVE_EXPIRY', '30'))
+    HTTP_PER_HOST_LIMIT = int(os.environ.get('HTTP_PER_HOST_LIMIT', '5'))
+    HTTP2_ENABLED = os.environ.get('HTTP2_ENABLED', '1') == '1'
+    
+    # Кэш цен (секунды жизни записи и максимальное число монет)
+    PRICE_CACHE_TTL = float(os.environ.get('PRICE_CACHE_TTL', '60'))
+    PRICE_CACHE_SIZE = int(os.environ.get('PRICE_CACHE_SIZE', '10000'))
+    # Сколько секунд сверх TTL отдавать старую цену, обновляя её в фоне,
+    # и сколько - при недоступности провайдеров
+    PRICE_STALE_WHILE_REVALIDATE = float(os.environ.get('PRICE_STALE_WHILE_REVALIDATE', '30'))
+    PRICE_STALE_IF_ERROR = float(os.environ.get('PRICE_STALE_IF_ERROR', '3600'))
+    # Сколько ждать провайдеров, когда есть старая цена (сек), и сколько после
+    # неудачной загрузки монеты отдавать старую цену, не запрашивая заново
+    PRICE_STALE_WAIT = float(os.environ.get('PRICE_STALE_WAIT', '2'))
+    PRICE_ERROR_BACKOFF = float(os.environ.get('PRICE_ERROR_BACKOFF', '30'))
+    
+    # Пакетные запросы цен: размер пачки, длина списка ids и параллельность
+    PRICE_BATCH_MAX_IDS = int(os.environ.get('PRICE_BATCH_MAX_IDS', '250'))
+    PRICE_BATCH_MAX_CHARS = int(os.environ.get('PRICE_BATCH_MAX_CHARS', '1800'))
+    PRICE_BATCH_CONCURRENCY = int(os.environ.get('PRICE_BATCH_CONCURRENCY', '4'))
+    
+    # Провайдеры цен (по порядку приоритета) и их адреса
+    PRICE_PROVIDERS = os.environ.get('PRICE_PROVIDERS', 'coingecko,coincap')
+    COINGECKO_URL = os.environ.get('COINGECKO_URL', 'https://api.coingecko.com/api/v3')
+    COINCAP_URL = os.environ.get('COINCAP_URL', 'https://api.coincap.io/v2')
+    COINCAP_RATE_PER_MINUTE = float(os.environ.get('COINCAP_RATE_PER_MINUTE', '200'))
+    PROVIDER_ID_MAP_PATH = os.environ.get('PROVIDER_ID_MAP_PATH')
+    
+    # Хедж-запросы и вывод провайдера из ротации при ошибках
+    HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', '95'))
+    HEDGE_DEFAULT_DELAY = float(os.environ.get('HEDGE_DEFAULT_DELAY', '2'))
+    HEDGE_MIN_DELAY = float(os.environ.get('HEDGE_MIN_DELAY', '0.2'))
+    PROVIDER_HEALTH_WINDOW = int(os.environ.get('PROVIDER_HEALTH_WINDOW', '20'))
+    PROVIDER_MAX_ERROR_RATE = float(os.environ.get('PROVIDER_MAX_ERROR_RATE', '0.5'))
+    PROVIDER_COOLDOWN = float(os.environ.get('PROVIDER_COOLDOWN', '60'))
+    
+    # Ограничение частоты запросов к API цен
+    API_RATE_PER_MINUTE = float(os.environ.get('API_RATE_PER_MINUTE', '30'))
+    API_BURST = int(os.environ.get('API_BURST', '5'))
+    API_MAX_RETRIES = int(os.environ.get('API_MAX_RETRIES', '3'))
+    API_BACKOFF_BASE = float(os.environ.get('API_BACKOFF_BASE', '1'))
+    API_BACKOFF_MAX = float(os.environ.get('API_BACKOFF_MAX', '30'))
+    API_QUEUE_LIMIT = int(os.environ.get('API_QUEUE_LIMIT', '100'))
+    
+    # Рассылка уведомлений: общий лимит Telegram (сообщений в секунду), интервал
+    # между сообщениями в один чат (сек), одновременные отправки, попытки, очередь
+    NOTIFY_RATE_PER_SECOND = float(os.environ.get('NOTIFY_RATE_PER_SECOND', '25'))
+    NOTIFY_CHAT_INTERVAL = float(os.environ.get('NOTIFY_CHAT_INTERVAL', '1'))
+    NOTIFY_WORKERS = int(os.environ.get('NOTIFY_WORKERS', '16'))
+    NOTIFY_MAX_RETRIES = int(os.environ.get('NOTIFY_MAX_RETRIES', '3'))
+    NOTIFY_QUEUE_LIMIT = int(os.environ.get('NOTIFY_QUEUE_LIMIT', '100000'))
+    # Сводки: окно сбора уведомлений пользователя (сек, 0 - один тик) и изменение
+    # в процентах, о котором сообщается сразу отдельным сообщением (0 - никогда)
+    DIGEST_WINDOW = float(os.environ.get('DIGEST_WINDOW', '0'))
+    DIGEST_URGENT_PERCENT = float(os.environ.get('DIGEST_URGENT_PERCENT', '10'))
+    # Очередь уведомлений на диске (SQLite): путь, сколько секунд помнить ключи
+    # обработанных уведомлений, попыток доставки, пауза перед повтором (начальная и
+    # максимальная, сек), период проверки очереди (сек) и сколько уведомлений брать за раз
+    OUTBOX_PATH = os.environ.get('OUTBOX_PATH')
+    OUTBOX_DEDUP_WINDOW = float(os.environ.get('OUTBOX_DEDUP_WINDOW', '3600'))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '10'))
+    OUTBOX_RETRY_BASE = float(os.environ.get('OUTBOX_RETRY_BASE', '5'))
+    OUTBOX_RETRY_MAX = float(os.environ.get('OUTBOX_RETRY_MAX', '600'))
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '1'))
+    OUTBOX_BATCH = int(os.environ.get('OUTBOX_BATCH', '1000'))
+    
+    # Адаптивный опрос: интервал монеты по волатильности и самому маленькому порогу.
+    # POLL_DEFAULT_INTERVAL - средний интервал (задает расход запросов) и интервал,
+    # пока волатильность неизвестна; пределы интервала (сек); вес новой точки в
+    # оценке волатильности; окно истории для начальной оценки; насколько заранее
+    # монеты добираются в неполную пачку; как часто перечитывается список монет
+    POLL_ADAPTIVE = os.environ.get('POLL_ADAPTIVE', '1') == '1'
+    POLL_DEFAULT_INTERVAL = float(os.environ.get('POLL_DEFAULT_INTERVAL', '60'))
+    POLL_MIN_INTERVAL = float(os.environ.get('POLL_MIN_INTERVAL', '10'))
+    POLL_MAX_INTERVAL = float(os.environ.get('POLL_MAX_INTERVAL', '600'))
+    POLL_VOLATILITY_ALPHA = float(os.environ.get('POLL_VOLATILITY_ALPHA', '0.2'))
+    POLL_HISTORY_WINDOW = float(os.environ.get('POLL_HISTORY_WINDOW', '3600'))
+    POLL_BATCH_AHEAD = float(os.environ.get('POLL_BATCH_AHEAD', '30'))
+    POLL_REFRESH_INTERVAL = float(os.environ.get('POLL_REFRESH_INTERVAL', '10'))
+    
+    # Шардированная проверка порогов (нужна база sqlite): число процессов-воркеров
+    # (0 - проверка в процессе бота), Unix сокет для снимков цен и срок аренды шарда (сек)
+    SHARD_WORKERS = int(os.environ.get('SHARD_WORKERS', '0'))
+    SHARD_SOCKET_PATH = os.environ.get('SHARD_SOCKET_PATH', '/tmp/crypto_bot_prices.sock')
+    SHARD_LEASE_TTL = float(os.environ.get('SHARD_LEASE_TTL', '15'))
+    
+    # Потоковое получение цен через WebSocket вместо опроса раз в минуту
+    PRICE_STREAM_ENABLED = os.environ.get('PRICE_STREAM_ENABLED', '0') == '1'
+    PRICE_STREAM_URL = os.environ.get('PRICE_STREAM_URL', 'wss://ws.coincap.io/prices')
+    PRICE_STREAM_RESUBSCRIBE_CHECK = float(os.environ.get('PRICE_STREAM_RESUBSCRIBE_CHECK', '15'))
+    PRICE_STREAM_FALLBACK_INTERVAL = int(os.environ.get('PRICE_STREAM_FALLBACK_INTERVAL', '300'))
+    
+    # Локальный каталог монет (путь к файлу и период обновления в секундах)
+    COIN_CATALOG_PATH = os.environ.get('COIN_CATALOG_PATH')
+    COIN_CATALOG_REFRESH = int(os.environ.get('COIN_CATALOG_REFRESH', '86400'))
+    
+    # История цен: файл mmap, число точек на монету и минимальный интервал между точками (сек)
+    PRICE_HISTORY_PATH = os.environ.get('PRICE_HISTORY_PATH')
+    PRICE_HISTORY_SIZE = int(os.environ.get('PRICE_HISTORY_SIZE', '1440'))
+    PRICE_HISTORY_RESOLUTION = float(os.environ.get('PRICE_HISTORY_RESOLUTION', '60'))
+    
+    # Индекс проверки порогов: bands (отсортированные границы срабатывания) или columns (полный проход)
+    THRESHOLD_INDEX = os.environ.get('THRESHOLD_INDEX', 'bands').lower()
+    
+    # Хранилище пользователей: json (файл users_data.json) или sqlite
+    DB_BACKEND = os.environ.get('DB_BACKEND', 'json').lower()
+    SQLITE_PATH = os.environ.get('SQLITE_PATH')
+    
+    # Отложенная запись журнала JSON базы: не чаще раза в N мс или после M изменений
+    DB_FLUSH_INTERVAL_MS = int(os.environ.get('DB_FLUSH_INTERVAL_MS', '1000'))
+    DB_FLUSH_MAX_MUTATIONS = int(os.environ.get('DB_FLUSH_MAX_MUTATIONS', '500'))
+    # Размер журнала изменений, после которого он сворачивается в новый снимок
+    DB_JOURNAL_MAX_BYTES = int(os.environ.get('DB_JOURNAL_MAX_BYTES', str(4 * 1024 * 1024)))
+    # Формат снимка JSON базы: binary (быстрый старт) или json (читаемый файл)
+    DB_SNAPSHOT_FORMAT = os.environ.get('DB_SNAPSHOT_FORMAT', 'binary').lower()
+    # Ленивая загрузка: имена пользователей читаются из снимка при первом обращении
+    DB_LAZY_USERS = os.environ.get('DB_LAZY_USERS', '0') == '1'
+    
     @classmethod
     def validate(cls):
         """Проверка наличия обязательных настроек"""
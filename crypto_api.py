@@ -1,18 +1,292 @@
-import requests
+import asyncio
+import threading
+import time
 import logging
-from typing import Optional, Dict
+from collections import OrderedDict
+from typing import Optional, Dict, List, NamedTuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import Config
+from coin_catalog import coin_catalog
+from rate_limiter import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from providers import CoinGeckoProvider, build_providers
+
+try:
+    import h2  # noqa: F401 - нужен httpx для HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
-class CryptoAPI:
-    """Класс для работы с API криптовалют"""
+class BatchPriceResult(NamedTuple):
+    """Результат пакетного запроса цен"""
+    prices: Dict[str, float]
+    failed_chunks: List[List[str]]
+
+class PriceQuote(NamedTuple):
+    """Цена с моментом получения"""
+    price: float
+    as_of: float  # время получения (unix timestamp)
+    stale: bool = False  # цена старше TTL кэша
+    
+    @property
+    def age(self) -> float:
+        """Возраст цены в секундах"""
+        return max(0.0, time.time() - self.as_of)
+
+class PriceCache:
+    """
+    Общий кэш цен с TTL, LRU вытеснением и объединением одинаковых запросов.
+    Устаревшие записи отдаются, пока идет фоновое обновление (stale-while-revalidate)
+    или пока провайдеры недоступны (stale-if-error). После неудачной загрузки
+    монета error_backoff секунд не запрашивается: старая цена отдается сразу.
+    """
+    
+    def __init__(self, ttl: float = None, max_size: int = None,
+                 stale_while_revalidate: float = None, stale_if_error: float = None,
+                 stale_wait: float = None, error_backoff: float = None):
+        self.ttl = ttl if ttl is not None else Config.PRICE_CACHE_TTL
+        self.max_size = max_size or Config.PRICE_CACHE_SIZE
+        self.stale_while_revalidate = (Config.PRICE_STALE_WHILE_REVALIDATE
+                                       if stale_while_revalidate is None else stale_while_revalidate)
+        self.stale_if_error = Config.PRICE_STALE_IF_ERROR if stale_if_error is None else stale_if_error
+        self.stale_wait = Config.PRICE_STALE_WAIT if stale_wait is None else stale_wait
+        self.error_backoff = Config.PRICE_ERROR_BACKOFF if error_backoff is None else error_backoff
+        
+        self._entries = OrderedDict()  # coin_id -> (цена, monotonic время получения, unix время)
+        self._lock = threading.Lock()
+        # Запросы в полете: coin_id -> задача (все в цикле событий приложения)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._failed: Dict[str, float] = {}  # coin_id -> monotonic время неудачной загрузки
+    
+    def get_quote(self, coin_id: str) -> Optional[PriceQuote]:
+        """Возвращает последнюю известную цену, если она не старше допустимого"""
+        with self._lock:
+            entry = self._entries.get(coin_id)
+            if entry is None:
+                return None
+            
+            price, fetched_at, as_of = entry
+            age = time.monotonic() - fetched_at
+            if age > self.ttl + max(self.stale_while_revalidate, self.stale_if_error):
+                del self._entries[coin_id]
+                return None
+            
+            self._entries.move_to_end(coin_id)
+            return PriceQuote(price, as_of, age > self.ttl)
+    
+    def get(self, coin_id: str) -> Optional[float]:
+        """Возвращает цену из кэша или None, если записи нет или она устарела"""
+        quote = self.get_quote(coin_id)
+        if quote is None or quote.stale:
+            return None
+        return quote.price
+    
+    def set(self, coin_id: str, price: float):
+        """Сохраняет цену в кэш"""
+        self.set_many({coin_id: price})
+    
+    def set_many(self, prices: Dict[str, float]):
+        """Сохраняет несколько цен в кэш"""
+        fetched_at = time.monotonic()
+        as_of = time.time()
+        with self._lock:
+            for coin_id, price in prices.items():
+                self._entries[coin_id] = (price, fetched_at, as_of)
+                self._entries.move_to_end(coin_id)
+                self._failed.pop(coin_id, None)
+            
+            # Вытесняем давно не использованные записи
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    async def get_or_fetch(self, coin_id: str, fetch) -> Optional[PriceQuote]:
+        """
+        Возвращает цену из кэша, а при промахе загружает её через fetch.
+        Одновременные промахи по одной монете ждут один общий запрос.
+        """
+        quote = self.get_quote(coin_id)
+        if quote is not None and not quote.stale:
+            return quote
+        
+        task = self._start_fetch(coin_id, fetch)
+        if quote is not None and quote.age <= self.ttl + self.stale_while_revalidate:
+            # Отдаем сразу, а свежую цену подтягиваем в фоне
+            return quote
+        if task is None:
+            # Загрузка недавно не удалась - не ждем провайдеров снова
+            return self._stale_if_error(coin_id, quote)
+        
+        try:
+            # shield: отмена одного ожидающего не отменяет общий запрос. Со старой
+            # ценой ждем недолго - при сбое провайдеров загрузка может идти минуту
+            price = await asyncio.wait_for(asyncio.shield(task), None if quote is None else self.stale_wait)
+        except asyncio.TimeoutError:
+            price = None
+        if price is not None:
+            return self.get_quote(coin_id) or PriceQuote(price, time.time())
+        return self._stale_if_error(coin_id, quote)
+    
+    def _stale_if_error(self, coin_id: str, quote: Optional[PriceQuote]) -> Optional[PriceQuote]:
+        """Провайдеры недоступны - лучше старая цена с отметкой времени, чем ничего"""
+        if quote is not None and quote.age <= self.ttl + self.stale_if_error:
+            logger.info(f"Отдаем сохраненную цену {coin_id} возрастом {quote.age:.0f} сек")
+            return quote
+        return None
     
-    def __init__(self):
-        self.base_url = "https://api.coingecko.com/api/v3"
+    def _start_fetch(self, coin_id: str, fetch) -> Optional[asyncio.Task]:
+        """Запускает загрузку цены или возвращает уже идущую; None - загрузка недавно не удалась"""
+        task = self._inflight.get(coin_id)
         
-    def get_price(self, coin_id: str) -> Optional[float]:
+        if task is None:
+            failed_at = self._failed.get(coin_id)
+            if failed_at is not None and time.monotonic() - failed_at < self.error_backoff:
+                return None
+            task = asyncio.create_task(self._fetch_and_store(coin_id, fetch))
+            self._inflight[coin_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(coin_id, None))
+        return task
+    
+    async def _fetch_and_store(self, coin_id: str, fetch) -> Optional[float]:
+        price = None
+        try:
+            price = await fetch(coin_id)
+        finally:
+            if price is None:
+                now = time.monotonic()
+                if len(self._failed) >= self.max_size:
+                    self._failed = {c: t for c, t in self._failed.items() if now - t < self.error_backoff}
+                self._failed[coin_id] = now
+            else:
+                self.set(coin_id, price)
+        return price
+
+class AsyncCryptoAPI:
+    """Асинхронный клиент API криптовалют с пулом соединений и несколькими провайдерами"""
+    
+    def __init__(self, base_url: str = None, providers: list = None,
+                 timeout: float = None, per_host_limit: int = None,
+                 max_connections: int = None, max_keepalive: int = None,
+                 http2: bool = None):
+        if providers is None:
+            providers = [CoinGeckoProvider(base_url)] if base_url else build_providers()
+        self.providers = providers
+        self.timeout = httpx.Timeout(
+            timeout if timeout is not None else Config.HTTP_TIMEOUT,
+            connect=Config.HTTP_CONNECT_TIMEOUT
+        )
+        self.limits = httpx.Limits(
+            max_connections=max_connections or Config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=max_keepalive or Config.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY
+        )
+        self.per_host_limit = per_host_limit or Config.HTTP_PER_HOST_LIMIT
+        self.http2 = (Config.HTTP2_ENABLED if http2 is None else http2) and HTTP2_AVAILABLE
+        self.cache = PriceCache()
+        
+        # Один клиент на приложение: бот и проверка цен работают в одном цикле событий
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Возвращает постоянный клиент (создается при первом запросе)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+                headers={'Accept': 'application/json'}
+            )
+            self._host_limits = {}
+            logger.debug(f"Создан HTTP клиент (http2={self.http2})")
+        
+        return self._client
+    
+    def _get_host_limit(self, url: str) -> asyncio.Semaphore:
+        """Семафор, ограничивающий число одновременных запросов к хосту"""
+        host = urlsplit(url).netloc
+        
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[host]
+    
+    async def _request_json(self, url: str, params: dict):
+        """Выполняет GET запрос через общий пул соединений и возвращает JSON"""
+        client = self._get_client()
+        async with self._get_host_limit(url):
+            response = await client.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+    
+    async def _fetch_prices(self, coin_ids: List[str], priority: int) -> Dict[str, float]:
+        """
+        Запрашивает цены у провайдеров по очереди приоритета.
+        Если основной не ответил за перцентиль своей задержки - параллельно
+        отправляется хедж-запрос следующему; при ошибке - сразу фейловер.
+        Ответы объединяются: монеты, которых не было в ответе (провайдер их не
+        знает), сразу запрашиваются у следующего провайдера.
+        
+        Returns:
+            Полученные цены; монет, которых нет ни у одного провайдера, в них нет.
+            Если не ответил ни один провайдер - исключение последнего
+        """
+        providers = [p for p in self.providers if p.is_available()] or list(self.providers)
+        missing = set(coin_ids)
+        prices = {}
+        answered = False
+        pending = set()
+        last_error = None
+        next_index = 0
+        
+        def ask_next():
+            nonlocal next_index
+            provider = providers[next_index]
+            next_index += 1
+            ids = [coin_id for coin_id in coin_ids if coin_id in missing]
+            pending.add(asyncio.ensure_future(provider.fetch_prices(self, ids, priority)))
+            return provider
+        
+        try:
+            provider = ask_next()
+            while pending:
+                has_next = next_index < len(providers)
+                timeout = provider.hedge_delay() if has_next else None
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.debug(f"Хедж-запрос: {provider.name} отвечает дольше {timeout:.2f} сек")
+                    provider = ask_next()
+                    continue
+                
+                for task in done:
+                    if task.exception() is None:
+                        answered = True
+                        result = task.result()
+                        prices.update((coin_id, result[coin_id]) for coin_id in missing & result.keys())
+                        missing.difference_update(result)
+                    else:
+                        last_error = task.exception()
+                
+                if not missing:
+                    return prices
+                # Ошибка или неполный ответ - недостающее у следующего провайдера
+                if has_next:
+                    provider = ask_next()
+            
+            if answered:
+                return prices
+            raise last_error or RuntimeError("нет доступных провайдеров цен")
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def get_price(self, coin_id: str) -> Optional[float]:
         """
-        Получает текущую цену криптовалюты в USD
+        Получает текущую цену криптовалюты в USD (с учетом кэша)
         
         Args:
             coin_id: ID монеты (например: 'bitcoin', 'ethereum')
@@ -20,78 +294,160 @@ class CryptoAPI:
         Returns:
             Цена в USD или None при ошибке
         """
+        quote = await self.get_price_quote(coin_id)
+        return quote.price if quote else None
+    
+    async def get_price_quote(self, coin_id: str) -> Optional[PriceQuote]:
+        """
+        Получает цену с моментом её получения. Во время сбоев провайдеров
+        возвращает последнюю известную цену (quote.stale = True).
+        
+        Args:
+            coin_id: ID монеты (например: 'bitcoin', 'ethereum')
+        
+        Returns:
+            PriceQuote или None, если цены нет совсем
+        """
+        return await self.cache.get_or_fetch(coin_id.lower(), self._fetch_price)
+    
+    async def _fetch_price(self, coin_id: str) -> Optional[float]:
+        """Запрашивает цену одной монеты у API в обход кэша"""
         try:
-            # Приводим к нижнему регистру
-            coin_id = coin_id.lower()
+            data = await self._fetch_prices([coin_id], PRIORITY_INTERACTIVE)
             
-            url = f"{self.base_url}/simple/price"
-            params = {
-                'ids': coin_id,
-                'vs_currencies': 'usd'
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if coin_id in data and 'usd' in data[coin_id]:
-                price = data[coin_id]['usd']
+            if coin_id in data:
+                price = data[coin_id]
                 logger.debug(f"Цена {coin_id}: ${price}")
                 return price
             else:
                 logger.warning(f"Монета {coin_id} не найдена в ответе API")
                 return None
                 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Ошибка при запросе цены для {coin_id}: {e}")
             return None
         except Exception as e:
             logger.error(f"Неожиданная ошибка для {coin_id}: {e}")
             return None
     
-    def get_multiple_prices(self, coin_ids: list) -> Dict[str, float]:
+    async def get_multiple_prices(self, coin_ids: list,
+                                  priority: int = PRIORITY_BACKGROUND) -> Dict[str, float]:
         """
         Получает цены для нескольких монет одновременно
         
         Args:
             coin_ids: список ID монет
+            priority: полоса планировщика запросов
         
         Returns:
             Словарь {coin_id: цена}
         """
+        result = await self.get_multiple_prices_detailed(coin_ids, priority)
+        return result.prices
+    
+    async def get_multiple_prices_detailed(self, coin_ids: list,
+                                           priority: int = PRIORITY_BACKGROUND) -> BatchPriceResult:
+        """
+        Получает цены пачками ограниченного размера, параллельно
+        
+        Args:
+            coin_ids: список ID монет
+            priority: полоса планировщика запросов
+        
+        Returns:
+            BatchPriceResult с объединенными ценами и списком упавших пачек
+            (и монет, которых не было ни в одном ответе)
+        """
         if not coin_ids:
-            return {}
-            
+            return BatchPriceResult({}, [])
+        
+        # Приводим к нижнему регистру и убираем повторы, сохраняя порядок
+        coin_ids = list(dict.fromkeys(coin_id.lower() for coin_id in coin_ids))
+        chunks = self._split_ids(coin_ids)
+        semaphore = asyncio.Semaphore(Config.PRICE_BATCH_CONCURRENCY)
+        
+        async def fetch_chunk(chunk):
+            async with semaphore:
+                return await self._fetch_chunk(chunk, priority)
+        
+        results = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+        
+        prices = {}
+        failed_chunks = []
+        for chunk, chunk_prices in zip(chunks, results):
+            if chunk_prices is None:
+                failed_chunks.append(chunk)
+                continue
+            prices.update(chunk_prices)
+            # Монеты, которых не вернул ни один провайдер, тоже не получены
+            missing = [coin_id for coin_id in chunk if coin_id not in chunk_prices]
+            if missing:
+                failed_chunks.append(missing)
+        
+        if failed_chunks:
+            failed_count = sum(len(chunk) for chunk in failed_chunks)
+            logger.warning(f"Не удалось получить {len(failed_chunks)} из {len(chunks)} пачек ({failed_count} монет)")
+        
+        # Свежие цены сразу доступны интерактивным запросам
+        self.cache.set_many(prices)
+        return BatchPriceResult(prices, failed_chunks)
+    
+    def _split_ids(self, coin_ids: List[str]) -> List[List[str]]:
+        """Делит список ID на пачки с ограничением по числу и длине строки ids"""
+        chunks = []
+        current = []
+        length = 0
+        
+        for coin_id in coin_ids:
+            extra = len(coin_id) + 1  # +1 на запятую
+            if current and (len(current) >= Config.PRICE_BATCH_MAX_IDS
+                            or length + extra > Config.PRICE_BATCH_MAX_CHARS):
+                chunks.append(current)
+                current = []
+                length = 0
+            current.append(coin_id)
+            length += extra
+        
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    async def _fetch_chunk(self, coin_ids: List[str],
+                           priority: int = PRIORITY_BACKGROUND) -> Optional[Dict[str, float]]:
+        """Запрашивает одну пачку цен; None означает ошибку запроса"""
         try:
-            # Приводим все к нижнему регистру
-            coin_ids = [coin_id.lower() for coin_id in coin_ids]
-            
-            url = f"{self.base_url}/simple/price"
-            params = {
-                'ids': ','.join(coin_ids),
-                'vs_currencies': 'usd'
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            prices = {}
-            for coin_id in coin_ids:
-                if coin_id in data and 'usd' in data[coin_id]:
-                    prices[coin_id] = data[coin_id]['usd']
-                else:
-                    logger.warning(f"Монета {coin_id} не найдена")
-                    
-            return prices
-            
+            data = await self._fetch_prices(coin_ids, priority)
         except Exception as e:
-            logger.error(f"Ошибка при запросе цен: {e}")
-            return {}
+            logger.error(f"Ошибка при запросе пачки из {len(coin_ids)} монет: {e}")
+            return None
+        
+        prices = {}
+        for coin_id in coin_ids:
+            if coin_id in data:
+                prices[coin_id] = data[coin_id]
+            else:
+                logger.warning(f"Монета {coin_id} не найдена")
+        return prices
+    
+    async def get_coins_list(self) -> list:
+        """Получает полный список монет (id, symbol, name) у первого провайдера, который его дает"""
+        last_error = None
+        for provider in self.providers:
+            try:
+                return await provider.get_coins_list(self)
+            except NotImplementedError:
+                continue
+            except Exception as e:
+                last_error = e
+        raise last_error or RuntimeError("ни один провайдер не дает список монет")
+    
+    def get_stats(self) -> dict:
+        """Статистика запросов по провайдерам"""
+        return {provider.name: provider.get_stats() for provider in self.providers}
     
-    def check_coin_exists(self, coin_id: str) -> bool:
+    async def check_coin_exists(self, coin_id: str) -> bool:
         """
-        Проверяет, существует ли монета в API
+        Проверяет, существует ли монета (по локальному каталогу, без сети)
         
         Args:
             coin_id: ID монеты для проверки
@@ -99,9 +455,33 @@ class CryptoAPI:
         Returns:
             True если монета существует
         """
-        # Просто пытаемся получить цену - если получили, значит монета существует
-        price = self.get_price(coin_id)
-        return price is not None
+        return await self.resolve_coin_id(coin_id) == coin_id.lower()
+    
+    async def resolve_coin_id(self, query: str) -> Optional[str]:
+        """
+        Находит id монеты по id, символу или названию (например 'btc' -> 'bitcoin')
+        
+        Args:
+            query: текст, введенный пользователем
+        
+        Returns:
+            id монеты или None если монета не найдена
+        """
+        if coin_catalog.is_loaded:
+            return coin_catalog.resolve(query)
+        
+        # Каталог еще не загружен - проверяем через запрос цены.
+        # Цена попадает в кэш, поэтому следующий get_price не идет в сеть.
+        coin_id = query.strip().lower()
+        price = await self.get_price(coin_id)
+        return coin_id if price is not None else None
+    
+    async def close(self):
+        """Закрывает HTTP клиент"""
+        client, self._client = self._client, None
+        self._host_limits = {}
+        if client is not None:
+            await client.aclose()
 
 # Создаем глобальный объект API
-crypto_api = CryptoAPI()
\ No newline at end of file
+async_crypto_api = AsyncCryptoAPI()
\ No newline at end of file
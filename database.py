@@ -1,227 +1,894 @@
 import os
 import json
+import time
+import atexit
+import asyncio
 import logging
+import functools
+import threading
+from bisect import bisect_left
+import binary_snapshot
+from binary_snapshot import SnapshotColumns, encode_name, MISSING
+from config import Config
 
 logger = logging.getLogger(__name__)
 
-class Database:
+DEFAULT_THRESHOLD = 1.0
+
+# Имя пользователя еще не прочитано из снимка (ленивая загрузка)
+UNLOADED = object()
+
+class CoinInterner:
+    """Интернирование id монет: каждая строка хранится один раз, в записях - int"""
+    
+    __slots__ = ('_ids', '_names')
+    
     def __init__(self):
+        self._ids = {}    # название -> номер
+        self._names = []  # номер -> название
+    
+    def intern(self, coin_name):
+        """Номер монеты (выдается при первом обращении)"""
+        coin = self._ids.get(coin_name)
+        if coin is None:
+            coin = len(self._names)
+            self._ids[coin_name] = coin
+            self._names.append(coin_name)
+        return coin
+    
+    def get(self, coin_name):
+        """Номер монеты или None, если такой монеты еще не было"""
+        return self._ids.get(coin_name)
+    
+    def name(self, coin):
+        return self._names[coin]
+    
+    def names(self):
+        """Все названия по порядку номеров"""
+        return list(self._names)
+
+class Subscription:
+    """Данные пользователя по одной монете"""
+    
+    __slots__ = ('user', 'coin', 'tracked', 'threshold', 'last_price')
+    
+    def __init__(self, user, coin):
+        self.user = user
+        self.coin = coin          # номер монеты в CoinInterner
+        self.tracked = False      # монета в списке отслеживаемых
+        self.threshold = None     # индивидуальный порог или None
+        self.last_price = None
+    
+    @property
+    def effective_threshold(self):
+        """Индивидуальный порог, а если его нет - общий порог пользователя"""
+        return self.threshold if self.threshold is not None else self.user.threshold
+    
+    @property
+    def is_empty(self):
+        return not self.tracked and self.threshold is None and self.last_price is None
+
+class UserRecord:
+    """Пользователь и его подписки (по порядку добавления монет)"""
+    
+    __slots__ = ('user_id', 'username', 'threshold', 'subscriptions')
+    
+    def __init__(self, user_id, username, threshold=DEFAULT_THRESHOLD):
+        self.user_id = user_id
+        self.username = username
+        self.threshold = threshold
+        # Список, а не словарь: у пользователя немного монет, а список вдвое компактнее
+        self.subscriptions = []
+
+def synchronized(method):
+    """Выполняет метод хранилища под его блокировкой self._lock"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class Database:
+    """
+    JSON хранилище пользователей: снимок users_data.json плюс журнал изменений.
+    Каждое изменение дописывается в журнал короткой записью, а снимок
+    перезаписывается только при сжатии журнала. Снимок хранится в двоичном
+    формате (users_data.snap) или, при DB_SNAPSHOT_FORMAT=json, в users_data.json;
+    после первого двоичного снимка старый JSON переименовывается в .migrated.
+    """
+    
+    # Все данные в памяти: операции не ждут диска (журнал пишет фоновый поток)
+    IN_MEMORY = True
+    
+    # Изменения, которые пишутся в журнал и повторяются при загрузке
+    JOURNAL_OPS = (
+        'add_user', 'add_coin', 'remove_coin', 'set_threshold', 'set_coin_threshold',
+        'remove_individual_threshold', 'update_price', 'update_prices', 'clear_user_data'
+    )
+    
+    def __init__(self, db_path=None):
+        self._init_state(db_path)
+        loaded_format = self._load_snapshot()
+        self._replay_journal()
+        logger.info(f"📁 База данных загружена из: {self.db_path}")
+        
+        # Отложенная запись: записи журнала копятся и сбрасываются пачкой
+        self._pending_mutations = 0
+        self._flush_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._closed = False
+        self.stats = {
+            'flushes': 0,              # сколько раз журнал сброшен на диск
+            'coalesced_mutations': 0,  # сколько изменений вошло в эти сбросы
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+            'compactions': 0           # сколько раз журнал свернут в снимок
+        }
+        
+        self._flusher = threading.Thread(target=self._flush_loop, name='db-flusher', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+        
+        # Снимок в другом формате (например, старый users_data.json) сразу переписываем
+        if loaded_format and loaded_format != self.snapshot_format:
+            self.compact()
+    
+    @classmethod
+    def read(cls, db_path):
+        """
+        Загружает данные только для чтения (например, для импорта в SQLite)
+        
+        Снимок и журнал читаются так же, как при обычной загрузке, но без
+        фоновой записи, atexit и сворачивания журнала: файлы не меняются.
+        """
+        store = cls.__new__(cls)
+        store._init_state(db_path)
+        store._load_snapshot(read_only=True)
+        store._replay_journal()
+        return store
+    
+    def _init_state(self, db_path):
+        """Пути файлов и пустые структуры данных"""
         # Определяем путь к файлу базы данных для Railway
-        if os.path.exists('/tmp'):  # Railway использует /tmp для записи
+        if db_path:
+            self.db_path = db_path
+        elif os.path.exists('/tmp'):  # Railway использует /tmp для записи
             self.db_path = '/tmp/users_data.json'
         else:
             # Для локальной разработки
             self.db_path = os.path.join(os.path.dirname(__file__), 'users_data.json')
+        self.journal_path = os.path.splitext(self.db_path)[0] + '.journal'
+        # Двоичный снимок рядом с JSON; если он есть, он всегда новее JSON
+        self.snapshot_path = os.path.splitext(self.db_path)[0] + '.snap'
+        self.snapshot_format = Config.DB_SNAPSHOT_FORMAT
         
-        self.data = self._load_data()
-        logger.info(f"📁 База данных загружена из: {self.db_path}")
+        # Данные меняют и бот, и поток проверки цен: все операции - под этой
+        # блокировкой, изменение и его запись в журнал происходят атомарно
+        self._lock = threading.RLock()
+        
+        # Журнал: номер последней записи и записи, еще не сброшенные на диск
+        self._seq = 0
+        self._journal_buffer = []
+        self._journal_lock = threading.Lock()
+        self._replaying = False
+        
+        # Компактное представление в памяти: int id пользователей, интернированные
+        # монеты и записи со __slots__ вместо вложенных словарей
+        self._coins = CoinInterner()
+        self._users = {}       # user_id -> UserRecord
+        # Обратный индекс: номер монеты -> {user_id: Subscription}; поддерживается мутаторами
+        self._coin_index = {}
+        # Версия данных подписчиков монеты: растет при каждом изменении (для ThresholdEngine)
+        self._coin_versions = {}
+        self._subscription_versions = {}  # как _coin_versions, но без изменений последних цен
+        # Ленивый режим: (id пользователей снимка, их имена) для чтения имен по запросу
+        self._lazy_names = None
+    
+    def _load_snapshot(self, read_only=False):
+        """
+        Загружает двоичный снимок, а если его нет - JSON
+        
+        Поврежденный снимок откладывается, и данные читаются из JSON, в том
+        числе из users_data.json.migrated, оставшегося после перехода на
+        двоичный снимок: он старее журнала, но лучше пустой базы.
+        
+        Args:
+            read_only: не переименовывать поврежденные файлы
+
+        Returns:
+            формат загруженного снимка ('binary' или 'json') или None, если снимка нет
+        """
+        json_path = self.db_path
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'rb') as f:
+                    columns, self._seq = binary_snapshot.decode(f.read())
+                self._load_columns(columns)
+                logger.info(f"✅ Данные успешно загружены")
+                return 'binary'
+            except (ValueError, IndexError, UnicodeDecodeError) as e:
+                if read_only:
+                    logger.error(f"❌ Снимок БД {self.snapshot_path} поврежден ({e})")
+                else:
+                    broken_path = f"{self.snapshot_path}.corrupt-{int(time.time())}"
+                    os.replace(self.snapshot_path, broken_path)
+                    logger.error(f"❌ Снимок БД поврежден ({e}), сохранен как {broken_path}")
+                self._coins = CoinInterner()
+                self._users = {}
+                self._coin_index = {}
+                self._lazy_names = None
+                self._seq = 0
+                
+                if not os.path.exists(json_path) and os.path.exists(f"{self.db_path}.migrated"):
+                    json_path = f"{self.db_path}.migrated"
+                if os.path.exists(json_path):
+                    logger.error(f"❌ Читаю данные из {json_path}: изменения после него, "
+                                 f"которых нет в журнале, потеряны")
+                else:
+                    logger.error("❌ Другой копии данных нет: пользователи восстановятся только из журнала")
+        
+        exists = os.path.exists(json_path)
+        self._load_users(self._load_data(json_path, read_only))
+        return 'json' if exists else None
     
-    def _load_data(self):
-        """Загрузка данных из файла"""
+    def _load_data(self, path=None, read_only=False):
+        """Загрузка снимка данных из файла"""
+        path = path or self.db_path
         try:
-            if os.path.exists(self.db_path):
-                with open(self.db_path, 'r', encoding='utf-8') as f:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
+                    # Номер последней записи журнала, вошедшей в снимок
+                    self._seq = data.pop('_journal_seq', 0)
                     logger.info(f"✅ Данные успешно загружены")
                     return data
             else:
                 logger.info("📝 Файл базы данных не найден, создаю новую")
         except json.JSONDecodeError:
-            logger.warning("⚠️ Файл базы данных поврежден, создаю новую")
+            if read_only:
+                logger.error(f"❌ Файл базы данных {path} поврежден")
+                return {'users': {}}
+            # Не затираем поврежденный файл пустой базой - откладываем его для разбора
+            broken_path = f"{path}.corrupt-{int(time.time())}"
+            os.replace(path, broken_path)
+            logger.error(f"❌ Файл базы данных поврежден, сохранен как {broken_path}; создаю новую")
         except Exception as e:
             logger.error(f"❌ Ошибка при загрузке БД: {e}")
         
         # Возвращаем пустую структуру если файла нет или он поврежден
         return {'users': {}}
     
-    def _save_data(self):
-        """Сохранение данных в файл"""
+    def _load_users(self, data):
+        """Переводит данные в формате JSON во внутреннее представление"""
+        for user_id_str, user_data in data.get('users', {}).items():
+            user = UserRecord(int(user_id_str), user_data.get('username'),
+                              float(user_data.get('threshold', DEFAULT_THRESHOLD)))
+            self._users[user.user_id] = user
+            
+            for coin_name in user_data.get('coins', []):
+                self._subscription(user, coin_name, create=True).tracked = True
+            for coin_name, threshold in user_data.get('coin_thresholds', {}).items():
+                self._subscription(user, coin_name, create=True).threshold = float(threshold)
+            for coin_name, price in user_data.get('last_prices', {}).items():
+                self._subscription(user, coin_name, create=True).last_price = float(price)
+            
+            for subscription in user.subscriptions:
+                if subscription.tracked:
+                    self._coin_index.setdefault(subscription.coin, {})[user.user_id] = subscription
+    
+    def _load_columns(self, columns):
+        """Переводит колонки двоичного снимка во внутреннее представление"""
+        coin_ids = [self._coins.intern(name) for name in columns.coins]
+        names = columns.names
+        lazy = Config.DB_LAZY_USERS
+        if lazy:
+            # Подписки нужны проверке цен сразу, имена - только при показе пользователя
+            self._lazy_names = (columns.user_ids, names)
+        
+        users = self._users
+        index = self._coin_index
+        sub_coins = columns.sub_coins
+        sub_tracked = columns.sub_tracked
+        sub_thresholds = columns.sub_thresholds
+        sub_prices = columns.sub_prices
+        position = 0
+        
+        for i, (user_id, threshold, count) in enumerate(zip(columns.user_ids, columns.thresholds, columns.sub_counts)):
+            user = UserRecord(user_id, UNLOADED if lazy else names.get(i), threshold)
+            users[user_id] = user
+            subscriptions = user.subscriptions
+            
+            for j in range(position, position + count):
+                subscription = Subscription(user, coin_ids[sub_coins[j]])
+                if sub_tracked[j]:
+                    subscription.tracked = True
+                    index.setdefault(subscription.coin, {})[user_id] = subscription
+                value = sub_thresholds[j]
+                if value == value:  # NaN - значения нет
+                    subscription.threshold = value
+                value = sub_prices[j]
+                if value == value:
+                    subscription.last_price = value
+                subscriptions.append(subscription)
+            position += count
+    
+    def _to_columns(self):
+        """Данные в колонках для двоичного снимка (вызывается под блокировкой)"""
+        columns = SnapshotColumns()
+        columns.coins = self._coins.names()
+        
+        for user_id in sorted(self._users):
+            user = self._users[user_id]
+            columns.user_ids.append(user_id)
+            columns.thresholds.append(user.threshold)
+            columns.sub_counts.append(len(user.subscriptions))
+            columns.names.append(self._username_bytes(user))
+            
+            for subscription in user.subscriptions:
+                columns.sub_coins.append(subscription.coin)
+                columns.sub_tracked.append(subscription.tracked)
+                columns.sub_thresholds.append(MISSING if subscription.threshold is None else subscription.threshold)
+                columns.sub_prices.append(MISSING if subscription.last_price is None else subscription.last_price)
+        
+        return columns
+    
+    def _username(self, user):
+        """Имя пользователя; в ленивом режиме читается из снимка при первом обращении"""
+        if user.username is UNLOADED:
+            user_ids, names = self._lazy_names
+            user.username = names.get(bisect_left(user_ids, user.user_id))
+        return user.username
+    
+    def _username_bytes(self, user):
+        """Имя для двоичного снимка; непрочитанное имя копируется как есть"""
+        if user.username is UNLOADED:
+            user_ids, names = self._lazy_names
+            return names.raw(bisect_left(user_ids, user.user_id))
+        return encode_name(user.username)
+    
+    def to_json(self):
+        """Данные в формате users_data.json"""
+        return {'users': {str(user.user_id): self._user_to_json(user) for user in list(self._users.values())}}
+    
+    def _user_to_json(self, user):
+        name = self._coins.name
+        subscriptions = list(user.subscriptions)
+        return {
+            'username': self._username(user),
+            'coins': [name(s.coin) for s in subscriptions if s.tracked],
+            'threshold': user.threshold,
+            'coin_thresholds': {name(s.coin): s.threshold for s in subscriptions if s.threshold is not None},
+            'last_prices': {name(s.coin): s.last_price for s in subscriptions if s.last_price is not None}
+        }
+    
+    def _subscription(self, user, coin_name, create=False):
+        """Запись пользователя по монете; при create=True создается при отсутствии"""
+        coin = self._coins.intern(coin_name) if create else self._coins.get(coin_name)
+        if coin is None:
+            return None
+        
+        for subscription in user.subscriptions:
+            if subscription.coin == coin:
+                return subscription
+        
+        if create:
+            subscription = Subscription(user, coin)
+            user.subscriptions.append(subscription)
+            return subscription
+        return None
+    
+    def _drop_if_empty(self, user, subscription):
+        """Удаляет запись, в которой не осталось данных"""
+        if subscription.is_empty:
+            user.subscriptions.remove(subscription)
+    
+    def _replay_journal(self):
+        """Повторяет записи журнала, сделанные после снимка"""
+        if not os.path.exists(self.journal_path):
+            return
+        
+        replayed = 0
+        self._replaying = True  # без записи в журнал и сообщений о каждом изменении
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        seq, op, *args = json.loads(line)
+                    except ValueError:
+                        # Недописанная последняя строка после сбоя
+                        break
+                    if seq <= self._seq or op not in self.JOURNAL_OPS:
+                        continue
+                    if not replayed and seq > self._seq + 1:
+                        # Журнал уже свернут в более новый снимок, чем загруженный (тот поврежден)
+                        logger.error(f"❌ Журнал начинается с записи #{seq}, а снимок содержит записи "
+                                     f"до #{self._seq}: изменения #{self._seq + 1}-#{seq - 1} потеряны")
+                    getattr(self, op)(*args)
+                    self._seq = seq
+                    replayed += 1
+        finally:
+            self._replaying = False
+        
+        if replayed:
+            logger.info(f"📜 Из журнала повторено изменений: {replayed}")
+    
+    def _log_info(self, message):
+        """Сообщение об изменении; при повторе журнала не пишется (уровень общего логгера не трогаем)"""
+        if not self._replaying:
+            logger.info(message)
+    
+    def _log_debug(self, message):
+        if not self._replaying:
+            logger.debug(message)
+    
+    def _record(self, op, *args):
+        """Дописывает изменение в буфер журнала; на диск его сбросит фоновый поток"""
+        if self._replaying:
+            return
+        
+        with self._journal_lock:
+            self._seq += 1
+            self._journal_buffer.append(
+                json.dumps([self._seq, op, *args], ensure_ascii=False, separators=(',', ':'))
+            )
+            self._pending_mutations += 1
+            pending = self._pending_mutations
+        
+        if pending >= Config.DB_FLUSH_MAX_MUTATIONS:
+            self._flush_event.set()
+    
+    def _flush_loop(self):
+        """Фоновый поток: сбрасывает журнал раз в N мс или после M изменений и сжимает его"""
+        interval = Config.DB_FLUSH_INTERVAL_MS / 1000.0
+        while not self._closed:
+            self._flush_event.wait(interval)
+            self._flush_event.clear()
+            self.flush()
+            
+            try:
+                if os.path.getsize(self.journal_path) > Config.DB_JOURNAL_MAX_BYTES:
+                    self.compact()
+            except OSError:
+                pass
+    
+    def flush(self):
+        """Дописывает накопленные записи журнала в файл (append + fsync)"""
+        with self._flush_lock:
+            with self._journal_lock:
+                records = self._journal_buffer
+                mutations = self._pending_mutations
+                self._journal_buffer = []
+                self._pending_mutations = 0
+            
+            if not records:
+                return
+            
+            started = time.perf_counter()
+            try:
+                with open(self.journal_path, 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(records) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи журнала БД: {e}")
+                # Возвращаем записи в начало буфера - попробуем в следующий раз
+                with self._journal_lock:
+                    self._journal_buffer = records + self._journal_buffer
+                    self._pending_mutations += mutations
+                return
+            
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats['flushes'] += 1
+            self.stats['coalesced_mutations'] += mutations
+            self.stats['last_flush_ms'] = elapsed_ms
+            self.stats['max_flush_ms'] = max(self.stats['max_flush_ms'], elapsed_ms)
+            self.stats['total_flush_ms'] += elapsed_ms
+            logger.debug(f"💾 Журнал сброшен ({mutations} изменений, {elapsed_ms:.1f} мс)")
+    
+    def compact(self):
+        """Сворачивает журнал в новый снимок и очищает журнал"""
+        with self._flush_lock:
+            # Все записи в файле журнала уже отражены в памяти,
+            # поэтому снимок с текущим номером их полностью заменяет
+            # Снимок и номер записи берутся под блокировкой данных и согласованы
+            with self._lock:
+                snapshot = self._to_columns() if self.snapshot_format == 'binary' else self.to_json()
+                seq = self._seq
+            
+            if not self._save_data(snapshot, seq):
+                return
+            
+            try:
+                with open(self.journal_path, 'w', encoding='utf-8') as f:
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                # Не страшно: записи до seq при загрузке будут пропущены
+                logger.error(f"❌ Ошибка очистки журнала БД: {e}")
+                return
+            
+            self.stats['compactions'] += 1
+            logger.info(f"🗜 Журнал БД свернут в снимок (запись #{seq})")
+    
+    def _save_data(self, snapshot, seq):
+        """Атомарное сохранение снимка: временный файл, fsync, переименование"""
+        if self.snapshot_format == 'binary':
+            path = self.snapshot_path
+            payload = binary_snapshot.encode(snapshot, seq)
+        else:
+            path = self.db_path
+            payload = json.dumps({**snapshot, '_journal_seq': seq}, indent=2, ensure_ascii=False).encode('utf-8')
+        
+        tmp_path = f"{path}.tmp"
         try:
-            with open(self.db_path, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, indent=2, ensure_ascii=False)
-            logger.debug("💾 Данные сохранены")
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            
+            # Двоичный снимок читается первым - после перехода на JSON он устарел.
+            # Удаляем его до очистки журнала, поэтому при сбое данные не теряются
+            if path != self.snapshot_path and os.path.exists(self.snapshot_path):
+                os.remove(self.snapshot_path)
+            # Старый JSON после двоичного снимка не обновляется: если снимок
+            # окажется поврежден, он не должен читаться вместо него
+            if path == self.snapshot_path and os.path.exists(self.db_path):
+                os.replace(self.db_path, f"{self.db_path}.migrated")
+            
+            # fsync каталога, чтобы переименование пережило сбой питания
+            dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения БД: {e}")
+            return False
+    
+    def close(self):
+        """Останавливает фоновую запись, сбрасывает журнал и сворачивает его в снимок"""
+        if self._closed:
+            return
+        self._closed = True
+        self._flush_event.set()
+        self._flusher.join(timeout=5)
+        self.flush()
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path):
+            self.compact()
+        logger.info(f"💾 База данных закрыта, статистика записи: {self.stats}")
     
+    @synchronized
     def add_user(self, user_id, username):
         """Добавление нового пользователя"""
-        user_id_str = str(user_id)
-        
-        if user_id_str not in self.data['users']:
-            self.data['users'][user_id_str] = {
-                'username': username,
-                'coins': [],  # Список отслеживаемых монет
-                'threshold': 1.0,  # Общий порог по умолчанию
-                'coin_thresholds': {},  # Индивидуальные пороги для монет
-                'last_prices': {}  # Последние известные цены
-            }
-            self._save_data()
-            logger.info(f"👤 Добавлен новый пользователь: {username} ({user_id})")
+        user_id = int(user_id)
+        
+        if user_id not in self._users:
+            self._users[user_id] = UserRecord(user_id, username)
+            self._record('add_user', str(user_id), username)
+            self._log_info(f"👤 Добавлен новый пользователь: {username} ({user_id})")
             return True
         
-        logger.debug(f"ℹ️ Пользователь уже существует: {username}")
+        self._log_debug(f"ℹ️ Пользователь уже существует: {username}")
         return False
     
+    @synchronized
     def get_user(self, user_id):
-        """Получение данных пользователя"""
-        user_id_str = str(user_id)
-        return self.data['users'].get(user_id_str)
+        """Получение данных пользователя (копия в формате JSON)"""
+        user = self._users.get(int(user_id))
+        return self._user_to_json(user) if user else None
     
+    @synchronized
     def get_user_coins(self, user_id):
         """Получение списка монет пользователя"""
-        user = self.get_user(user_id)
+        user = self._users.get(int(user_id))
         if user:
-            return user.get('coins', [])
+            return [self._coins.name(s.coin) for s in user.subscriptions if s.tracked]
         return []
     
+    @synchronized
     def add_coin(self, user_id, coin_name):
         """Добавление монеты пользователю"""
-        user_id_str = str(user_id)
+        user = self._users.get(int(user_id))
         
-        if user_id_str in self.data['users']:
-            user = self.data['users'][user_id_str]
+        if user:
+            subscription = self._subscription(user, coin_name, create=True)
             
-            if coin_name not in user['coins']:
-                user['coins'].append(coin_name)
-                self._save_data()
-                logger.info(f"✅ Монета '{coin_name}' добавлена пользователю {user_id}")
+            if not subscription.tracked:
+                subscription.tracked = True
+                # Новая монета идет в конец списка
+                user.subscriptions.remove(subscription)
+                user.subscriptions.append(subscription)
+                self._coin_index.setdefault(subscription.coin, {})[user.user_id] = subscription
+                self._touch(subscription.coin)
+                self._record('add_coin', str(user.user_id), coin_name)
+                self._log_info(f"✅ Монета '{coin_name}' добавлена пользователю {user_id}")
                 return True
             else:
-                logger.debug(f"ℹ️ Монета '{coin_name}' уже есть у пользователя {user_id}")
+                self._log_debug(f"ℹ️ Монета '{coin_name}' уже есть у пользователя {user_id}")
                 return False
         
         logger.warning(f"⚠️ Пользователь {user_id} не найден")
         return False
     
+    @synchronized
     def remove_coin(self, user_id, coin_name):
         """Удаление монеты у пользователя"""
-        user_id_str = str(user_id)
+        user = self._users.get(int(user_id))
         
-        if user_id_str in self.data['users']:
-            user = self.data['users'][user_id_str]
+        if user:
+            subscription = self._subscription(user, coin_name)
             
-            if coin_name in user['coins']:
-                user['coins'].remove(coin_name)
-                
-                # Удаляем индивидуальный порог если есть
-                if coin_name in user.get('coin_thresholds', {}):
-                    del user['coin_thresholds'][coin_name]
-                
-                # Удаляем последнюю цену если есть
-                if coin_name in user.get('last_prices', {}):
-                    del user['last_prices'][coin_name]
-                
-                self._save_data()
-                logger.info(f"🗑 Монета '{coin_name}' удалена у пользователя {user_id}")
+            if subscription and subscription.tracked:
+                # Вместе с монетой удаляются индивидуальный порог и последняя цена
+                user.subscriptions.remove(subscription)
+                self._unindex(user.user_id, subscription.coin)
+                self._touch(subscription.coin)
+                self._record('remove_coin', str(user.user_id), coin_name)
+                self._log_info(f"🗑 Монета '{coin_name}' удалена у пользователя {user_id}")
                 return True
         
         return False
     
+    def _touch(self, coin, prices_only=False):
+        """Отмечает изменение подписчиков монеты; prices_only - изменились только последние цены"""
+        self._coin_versions[coin] = self._coin_versions.get(coin, 0) + 1
+        if not prices_only:
+            self._subscription_versions[coin] = self._subscription_versions.get(coin, 0) + 1
+    
+    def _unindex(self, user_id, coin):
+        """Удаляет подписку из обратного индекса"""
+        subscribers = self._coin_index.get(coin)
+        if subscribers is not None:
+            subscribers.pop(user_id, None)
+            if not subscribers:
+                del self._coin_index[coin]
+    
+    @synchronized
     def set_threshold(self, user_id, threshold):
         """Установка общего порога для пользователя"""
-        user_id_str = str(user_id)
+        user = self._users.get(int(user_id))
         
-        if user_id_str in self.data['users']:
-            self.data['users'][user_id_str]['threshold'] = float(threshold)
-            self._save_data()
-            logger.info(f"⚙️ Общий порог установлен: {threshold}% для {user_id}")
+        if user:
+            # Подписки без индивидуального порога ссылаются на пользователя,
+            # поэтому обратный индекс обновлять не нужно
+            user.threshold = float(threshold)
+            for subscription in user.subscriptions:
+                self._touch(subscription.coin)
+            self._record('set_threshold', str(user.user_id), float(threshold))
+            self._log_info(f"⚙️ Общий порог установлен: {threshold}% для {user_id}")
             return True
         
         return False
     
+    @synchronized
     def set_coin_threshold(self, user_id, coin_name, threshold):
         """Установка индивидуального порога для монеты"""
-        user_id_str = str(user_id)
+        user = self._users.get(int(user_id))
         
-        if user_id_str in self.data['users']:
-            user = self.data['users'][user_id_str]
-            
-            # Создаем словарь если его нет
-            if 'coin_thresholds' not in user:
-                user['coin_thresholds'] = {}
-            
-            user['coin_thresholds'][coin_name] = float(threshold)
-            self._save_data()
-            logger.info(f"🔸 Индивидуальный порог для {coin_name}: {threshold}%")
+        if user:
+            subscription = self._subscription(user, coin_name, create=True)
+            subscription.threshold = float(threshold)
+            self._touch(subscription.coin)
+            self._record('set_coin_threshold', str(user.user_id), coin_name, float(threshold))
+            self._log_info(f"🔸 Индивидуальный порог для {coin_name}: {threshold}%")
             return True
         
         return False
     
+    @synchronized
     def get_coin_threshold(self, user_id, coin_name):
         """Получение порога для монеты (индивидуальный или общий)"""
-        user = self.get_user(user_id)
+        user = self._users.get(int(user_id))
         if not user:
-            return 1.0  # Значение по умолчанию
+            return DEFAULT_THRESHOLD  # Значение по умолчанию
         
-        # Проверяем индивидуальный порог
-        if coin_name in user.get('coin_thresholds', {}):
-            return user['coin_thresholds'][coin_name]
-        
-        # Возвращаем общий порог
-        return user.get('threshold', 1.0)
+        subscription = self._subscription(user, coin_name)
+        if subscription:
+            return subscription.effective_threshold
+        return user.threshold
+    
+    @synchronized
+    def has_individual_threshold(self, user_id, coin_name):
+        """Проверка, задан ли для монеты индивидуальный порог"""
+        user = self._users.get(int(user_id))
+        subscription = self._subscription(user, coin_name) if user else None
+        return bool(subscription) and subscription.threshold is not None
     
+    @synchronized
     def update_price(self, user_id, coin_name, price):
         """Обновление последней известной цены"""
-        user_id_str = str(user_id)
+        user = self._users.get(int(user_id))
         
-        if user_id_str in self.data['users']:
-            user = self.data['users'][user_id_str]
-            
-            # Создаем словарь если его нет
-            if 'last_prices' not in user:
-                user['last_prices'] = {}
-            
-            user['last_prices'][coin_name] = float(price)
-            self._save_data()
-            logger.debug(f"💰 Обновлена цена {coin_name}: ${price}")
+        if user:
+            subscription = self._subscription(user, coin_name, create=True)
+            subscription.last_price = float(price)
+            self._touch(subscription.coin, prices_only=True)
+            self._record('update_price', str(user.user_id), coin_name, float(price))
+            self._log_debug(f"💰 Обновлена цена {coin_name}: ${price}")
             return True
         
         return False
     
+    @synchronized
+    def update_prices(self, updates):
+        """
+        Обновление последних цен пачкой (например, всех сработавших подписок за тик)
+        
+        Args:
+            updates: итерируемое из (user_id, coin_name, price)
+        
+        Returns:
+            сколько цен обновлено (пользователи, которых нет, пропускаются)
+        """
+        applied = []
+        coins = set()
+        for user_id, coin_name, price in updates:
+            # Версия монеты растет ровно на 1 за вызов, даже если пользователя уже нет
+            coins.add(self._coins.intern(coin_name))
+            user = self._users.get(int(user_id))
+            if user:
+                self._subscription(user, coin_name, create=True).last_price = float(price)
+                applied.append([user.user_id, coin_name, float(price)])
+        
+        for coin in coins:
+            self._touch(coin, prices_only=True)
+        
+        # Одна запись журнала на всю пачку
+        if applied:
+            self._record('update_prices', applied)
+            self._log_debug(f"💰 Обновлено цен: {len(applied)}")
+        return len(applied)
+    
+    @synchronized
     def get_last_price(self, user_id, coin_name):
         """Получение последней известной цены"""
-        user = self.get_user(user_id)
-        if user and coin_name in user.get('last_prices', {}):
-            return user['last_prices'][coin_name]
-        return None
+        user = self._users.get(int(user_id))
+        subscription = self._subscription(user, coin_name) if user else None
+        return subscription.last_price if subscription else None
     
+    @synchronized
     def get_all_users(self):
         """Получение списка всех пользователей"""
-        return list(self.data['users'].keys())
+        return [str(user_id) for user_id in self._users]
+    
+    @synchronized
+    def get_all_users_coins(self):
+        """Список всех отслеживаемых монет без повторов (из обратного индекса)"""
+        return [self._coins.name(coin) for coin in self._coin_index]
+    
+    @synchronized
+    def get_users_for_coin(self, coin_name):
+        """Подписчики монеты с действующим порогом и последней ценой"""
+        coin = self._coins.get(coin_name)
+        subscribers = self._coin_index.get(coin, {}) if coin is not None else {}
+        return [
+            {'user_id': user_id, 'threshold': s.effective_threshold, 'last_price': s.last_price}
+            for user_id, s in subscribers.items()
+        ]
+    
+    @synchronized
+    def get_coin_versions(self, coin_names):
+        """Версии данных подписчиков монет: {монета: версия}"""
+        versions = {}
+        for coin_name in coin_names:
+            coin = self._coins.get(coin_name)
+            versions[coin_name] = self._coin_versions.get(coin, 0) if coin is not None else 0
+        return versions
+    
+    @synchronized
+    def get_subscription_versions(self, coin_names):
+        """Версии подписок и порогов монет: {монета: версия}; обновления цен их не меняют"""
+        versions = {}
+        for coin_name in coin_names:
+            coin = self._coins.get(coin_name)
+            versions[coin_name] = self._subscription_versions.get(coin, 0) if coin is not None else 0
+        return versions
+    
+    @synchronized
+    def get_coin_subscribers(self, coin_name):
+        """
+        Подписчики монеты по колонкам (для ThresholdEngine)
+        
+        Returns:
+            (версия, id пользователей, действующие пороги, последние цены или None)
+        """
+        coin = self._coins.get(coin_name)
+        subscribers = self._coin_index.get(coin, {}) if coin is not None else {}
+        version = self._coin_versions.get(coin, 0) if coin is not None else 0
+        return (
+            version,
+            list(subscribers),
+            [s.effective_threshold for s in subscribers.values()],
+            [s.last_price for s in subscribers.values()]
+        )
     
+    @synchronized
     def has_coin(self, user_id, coin_name):
         """Проверка, есть ли у пользователя монета"""
-        user = self.get_user(user_id)
-        if user:
-            return coin_name in user.get('coins', [])
-        return False
+        user = self._users.get(int(user_id))
+        subscription = self._subscription(user, coin_name) if user else None
+        return bool(subscription) and subscription.tracked
     
+    @synchronized
     def remove_individual_threshold(self, user_id, coin_name):
         """Удаление индивидуального порога"""
-        user_id_str = str(user_id)
+        user = self._users.get(int(user_id))
+        subscription = self._subscription(user, coin_name) if user else None
         
-        if user_id_str in self.data['users']:
-            user = self.data['users'][user_id_str]
-            
-            if 'coin_thresholds' in user and coin_name in user['coin_thresholds']:
-                del user['coin_thresholds'][coin_name]
-                self._save_data()
-                logger.info(f"🗑 Удален инд. порог для {coin_name}")
-                return True
+        if subscription and subscription.threshold is not None:
+            subscription.threshold = None
+            self._drop_if_empty(user, subscription)
+            self._touch(subscription.coin)
+            self._record('remove_individual_threshold', str(user.user_id), coin_name)
+            self._log_info(f"🗑 Удален инд. порог для {coin_name}")
+            return True
         
         return False
     
+    @synchronized
     def clear_user_data(self, user_id):
         """Очистка всех данных пользователя"""
-        user_id_str = str(user_id)
+        user = self._users.pop(int(user_id), None)
         
-        if user_id_str in self.data['users']:
-            del self.data['users'][user_id_str]
-            self._save_data()
-            logger.info(f"🧹 Данные пользователя {user_id} очищены")
+        if user:
+            for subscription in user.subscriptions:
+                self._unindex(user.user_id, subscription.coin)
+                self._touch(subscription.coin)
+            self._record('clear_user_data', str(user.user_id))
+            self._log_info(f"🧹 Данные пользователя {user_id} очищены")
             return True
         
         return False
 
-# Создаем глобальный объект базы данных
-db = Database()
\ No newline at end of file
+def create_database():
+    """Создает хранилище выбранного в настройках типа (json или sqlite)"""
+    if Config.DB_BACKEND == 'sqlite':
+        from sqlite_database import SQLiteDatabase
+        return SQLiteDatabase()
+    return Database()
+
+class AsyncDatabase:
+    """
+    Асинхронный фасад хранилища для бота и потока проверки цен
+
+    Метод хранилища вызывается как корутина: await async_db.add_coin(...).
+    Если хранилище работает только с памятью и его блокировка свободна,
+    операция выполняется сразу; иначе - в пуле потоков, чтобы цикл событий
+    не ждал другой поток или диск.
+    """
+    
+    def __init__(self, store):
+        self.store = store
+        self.stats = {'inline': 0, 'offloaded': 0}
+    
+    def __getattr__(self, name):
+        method = getattr(self.store, name)
+        if name.startswith('_') or not callable(method):
+            raise AttributeError(name)
+        
+        async def call(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+        
+        call.__name__ = name
+        setattr(self, name, call)  # при следующем обращении __getattr__ не нужен
+        return call
+    
+    async def run(self, method, *args, **kwargs):
+        """Выполняет метод хранилища, не блокируя цикл событий"""
+        store = self.store
+        if getattr(store, 'IN_MEMORY', False) and store._lock.acquire(blocking=False):
+            try:
+                self.stats['inline'] += 1
+                return method(*args, **kwargs)
+            finally:
+                store._lock.release()
+        
+        self.stats['offloaded'] += 1
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+# Создаем глобальный объект базы данных и асинхронный доступ к нему
+db = create_database()
+async_db = AsyncDatabase(db)
\ No newline at end of file
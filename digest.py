@@ -0,0 +1,173 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from threshold_engine import Alert
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+def format_alert(alert: Alert) -> str:
+    """Текст отдельного уведомления об изменении цены"""
+    # Определяем направление изменения
+    if alert.new_price > alert.old_price:
+        direction = "📈 РОСТ"
+        emoji = "🟢"
+    else:
+        direction = "📉 ПАДЕНИЕ"
+        emoji = "🔴"
+
+    return (
+        f"{emoji} *УВЕДОМЛЕНИЕ О ЦЕНЕ*\n\n"
+        f"*Монета:* {alert.coin.upper()}\n"
+        f"*Изменение:* {direction}\n"
+        f"*Процент:* {alert.change_percent:.2f}%\n\n"
+        f"*Было:* ${alert.old_price:.4f}\n"
+        f"*Стало:* ${alert.new_price:.4f}\n"
+        f"*Разница:* ${abs(alert.new_price - alert.old_price):.4f}\n\n"
+        f"_Время: {datetime.now().strftime('%H:%M:%S')}_"
+    )
+
+def format_change(coin_name: str, last_price: float, current_price: float, price_change: float) -> str:
+    """Строки одной монеты в сводке изменений (как в «Проверить изменения»)"""
+    direction = "📈" if current_price > last_price else "📉"
+    dir_text = "РОСТ" if current_price > last_price else "ПАДЕНИЕ"
+    return (
+        f"\n{direction} *{coin_name.upper()}* - {dir_text}\n"
+        f"   Изменение: *{price_change:.2f}%*\n"
+        f"   Было: ${last_price:.4f}\n"
+        f"   Стало: ${current_price:.4f}\n"
+    )
+
+def format_digest(alerts: List[Alert]) -> List[str]:
+    """
+    Сводка нескольких уведомлений пользователя
+
+    Returns:
+        Тексты сообщений: сводка делится, если не помещается в одно сообщение
+    """
+    return [text for text, _ in _digest_parts(alerts)]
+
+def _digest_parts(alerts: List[Alert]) -> List[Tuple[str, List[str]]]:
+    """Сообщения сводки и монеты каждого из них"""
+    footer = f"\n_Время: {datetime.now().strftime('%H:%M:%S')}_"
+    header = f"🔔 *Обнаружены изменения!*\n\nНайдено изменений: *{len(alerts)}*\n"
+    parts, text, coins = [], header, []
+
+    # Сначала самые сильные изменения
+    for alert in sorted(alerts, key=lambda a: a.change_percent, reverse=True):
+        block = format_change(alert.coin, alert.old_price, alert.new_price, alert.change_percent)
+        if len(text) + len(block) + len(footer) > MESSAGE_LIMIT:
+            parts.append((text, coins))
+            text, coins = "🔔 *Изменения (продолжение)*\n", []
+        text += block
+        coins.append(alert.coin)
+    parts.append((text + footer, coins))
+    return parts
+
+class DigestCollector:
+    """
+    Сводки уведомлений по пользователям
+
+    Сработавшие подписки пользователя копятся DIGEST_WINDOW секунд от первой
+    из них (0 - до конца тика) и уходят одним сообщением в формате сводки
+    «Проверить изменения». Если монета сработала в окне повторно, в сводке
+    остается изменение от первой старой цены до последней. Изменение от
+    DIGEST_URGENT_PERCENT и больше отправляется сразу отдельным сообщением.
+    Ключи уведомлений (см. Outbox) передаются в рассылку вместе с сообщением,
+    в которое попала монета, в том числе ключи объединенных повторов.
+    """
+
+    def __init__(self, notifier, window: float = None, urgent_percent: float = None):
+        self.notifier = notifier
+        self.window = Config.DIGEST_WINDOW if window is None else window
+        self.urgent_percent = Config.DIGEST_URGENT_PERCENT if urgent_percent is None else urgent_percent
+
+        # Пользователь -> {монета: уведомление}, {монета: ключи}, время обнаружения первого и таймер окна
+        self._pending: Dict[int, Dict[str, Alert]] = {}
+        self._keys: Dict[int, Dict[str, List[int]]] = {}
+        self._detected_at: Dict[int, float] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+
+        self.stats = {
+            'alerts': 0,    # сработавших подписок
+            'urgent': 0,    # отправлено сразу
+            'digests': 0,   # сводок из нескольких монет
+            'messages': 0   # сообщений поставлено в рассылку
+        }
+
+    def add(self, alert: Alert, detected_at: float, key: Optional[int] = None):
+        """Добавляет сработавшую подписку в сводку пользователя"""
+        self.stats['alerts'] += 1
+        alerts = self._pending.get(alert.user_id, {})
+        keys = self._keys.get(alert.user_id, {})
+        coin_keys = keys.pop(alert.coin, [])
+        if key is not None:
+            coin_keys.append(key)
+        previous = alerts.get(alert.coin)
+        if previous is not None:
+            change = abs((alert.new_price - previous.old_price) / previous.old_price * 100)
+            alert = alert._replace(old_price=previous.old_price, change_percent=change)
+
+        if self.urgent_percent and alert.change_percent >= self.urgent_percent:
+            alerts.pop(alert.coin, None)
+            self.stats['urgent'] += 1
+            self._send(alert.user_id, format_alert(alert), detected_at, coin_keys)
+            if not alerts:
+                self._discard(alert.user_id)
+            return
+
+        if alert.user_id not in self._pending:
+            self._pending[alert.user_id] = alerts
+            self._keys[alert.user_id] = keys
+            self._detected_at[alert.user_id] = detected_at
+            if self.window > 0:
+                self._timers[alert.user_id] = asyncio.get_running_loop().call_later(
+                    self.window, self.flush_user, alert.user_id
+                )
+        alerts[alert.coin] = alert
+        keys[alert.coin] = coin_keys
+
+    def end_tick(self):
+        """Конец тика: без окна сводки отправляются сразу"""
+        if self.window <= 0:
+            self.flush()
+
+    def flush(self):
+        """Отправляет все накопленные сводки"""
+        for user_id in list(self._pending):
+            self.flush_user(user_id)
+
+    def flush_user(self, user_id: int):
+        """Отправляет сводку пользователя"""
+        alerts = list(self._pending.get(user_id, {}).values())
+        keys = self._keys.get(user_id, {})
+        detected_at = self._detected_at.get(user_id)
+        self._discard(user_id)
+        if not alerts:
+            return
+
+        if len(alerts) == 1:
+            parts = [(format_alert(alerts[0]), [alerts[0].coin])]
+        else:
+            parts = _digest_parts(alerts)
+            self.stats['digests'] += 1
+        for text, coins in parts:
+            self._send(user_id, text, detected_at, [key for coin in coins for key in keys.get(coin, ())])
+        logger.debug(f"Сводка пользователю {user_id}: монет {len(alerts)}, сообщений {len(parts)}")
+
+    def _discard(self, user_id: int):
+        self._pending.pop(user_id, None)
+        self._keys.pop(user_id, None)
+        self._detected_at.pop(user_id, None)
+        timer = self._timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _send(self, user_id: int, text: str, detected_at: float, keys: List[int]):
+        self.stats['messages'] += 1
+        self.notifier.notify(user_id, text, detected_at=detected_at, keys=keys)
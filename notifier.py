@@ -0,0 +1,261 @@
+import time
+import heapq
+import random
+import asyncio
+import logging
+from collections import deque
+from datetime import timedelta
+from typing import Callable, Dict, Optional, Sequence
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from config import Config
+from rate_limiter import RequestScheduler
+
+logger = logging.getLogger(__name__)
+
+class Notification:
+    """Сообщение в очереди рассылки"""
+
+    __slots__ = ('chat_id', 'text', 'parse_mode', 'detected_at', 'attempts', 'keys')
+
+    def __init__(self, chat_id: int, text: str, parse_mode: Optional[str], detected_at: float,
+                 keys: Sequence[int] = ()):
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.detected_at = detected_at
+        self.attempts = 0
+        self.keys = keys  # номера уведомлений в очереди на диске (см. Outbox)
+
+def retry_after_seconds(value) -> float:
+    """RetryAfter.retry_after: секунды или timedelta (в новых версиях библиотеки)"""
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+class Notifier:
+    """
+    Рассылка уведомлений с ограничением частоты
+
+    Сообщения ставятся в очередь своего чата и отправляются несколькими
+    воркерами параллельно. Общий поток ограничен token bucket (Telegram
+    разрешает боту около 30 сообщений в секунду), а сообщения в один чат
+    уходят по порядку и не чаще раза в NOTIFY_CHAT_INTERVAL секунд.
+    RetryAfter приостанавливает всю рассылку на указанное время; медленный
+    или недоступный чат занимает одного воркера и не задерживает остальных.
+    Итог каждого сообщения передается в on_done(сообщение, итог): sent -
+    доставлено, rejected - отклонено Telegram, failed - можно повторить позже.
+    """
+
+    def __init__(self, bot, rate_per_second: float = None, chat_interval: float = None,
+                 workers: int = None, max_retries: int = None, queue_limit: int = None,
+                 on_done: Callable[[Notification, str], None] = None):
+        self.bot = bot
+        self.on_done = on_done
+        rate = rate_per_second or Config.NOTIFY_RATE_PER_SECOND
+        self.chat_interval = Config.NOTIFY_CHAT_INTERVAL if chat_interval is None else chat_interval
+        self.workers = workers or Config.NOTIFY_WORKERS
+        self.max_retries = Config.NOTIFY_MAX_RETRIES if max_retries is None else max_retries
+        self.queue_limit = queue_limit or Config.NOTIFY_QUEUE_LIMIT
+
+        # Без запаса на всплеск: Telegram считает сообщения за скользящую секунду.
+        # Каждый воркер ждет токен не больше чем за одно сообщение.
+        self.limiter = RequestScheduler(rate_per_minute=rate * 60, burst=1, queue_limit=self.workers)
+
+        # Чат -> очередь сообщений. Чат есть в словаре, пока у него есть
+        # сообщения или не прошел интервал после последней отправки, и в каждый
+        # момент либо ждет своей очереди в _ready, либо обрабатывается воркером
+        self._chats: Dict[int, deque] = {}
+        self._ready = []  # куча (когда можно отправлять, номер, чат)
+        self._sequence = 0
+        self._pending = 0
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._tasks = []
+
+        self._latencies = deque(maxlen=1000)  # от обнаружения до доставки
+        self.stats = {
+            'queued': 0,     # сообщений поставлено в очередь
+            'sent': 0,       # доставлено
+            'failed': 0,     # не доставлено (бот заблокирован, ошибка запроса, исчерпаны попытки)
+            'retried': 0,    # повторов после сетевых ошибок
+            'throttled': 0,  # ответов RetryAfter
+            'dropped': 0     # отброшено из-за переполненной очереди
+        }
+
+    def _start(self):
+        """Запускает воркеров в текущем цикле событий"""
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def notify(self, chat_id: int, text: str, parse_mode: Optional[str] = 'Markdown',
+               detected_at: float = None, keys: Sequence[int] = ()) -> bool:
+        """
+        Ставит сообщение в очередь рассылки
+
+        Args:
+            detected_at: время обнаружения события (time.monotonic()) для метрики задержки
+            keys: номера уведомлений в очереди, которые передаются в on_done вместе с итогом
+
+        Returns:
+            False, если очередь переполнена и сообщение отброшено
+        """
+        if not self._tasks:
+            self._start()
+        notification = Notification(chat_id, text, parse_mode, detected_at or time.monotonic(), keys)
+        if self._pending >= self.queue_limit:
+            self.stats['dropped'] += 1
+            logger.warning(f"Очередь уведомлений переполнена, сообщение для {chat_id} отброшено")
+            self._done(notification, 'failed')
+            return False
+
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            self._chats[chat_id] = deque([notification])
+            self._schedule(chat_id, time.monotonic())
+        else:
+            queue.append(notification)
+
+        self._pending += 1
+        self._idle.clear()
+        self.stats['queued'] += 1
+        return True
+
+    def _schedule(self, chat_id: int, ready_at: float):
+        self._sequence += 1
+        heapq.heappush(self._ready, (ready_at, self._sequence, chat_id))
+        self._wakeup.set()
+
+    async def _next_chat(self) -> int:
+        """Ждет чат, в который уже можно отправлять"""
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._ready[0][0] - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            return heapq.heappop(self._ready)[2]
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._next_chat()
+            queue = self._chats[chat_id]
+            if not queue:
+                # Интервал после последнего сообщения прошел
+                del self._chats[chat_id]
+                continue
+
+            notification = queue[0]
+            try:
+                retry_in = await self._send(notification)
+            except Exception as e:
+                logger.error(f"Ошибка при отправке уведомления пользователю {chat_id}: {e}")
+                self.stats['failed'] += 1
+                self._done(notification, 'failed')
+                retry_in = None
+
+            if retry_in is None:
+                queue.popleft()
+                self._pending -= 1
+                if not self._pending:
+                    self._idle.set()
+                retry_in = self.chat_interval
+            self._schedule(chat_id, time.monotonic() + retry_in)
+
+    async def _send(self, notification: Notification) -> Optional[float]:
+        """
+        Отправляет сообщение
+
+        Returns:
+            None, если сообщение обработано (доставлено или отброшено),
+            иначе через сколько секунд повторить
+        """
+        await self.limiter.acquire()
+        try:
+            await self.bot.send_message(
+                chat_id=notification.chat_id,
+                text=notification.text,
+                parse_mode=notification.parse_mode
+            )
+        except RetryAfter as e:
+            delay = retry_after_seconds(e.retry_after)
+            self.limiter.pause(delay)
+            self.stats['throttled'] += 1
+            logger.warning(f"⏳ Telegram ограничил рассылку, пауза {delay:.1f} сек")
+            return delay
+        except (BadRequest, Forbidden) as e:
+            # Бот заблокирован, чат удален или сообщение некорректно - повтор не поможет
+            self.stats['failed'] += 1
+            logger.warning(f"Уведомление пользователю {notification.chat_id} не доставлено: {e}")
+            self._done(notification, 'rejected')
+            return None
+        except NetworkError as e:
+            # В том числе TimedOut: сообщение могло дойти, повтор возможен дублем
+            notification.attempts += 1
+            if notification.attempts > self.max_retries:
+                self.stats['failed'] += 1
+                logger.error(f"Уведомление пользователю {notification.chat_id} не доставлено "
+                             f"после {notification.attempts} попыток: {e}")
+                self._done(notification, 'failed')
+                return None
+            self.stats['retried'] += 1
+            return random.uniform(0, min(30.0, 2 ** notification.attempts))
+
+        self.stats['sent'] += 1
+        self._latencies.append(time.monotonic() - notification.detected_at)
+        logger.debug(f"Отправлено уведомление пользователю {notification.chat_id}")
+        self._done(notification, 'sent')
+        return None
+
+    def _done(self, notification: Notification, outcome: str):
+        if self.on_done is not None:
+            self.on_done(notification, outcome)
+
+    async def join(self, timeout: float = None) -> bool:
+        """Ждет, пока очередь опустеет; False, если не успела за timeout"""
+        if self._idle is None:
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self, timeout: float = 10.0):
+        """Дожидается отправки очереди (не дольше timeout) и останавливает воркеров"""
+        if not await self.join(timeout):
+            logger.warning(f"Не отправлено уведомлений при остановке: {self._pending}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Перцентиль задержки от обнаружения до доставки или None, если данных нет"""
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+    def get_stats(self) -> dict:
+        """Статистика рассылки для логов и метрик"""
+        return {
+            'pending': self._pending,
+            'p50': self.latency_percentile(50),
+            'p99': self.latency_percentile(99),
+            **self.stats
+        }
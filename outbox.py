@@ -0,0 +1,305 @@
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import AbstractSet, List, Optional, Set, Tuple
+
+from config import Config
+from threshold_engine import Alert
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id           INTEGER PRIMARY KEY,
+    key          TEXT NOT NULL,
+    user_id      INTEGER NOT NULL,
+    coin         TEXT NOT NULL,
+    old_price    REAL NOT NULL,
+    new_price    REAL NOT NULL,
+    change       REAL NOT NULL,
+    created_at   REAL NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'pending',
+    done_at      REAL,
+    anchored     INTEGER NOT NULL DEFAULT 0,
+    owner        INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_key ON outbox(key) WHERE anchored = 0;
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(owner, status, next_attempt);
+"""
+
+# Как часто удаляются обработанные уведомления (сек)
+PURGE_INTERVAL = 60
+
+def alert_key(alert: Alert) -> str:
+    """
+    Ключ идемпотентности уведомления: пользователь, монета и тик
+
+    Тик задается последней ценой подписки (якорем), от которой считалось
+    изменение: номер тика после перезапуска другой, а якорь тот же, пока
+    новая цена не сохранена. Повторное обнаружение того же срабатывания
+    дает тот же ключ. После сохранения цены якорь может вернуться к
+    прежнему значению, поэтому ключ сравнивается только до mark_anchored.
+    """
+    return f"{alert.user_id}:{alert.coin}:{alert.old_price!r}"
+
+class Outbox:
+    """
+    Очередь уведомлений на диске (SQLite)
+
+    Сработавшие подписки записываются в очередь до того, как сдвигаются их
+    последние цены, и удаляются из нее только после доставки. Если процесс
+    упал или Telegram не принял сообщение, уведомление остается в очереди и
+    отправляется снова через OUTBOX_RETRY_BASE * 2^попытки секунд (не больше
+    OUTBOX_RETRY_MAX), пока не кончатся OUTBOX_MAX_ATTEMPTS попыток.
+    Уведомление с уже известным ключом (см. alert_key) второй раз не
+    ставится, пока его новая цена не сохранена (mark_anchored); если цена так
+    и не сохранилась, ключ доставленного помнится OUTBOX_DEDUP_WINDOW секунд.
+    Рассылает уведомления Notifier (через DigestCollector) с номерами строк
+    очереди, итог отправки приходит в on_done. Пока итога нет, уведомление
+    в рассылке и повторно не берется, сколько бы оно ни ждало в Notifier.
+    
+    Воркеры проверки цен пишут в одну общую очередь: ключи сравниваются у всех,
+    поэтому после переезда шарда новый владелец не повторяет уведомление
+    прежнего. Повторно отправляет уведомление тот, кто его поставил (owner -
+    номер воркера; перезапущенный воркер получает тот же номер).
+    """
+
+    def __init__(self, path: str = None, owner: int = 0):
+        self.path = path or self.default_path()
+        self.owner = owner
+        self._conn = None
+        self._lock = threading.Lock()
+        self._results: List[Tuple[List[int], str]] = []  # итоги отправки, еще не записанные
+        self._in_flight: Set[int] = set()  # номера уведомлений в рассылке (в сводке или у Notifier)
+        self._purged_at = 0.0
+        self.stats = {
+            'enqueued': 0,    # уведомлений поставлено в очередь
+            'duplicates': 0,  # не поставлено: ключ уже есть
+            'anchored': 0,    # новая цена сохранена, ключ больше не сравнивается
+            'recovered': 0,   # осталось в очереди с прошлого запуска
+            'resent': 0,      # поставлено в рассылку повторно
+            'sent': 0,        # доставлено
+            'failed': 0       # не доставлено окончательно
+        }
+
+    @staticmethod
+    def default_path(suffix: str = '') -> str:
+        """Путь файла очереди; suffix отличает очереди процессов-воркеров"""
+        if Config.OUTBOX_PATH:
+            base, ext = os.path.splitext(Config.OUTBOX_PATH)
+            return f"{base}{suffix}{ext}"
+        if os.path.exists('/tmp'):  # Railway использует /tmp для записи
+            return f"/tmp/notify_outbox{suffix}.sqlite3"
+        return os.path.join(os.path.dirname(__file__), f"notify_outbox{suffix}.sqlite3")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открывает очередь при первом обращении; уведомления прошлого запуска - к отправке"""
+        if self._conn is None:
+            # Очередь воркеров общая: запись ждет других процессов до timeout секунд
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            # Все свое, что ждет отправки, отправлял прежний процесс с этим номером
+            recovered = conn.execute("UPDATE outbox SET next_attempt = ? WHERE status = 'pending' AND owner = ?",
+                                     (time.time(), self.owner)).rowcount
+            if recovered:
+                self.stats['recovered'] += recovered
+                logger.info(f"📬 В очереди уведомлений с прошлого запуска: {recovered}")
+            self._conn = conn
+        return self._conn
+
+    def _insert(self, alerts: List[Alert], keys: List[str]) -> List[Optional[int]]:
+        now = time.time()
+        # Уведомление сразу уходит в рассылку: до OUTBOX_RETRY_MAX _take_due его не перебирает
+        lease = now + Config.OUTBOX_RETRY_MAX
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                inserted = []
+                for alert, key in zip(alerts, keys):
+                    # Ключ уникален только среди строк без сохраненной цены (idx_outbox_key)
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO outbox (key, user_id, coin, old_price, new_price, change, "
+                        "created_at, next_attempt, owner) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (key, alert.user_id, alert.coin, alert.old_price, alert.new_price,
+                         alert.change_percent, now, lease, self.owner)
+                    )
+                    inserted.append(cursor.lastrowid if cursor.rowcount == 1 else None)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return inserted
+
+    async def put(self, alerts: List[Alert]) -> List[Tuple[int, Alert]]:
+        """
+        Записывает сработавшие подписки в очередь
+
+        Returns:
+            Новые уведомления с номерами их строк; уже известные не возвращаются
+        """
+        if not alerts:
+            return []
+        keys = [alert_key(alert) for alert in alerts]
+        inserted = await asyncio.to_thread(self._insert, alerts, keys)
+        new = [(row_id, alert) for row_id, alert in zip(inserted, alerts) if row_id is not None]
+        self._in_flight.update(row_id for row_id, _ in new)
+        self.stats['enqueued'] += len(new)
+        self.stats['duplicates'] += len(alerts) - len(new)
+        return new
+
+    def _anchor(self, keys: List[str]) -> int:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                anchored = conn.executemany("UPDATE outbox SET anchored = 1 WHERE key = ? AND anchored = 0",
+                                            [(key,) for key in keys]).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return anchored
+
+    async def mark_anchored(self, alerts: List[Alert]):
+        """
+        Новые цены сработавших подписок сохранены: их ключи больше не сравниваются
+
+        Вызывается после engine.save. Уведомления остаются в очереди до доставки,
+        а то же срабатывание, если якорь вернется к прежней цене, снова новое.
+        """
+        if alerts:
+            self.stats['anchored'] += await asyncio.to_thread(self._anchor, [alert_key(alert) for alert in alerts])
+
+    def on_done(self, notification, outcome: str):
+        """Итог отправки сообщения (вызывается Notifier); записывается в run() или close()"""
+        if notification.keys:
+            self._results.append((notification.keys, outcome))
+
+    def _apply(self, results: List[Tuple[List[int], str]]):
+        """Записывает итоги отправки: доставлено, отклонено или повторить позже"""
+        now = time.time()
+        done, rejected, failed = [], [], []
+        for row_ids, outcome in results:
+            target = done if outcome == 'sent' else rejected if outcome == 'rejected' else failed
+            target.extend(row_ids)
+
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("UPDATE outbox SET status = 'sent', done_at = ? "
+                                 "WHERE id = ? AND status = 'pending'", [(now, row_id) for row_id in done])
+                conn.executemany("UPDATE outbox SET status = 'failed', done_at = ? "
+                                 "WHERE id = ? AND status = 'pending'", [(now, row_id) for row_id in rejected])
+                conn.executemany(
+                    "UPDATE outbox SET attempts = attempts + 1, "
+                    "next_attempt = ? + MIN(?, ? * (1 << attempts)) WHERE id = ? AND status = 'pending'",
+                    [(now, Config.OUTBOX_RETRY_MAX, Config.OUTBOX_RETRY_BASE, row_id) for row_id in failed]
+                )
+                exhausted = conn.executemany(
+                    "UPDATE outbox SET status = 'failed', done_at = ? "
+                    "WHERE id = ? AND status = 'pending' AND attempts >= ?",
+                    [(now, row_id, Config.OUTBOX_MAX_ATTEMPTS) for row_id in failed]
+                ).rowcount if failed else 0
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        self.stats['sent'] += len(done)
+        self.stats['failed'] += len(rejected) + exhausted
+        if exhausted:
+            logger.error(f"Уведомлений не доставлено после {Config.OUTBOX_MAX_ATTEMPTS} попыток: {exhausted}")
+
+    def _take_due(self, in_flight: AbstractSet[int]) -> List[Tuple[int, Alert]]:
+        """Уведомления, которым пора отправляться снова, кроме тех, что еще в рассылке"""
+        now = time.time()
+        lease = now + Config.OUTBOX_RETRY_MAX
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows, busy = [], []
+                cursor = conn.execute(
+                    "SELECT id, user_id, coin, old_price, new_price, change FROM outbox "
+                    "WHERE owner = ? AND status = 'pending' AND next_attempt <= ? ORDER BY next_attempt",
+                    (self.owner, now)
+                )
+                for row in cursor:
+                    if row[0] in in_flight:
+                        busy.append(row[0])
+                    elif len(rows) < Config.OUTBOX_BATCH:
+                        rows.append(row)
+                    else:
+                        break
+                cursor.close()
+                # Взятые и все еще ждущие в рассылке не перебираются до OUTBOX_RETRY_MAX
+                conn.executemany("UPDATE outbox SET next_attempt = ? WHERE id = ?",
+                                 [(lease, row_id) for row_id in busy + [row[0] for row in rows]])
+
+                if now - self._purged_at > PURGE_INTERVAL:
+                    self._purged_at = now
+                    # Ключ обработанного нужен, только пока его цена не сохранена
+                    conn.execute("DELETE FROM outbox WHERE status != 'pending' AND (anchored = 1 OR done_at < ?)",
+                                 (now - Config.OUTBOX_DEDUP_WINDOW,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [(row_id, Alert(*alert)) for row_id, *alert in rows]
+
+    async def flush_results(self):
+        """Записывает накопленные итоги отправки"""
+        results, self._results = self._results, []
+        if results:
+            await asyncio.to_thread(self._apply, results)
+            # Итог записан: недоставленные снова может взять _take_due
+            for row_ids, _ in results:
+                self._in_flight.difference_update(row_ids)
+
+    async def run(self, digest):
+        """Записывает итоги отправки и снова отправляет уведомления, которым пора"""
+        while True:
+            try:
+                await self.flush_results()
+                due = await asyncio.to_thread(self._take_due, frozenset(self._in_flight))
+                if due:
+                    self._in_flight.update(row_id for row_id, _ in due)
+                    detected_at = time.monotonic()
+                    for row_id, alert in due:
+                        digest.add(alert, detected_at, row_id)
+                    for user_id in {alert.user_id for _, alert in due}:
+                        digest.flush_user(user_id)
+                    self.stats['resent'] += len(due)
+                    logger.info(f"📬 Повторная отправка уведомлений: {len(due)}")
+            except Exception as e:
+                logger.error(f"Ошибка очереди уведомлений: {e}")
+            await asyncio.sleep(Config.OUTBOX_POLL_INTERVAL)
+
+    def get_stats(self) -> dict:
+        """Статистика очереди: ждет отправки и возраст самого старого уведомления (сек)"""
+        with self._lock:
+            depth, oldest = self._connect().execute(
+                "SELECT COUNT(*), MIN(created_at) FROM outbox WHERE status = 'pending' AND owner = ?", (self.owner,)
+            ).fetchone()
+        return {
+            'depth': depth,
+            'oldest_age': time.time() - oldest if oldest is not None else 0.0,
+            **self.stats
+        }
+
+    async def close(self):
+        """Записывает итоги отправки и закрывает очередь; недоставленное останется до следующего запуска"""
+        await self.flush_results()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,256 @@
+import math
+import time
+import heapq
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from config import Config
+from database import async_db
+from price_history import price_history
+
+logger = logging.getLogger(__name__)
+
+class CoinSchedule:
+    """Состояние опроса одной монеты"""
+
+    __slots__ = ('coin', 'due', 'interval', 'score', 'last_price', 'last_time', 'variance', 'subscription_version')
+
+    def __init__(self, coin: str, due: float):
+        self.coin = coin
+        self.due = due  # None - монета снята с очереди и опрашивается
+        self.interval = None
+        self.score = None  # ожидаемая частота пересечения порога (см. PollScheduler)
+        self.last_price = None
+        self.last_time = None
+        self.variance = None  # дисперсия логарифмической доходности за секунду (EWMA)
+        self.subscription_version = None  # версия подписок и порогов при последней сверке
+
+    def observe(self, price: float, timestamp: float, alpha: float):
+        """Учитывает новую цену в оценке волатильности"""
+        if price <= 0:
+            return
+        if self.last_price is not None and timestamp > self.last_time:
+            sample = math.log(price / self.last_price) ** 2 / (timestamp - self.last_time)
+            self.variance = sample if self.variance is None else self.variance + alpha * (sample - self.variance)
+        self.last_price = price
+        self.last_time = timestamp
+
+class PollScheduler:
+    """
+    Опрос цен с отдельным интервалом для каждой монеты
+
+    Интервал монеты зависит от ее недавней волатильности и самого маленького
+    порога среди подписчиков: при случайном блуждании цена проходит порог t%
+    примерно за T = ln(1 + t/100)^2 / дисперсию в секунду. Средняя задержка
+    обнаружения при заданном числе опросов минимальна, когда интервал
+    пропорционален sqrt(T); коэффициент подбирается так, чтобы в сумме монеты
+    опрашивались так же часто, как при общем интервале POLL_DEFAULT_INTERVAL.
+    Стейблкоин с порогом 10% опрашивается редко, волатильная монета с порогом
+    0.5% - часто. Монеты, чей срок подошел, и монеты, которым скоро подойдет
+    срок, собираются в общие пачки запросов.
+    """
+
+    def __init__(self, checker, database=None, history=None, clock=time.monotonic):
+        self.checker = checker
+        self.db = database or async_db
+        self.history = history if history is not None else price_history
+        self.clock = clock
+        self.running = False
+
+        self._states: Dict[str, CoinSchedule] = {}
+        self._queue = []  # куча (срок, номер, монета); устаревшие записи пропускаются
+        self._sequence = 0
+        self._synced_at = None  # когда последний раз перечитывался список монет
+
+        self.stats = {
+            'rounds': 0,     # опросов
+            'polled': 0,     # монет опрошено
+            'ahead': 0,      # из них досрочно, в уже оплаченной пачке
+            'changed': 0,    # внеочередных опросов после изменения подписчиков
+            'failed': 0      # монет без цены в ответе
+        }
+
+    def _update_score(self, state: CoinSchedule, threshold: Optional[float]):
+        """Частота пересечения порога 1/sqrt(T) или None, пока она неизвестна"""
+        if threshold is None or threshold <= 0 or state.variance is None:
+            state.score = None
+        else:
+            state.score = math.sqrt(state.variance) / math.log1p(threshold / 100)
+
+    def _scale(self) -> float:
+        """Коэффициент интервала: опросов в секунду столько же, сколько при общем интервале"""
+        scores = [s.score for s in self._states.values() if s.score is not None]
+        total = sum(scores)
+        if not total:
+            return 0.0
+        return total * Config.POLL_DEFAULT_INTERVAL / len(scores)
+
+    def interval_for(self, state: CoinSchedule, scale: float) -> float:
+        """Интервал опроса монеты в секундах"""
+        if state.score is None or not scale:
+            return Config.POLL_DEFAULT_INTERVAL
+        if state.score <= 0:
+            return Config.POLL_MAX_INTERVAL
+        return min(Config.POLL_MAX_INTERVAL, max(Config.POLL_MIN_INTERVAL, scale / state.score))
+
+    def _schedule(self, state: CoinSchedule, due: float):
+        state.due = due
+        self._sequence += 1
+        heapq.heappush(self._queue, (due, self._sequence, state.coin))
+
+    def _new_state(self, coin: str, now: float) -> CoinSchedule:
+        """Новая монета опрашивается сразу; волатильность - из истории цен, если есть"""
+        state = CoinSchedule(coin, now)
+        if self.history is not None:
+            for timestamp, price in self.history.points(coin, Config.POLL_HISTORY_WINDOW):
+                state.observe(price, timestamp, Config.POLL_VOLATILITY_ALPHA)
+        state.last_price = state.last_time = None  # время истории - настенное, опрос - по self.clock
+        self._states[coin] = state
+        self._schedule(state, now)
+        return state
+
+    async def _sync_coins(self, now: float):
+        """Добавляет новые монеты, убирает неотслеживаемые и ставит в очередь измененные"""
+        coins = await self.db.get_all_users_coins()
+        versions = await self.db.get_subscription_versions(coins)
+        tracked = set(coins)
+
+        for coin in list(self._states):
+            if coin not in tracked:
+                del self._states[coin]
+
+        for coin in coins:
+            version = versions.get(coin, 0)
+            state = self._states.get(coin)
+            if state is None:
+                self._new_state(coin, now).subscription_version = version
+                continue
+            if state.due is None:
+                # Монета выпала из очереди (опрос прервался) - возвращаем
+                state.subscription_version = version
+                self._schedule(state, now)
+                continue
+            # Обновления последних цен версию подписок не меняют; расхождение значит,
+            # что подписчики монеты менялись (например, появился меньший порог)
+            if version != state.subscription_version:
+                state.subscription_version = version
+                if state.due > now:
+                    self.stats['changed'] += 1
+                    self._schedule(state, now)
+
+    def _pop_due(self, limit: float) -> Optional[str]:
+        """Снимает с очереди монету со сроком не позже limit"""
+        while self._queue and self._queue[0][0] <= limit:
+            due, _, coin = heapq.heappop(self._queue)
+            state = self._states.get(coin)
+            if state is not None and state.due == due:
+                state.due = None
+                return coin
+        return None
+
+    def _take_due(self, now: float) -> List[str]:
+        """Монеты, которым подошел срок, и ближайшие из следующих - до заполнения пачки"""
+        batch = []
+        coin = self._pop_due(now)
+        while coin is not None:
+            batch.append(coin)
+            coin = self._pop_due(now)
+
+        # Неполная последняя пачка стоит столько же, сколько полная
+        free = -len(batch) % Config.PRICE_BATCH_MAX_IDS
+        while batch and free:
+            coin = self._pop_due(now + Config.POLL_BATCH_AHEAD)
+            if coin is None:
+                break
+            batch.append(coin)
+            self.stats['ahead'] += 1
+            free -= 1
+        return batch
+
+    async def poll_due(self) -> Dict[str, float]:
+        """Опрашивает монеты, которым подошел срок; возвращает полученные цены"""
+        now = self.clock()
+        if self._synced_at is None or now - self._synced_at >= Config.POLL_REFRESH_INTERVAL:
+            # Список монет и версии - полный запрос к базе, не на каждое пробуждение
+            await self._sync_coins(now)
+            self._synced_at = now
+        batch = self._take_due(now)
+        if not batch:
+            return {}
+
+        try:
+            prices = await self.checker.check_coins(batch)
+        except Exception:
+            # Монеты уже сняты с очереди: без повтора они бы больше не опрашивались
+            retry_at = self.clock() + Config.POLL_MIN_INTERVAL
+            for coin in batch:
+                state = self._states.get(coin)
+                if state is not None:
+                    self._schedule(state, retry_at)
+            self.stats['failed'] += len(batch)
+            raise
+        finished = self.clock()
+        self.stats['rounds'] += 1
+        self.stats['polled'] += len(batch)
+
+        polled = []
+        for coin in batch:
+            state = self._states.get(coin)
+            if state is None:
+                continue
+            price = prices.get(coin)
+            if price is None:
+                self.stats['failed'] += 1
+                self._schedule(state, finished + Config.POLL_MIN_INTERVAL)
+                continue
+            state.observe(price, finished, Config.POLL_VOLATILITY_ALPHA)
+            cached = self.checker.engine.coin_state(coin)
+            self._update_score(state, cached[1] if cached else None)
+            polled.append(state)
+
+        scale = self._scale()
+        for state in polled:
+            state.interval = self.interval_for(state, scale)
+            self._schedule(state, finished + state.interval)
+
+        logger.debug(f"Опрошено монет: {len(batch)}, в очереди: {len(self._states)}")
+        return prices
+
+    def next_due(self) -> Optional[float]:
+        """Ближайший срок опроса или None"""
+        while self._queue:
+            due, _, coin = self._queue[0]
+            state = self._states.get(coin)
+            if state is not None and state.due == due:
+                return due
+            heapq.heappop(self._queue)
+        return None
+
+    def get_stats(self) -> dict:
+        """Статистика опроса для логов и метрик"""
+        intervals = [s.interval for s in self._states.values() if s.interval is not None]
+        return {
+            'coins': len(self._states),
+            'avg_interval': sum(intervals) / len(intervals) if intervals else None,
+            **self.stats
+        }
+
+    async def run(self):
+        """Опрашивает монеты по их срокам, пока не вызван stop()"""
+        self.running = True
+        logger.info("Запущен адаптивный опрос цен")
+
+        while self.running:
+            try:
+                await self.poll_due()
+            except Exception as e:
+                logger.error(f"Ошибка в цикле адаптивного опроса: {e}")
+
+            # Спим до ближайшего срока, но список монет проверяем регулярно
+            due = self.next_due()
+            delay = Config.POLL_REFRESH_INTERVAL if due is None else due - self.clock()
+            await asyncio.sleep(min(Config.POLL_REFRESH_INTERVAL, max(1.0, delay)))
+
+    def stop(self):
+        self.running = False
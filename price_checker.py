@@ -1,8 +1,17 @@
+import time
 import asyncio
 import logging
-from datetime import datetime
-from crypto_api import crypto_api
-from database import db
+from coin_catalog import coin_catalog
+from config import Config
+from crypto_api import async_crypto_api
+from database import async_db
+from digest import DigestCollector
+from notifier import Notifier
+from outbox import Outbox
+from poll_scheduler import PollScheduler
+from price_history import price_history
+from price_stream import PriceStream
+from threshold_engine import ThresholdEngine
 
 logger = logging.getLogger(__name__)
 
@@ -12,12 +21,17 @@ class PriceChecker:
     def __init__(self, application):
         self.application = application
         self.running = False
+        self.engine = ThresholdEngine()
+        self.outbox = Outbox()
+        self.notifier = Notifier(application.bot, on_done=self.outbox.on_done)
+        self.digest = DigestCollector(self.notifier)
+        self._tasks = []
         
     async def check_prices(self):
         """Проверяет цены для всех отслеживаемых монет"""
         try:
             # Получаем все уникальные монеты
-            all_coins = db.get_all_users_coins()
+            all_coins = await async_db.get_all_users_coins()
             
             if not all_coins:
                 logger.debug("Нет монет для проверки")
@@ -25,86 +39,68 @@ class PriceChecker:
             
             logger.info(f"Проверяем цены для {len(all_coins)} монет: {', '.join(all_coins[:5])}...")
             
-            # Получаем текущие цены
-            current_prices = crypto_api.get_multiple_prices(all_coins)
-            
-            if not current_prices:
-                logger.warning("Не удалось получить цены")
-                return
-            
-            # Проверяем изменения для каждого пользователя
-            for coin_name, current_price in current_prices.items():
-                await self.check_coin_price(coin_name, current_price)
+            await self.check_coins(all_coins)
                 
         except Exception as e:
             logger.error(f"Ошибка при проверке цен: {e}")
     
+    async def check_coins(self, coins: list) -> dict:
+        """
+        Запрашивает цены монет и проверяет пороги их подписчиков
+        
+        Returns:
+            Полученные цены {монета: цена}
+        """
+        # Получаем текущие цены (пачками, упавшие пачки не ломают весь тик)
+        result = await async_crypto_api.get_multiple_prices_detailed(coins)
+        current_prices = result.prices
+        
+        if result.failed_chunks:
+            failed_count = sum(len(chunk) for chunk in result.failed_chunks)
+            logger.warning(f"Пропущено {failed_count} монет из-за ошибок API")
+        
+        if not current_prices:
+            logger.warning("Не удалось получить цены")
+            return {}
+        
+        price_history.record_many(current_prices)
+        
+        await self.process_prices(current_prices)
+        
+        logger.debug(f"Статистика запросов к API: {async_crypto_api.get_stats()}")
+        logger.debug(f"Статистика проверки порогов: {self.engine.stats}")
+        if logger.isEnabledFor(logging.DEBUG):
+            # Статистика очереди - запрос к SQLite, без DEBUG он не нужен
+            logger.debug(f"Статистика рассылки: {self.notifier.get_stats()}, сводки: {self.digest.stats}, "
+                         f"очередь: {await asyncio.to_thread(self.outbox.get_stats)}")
+        return current_prices
+    
     async def check_coin_price(self, coin_name: str, current_price: float):
         """Проверяет изменение цены для конкретной монеты"""
-        users = db.get_users_for_coin(coin_name)
-        
-        for user_info in users:
-            user_id = user_info['user_id']
-            threshold = user_info['threshold']
-            last_price = user_info['last_price']
-            
-            # Если это первая проверка - просто сохраняем цену
-            if last_price is None:
-                db.update_price(user_id, coin_name, current_price)
-                continue
-            
-            # Вычисляем процент изменения
-            price_change = abs((current_price - last_price) / last_price * 100)
-            
-            # Если изменение превышает порог - отправляем уведомление
-            if price_change >= threshold:
-                await self.send_notification(
-                    user_id, 
-                    coin_name, 
-                    last_price, 
-                    current_price, 
-                    price_change
-                )
-                
-                # Обновляем последнюю цену
-                db.update_price(user_id, coin_name, current_price)
+        await self.process_prices({coin_name: current_price})
     
-    async def send_notification(self, user_id: int, coin_name: str, 
-                               old_price: float, new_price: float, 
-                               change_percent: float):
-        """Отправляет уведомление пользователю"""
-        try:
-            # Определяем направление изменения
-            if new_price > old_price:
-                direction = "📈 РОСТ"
-                emoji = "🟢"
-            else:
-                direction = "📉 ПАДЕНИЕ"
-                emoji = "🔴"
-            
-            # Форматируем сообщение
-            message = (
-                f"{emoji} *УВЕДОМЛЕНИЕ О ЦЕНЕ*\n\n"
-                f"*Монета:* {coin_name.upper()}\n"
-                f"*Изменение:* {direction}\n"
-                f"*Процент:* {change_percent:.2f}%\n\n"
-                f"*Было:* ${old_price:.4f}\n"
-                f"*Стало:* ${new_price:.4f}\n"
-                f"*Разница:* ${abs(new_price - old_price):.4f}\n\n"
-                f"_Время: {datetime.now().strftime('%H:%M:%S')}_"
-            )
-            
-            # Отправляем сообщение
-            await self.application.bot.send_message(
-                chat_id=user_id,
-                text=message,
-                parse_mode='Markdown'
-            )
-            
-            logger.info(f"Отправлено уведомление пользователю {user_id} о {coin_name} ({change_percent:.2f}%)")
-            
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления пользователю {user_id}: {e}")
+    async def process_prices(self, prices: dict):
+        """Проверяет пороги всех подписок, ставит уведомления в очередь и сохраняет новые цены"""
+        result = await self.engine.evaluate(prices)
+        detected_at = time.monotonic()
+        
+        # Уведомления записываются на диск до того, как сдвинутся последние цены:
+        # если процесс упадет, они отправятся после перезапуска
+        for row_id, alert in await self.outbox.put(result.alerts):
+            self.digest.add(alert, detected_at, row_id)
+        
+        if result.alerts:
+            self.digest.end_tick()
+            logger.info(f"Сработало подписок: {len(result.alerts)}")
+        
+        # Если это первая проверка - просто сохраняем цену; сработавшим - новую
+        # последнюю цену. Одной пачкой на весь тик: уведомления уже в очереди
+        # и не должны повториться на следующем тике
+        updates = list(result.anchors)
+        updates.extend((alert.user_id, alert.coin, alert.new_price) for alert in result.alerts)
+        await self.engine.save(updates)
+        # Цены сохранены: те же ключи дальше означают новые срабатывания
+        await self.outbox.mark_anchored(result.alerts)
     
     async def run_periodically(self, interval_seconds: int = 60):
         """Запускает периодическую проверку цен"""
@@ -120,6 +116,40 @@ class PriceChecker:
             # Ждем перед следующей проверкой
             await asyncio.sleep(interval_seconds)
     
+    def start(self):
+        """Запускает проверку цен фоновыми задачами в текущем цикле событий (цикле бота)"""
+        jobs = [
+            coin_catalog.run_periodically(async_crypto_api),  # Обновление каталога монет
+            self.outbox.run(self.digest)  # Повторная отправка недоставленных уведомлений
+        ]
+        
+        if Config.PRICE_STREAM_ENABLED:
+            # Цены приходят потоком, опрос остается редкой подстраховкой
+            jobs.append(PriceStream(self).run())
+            jobs.append(self.run_periodically(interval_seconds=Config.PRICE_STREAM_FALLBACK_INTERVAL))
+        elif Config.POLL_ADAPTIVE:
+            # Каждая монета опрашивается со своим интервалом
+            jobs.append(PollScheduler(self).run())
+        else:
+            jobs.append(self.run_periodically(interval_seconds=60))  # Проверка каждую минуту
+        
+        self._tasks = [asyncio.create_task(job) for job in jobs]
+        logger.info("✅ Запущена проверка цен")
+    
+    async def shutdown(self, timeout: float = 10.0):
+        """Останавливает фоновые задачи и дожидается отправки поставленных уведомлений"""
+        self.stop()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        
+        self.digest.flush()
+        await self.notifier.close(timeout)
+        await self.outbox.flush_results()
+        logger.info(f"Рассылка остановлена: {self.notifier.get_stats()}, очередь: {self.outbox.get_stats()}")
+        await self.outbox.close()
+    
     def stop(self):
         """Останавливает проверку цен"""
         self.running = False
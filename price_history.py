@@ -0,0 +1,363 @@
+import os
+import mmap
+import math
+import time
+import struct
+import logging
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Формат файла: заголовок, затем слоты монет одинакового размера.
+# Слот: название монеты, начало и длина кольца, массив времен и массив цен (float64)
+MAGIC = b'PHST'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sIII')   # магия, версия, емкость кольца, число слотов
+FILE_HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct('<64sII')   # название монеты, начало кольца, число точек
+SLOT_GROW_STEP = 64                     # на сколько слотов расширять файл
+
+class CoinHistory:
+    """Кольцевой буфер (время, цена) одной монеты поверх области mmap"""
+
+    def __init__(self, store, slot: int, offset: int):
+        self.store = store
+        self.slot = slot
+        self.offset = offset
+        self.capacity = store.capacity
+        self.start, self.count = SLOT_HEADER.unpack_from(store._mm, offset)[1:]
+        self._attach()
+        # Деревья отрезков для min/max строятся при первом запросе
+        self._tree_min = None
+        self._tree_max = None
+
+    def _attach(self):
+        """Представления массивов времен и цен внутри mmap (без копирования)"""
+        base = self.offset + SLOT_HEADER.size
+        size = self.capacity * 8
+        view = memoryview(self.store._mm)
+        self.timestamps = view[base:base + size].cast('d')
+        self.prices = view[base + size:base + 2 * size].cast('d')
+        view.release()
+
+    def _detach(self):
+        self.timestamps.release()
+        self.prices.release()
+
+    def _physical(self, index: int) -> int:
+        """Позиция в массиве для логического индекса (0 - самая старая точка)"""
+        return (self.start + index) % self.capacity
+
+    def append(self, timestamp: float, price: float):
+        """Добавляет точку, вытесняя самую старую при заполнении"""
+        resolution = self.store.resolution
+        if self.count:
+            last = self._physical(self.count - 1)
+            # Время в кольце не убывает - на этом держится бинарный поиск
+            timestamp = max(timestamp, self.timestamps[last])
+            # Тики внутри одного интервала (например, из WebSocket) заменяют последнюю точку
+            if resolution and timestamp // resolution == self.timestamps[last] // resolution:
+                self.timestamps[last] = timestamp
+                self.prices[last] = price
+                if self._tree_min is not None:
+                    self._tree_update(last, price)
+                return
+
+        if self.count < self.capacity:
+            position = self._physical(self.count)
+            self.count += 1
+        else:
+            position = self.start
+            self.start = (self.start + 1) % self.capacity
+
+        self.timestamps[position] = timestamp
+        self.prices[position] = price
+        struct.pack_into('<II', self.store._mm, self.offset + 64, self.start, self.count)
+
+        if self._tree_min is not None:
+            self._tree_update(position, price)
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        if not self.count:
+            return None
+        position = self._physical(self.count - 1)
+        return self.timestamps[position], self.prices[position]
+
+    def bisect_left(self, timestamp: float) -> int:
+        """Число точек со временем < timestamp (бинарный поиск по кольцу)"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[self._physical(middle)] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def bisect_right(self, timestamp: float) -> int:
+        """Число точек со временем <= timestamp"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[self._physical(middle)] <= timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def point(self, index: int) -> Tuple[float, float]:
+        position = self._physical(index)
+        return self.timestamps[position], self.prices[position]
+
+    def _build_trees(self):
+        """Деревья отрезков по физическим позициям кольца"""
+        size = self.capacity
+        self._tree_min = array('d', [math.inf]) * (2 * size)
+        self._tree_max = array('d', [-math.inf]) * (2 * size)
+        for index in range(self.count):
+            position = self._physical(index)
+            self._tree_min[size + position] = self.prices[position]
+            self._tree_max[size + position] = self.prices[position]
+        for node in range(size - 1, 0, -1):
+            self._tree_min[node] = min(self._tree_min[2 * node], self._tree_min[2 * node + 1])
+            self._tree_max[node] = max(self._tree_max[2 * node], self._tree_max[2 * node + 1])
+
+    def _tree_update(self, position: int, price: float):
+        node = self.capacity + position
+        self._tree_min[node] = price
+        self._tree_max[node] = price
+        node //= 2
+        while node:
+            self._tree_min[node] = min(self._tree_min[2 * node], self._tree_min[2 * node + 1])
+            self._tree_max[node] = max(self._tree_max[2 * node], self._tree_max[2 * node + 1])
+            node //= 2
+
+    def _tree_query(self, left: int, right: int) -> Tuple[float, float]:
+        """min и max по физическим позициям [left, right)"""
+        low, high = math.inf, -math.inf
+        left += self.capacity
+        right += self.capacity
+        while left < right:
+            if left & 1:
+                low = min(low, self._tree_min[left])
+                high = max(high, self._tree_max[left])
+                left += 1
+            if right & 1:
+                right -= 1
+                low = min(low, self._tree_min[right])
+                high = max(high, self._tree_max[right])
+            left //= 2
+            right //= 2
+        return low, high
+
+    def min_max(self, first: int) -> Optional[Tuple[float, float]]:
+        """min и max цены по логическим индексам [first, count)"""
+        if first >= self.count:
+            return None
+        if self._tree_min is None:
+            self._build_trees()
+
+        left = self._physical(first)
+        right = self._physical(self.count - 1) + 1
+        if left < right:
+            return self._tree_query(left, right)
+
+        # Окно переходит через конец массива - два запроса
+        low1, high1 = self._tree_query(left, self.capacity)
+        low2, high2 = self._tree_query(0, right)
+        return min(low1, low2), max(high1, high2)
+
+class PriceHistory:
+    """
+    История цен по монетам в файле, отображенном в память (mmap)
+
+    У каждой монеты кольцевой буфер фиксированного размера, не больше одной
+    точки на интервал resolution. После перезапуска файл просто отображается
+    заново - без разбора и загрузки в память.
+    """
+
+    def __init__(self, path: str = None, capacity: int = None, resolution: float = None):
+        if path:
+            self.path = path
+        elif Config.PRICE_HISTORY_PATH:
+            self.path = Config.PRICE_HISTORY_PATH
+        elif os.path.exists('/tmp'):  # Railway использует /tmp для записи
+            self.path = '/tmp/price_history.bin'
+        else:
+            self.path = os.path.join(os.path.dirname(__file__), 'price_history.bin')
+
+        self.capacity = capacity or Config.PRICE_HISTORY_SIZE
+        self.resolution = Config.PRICE_HISTORY_RESOLUTION if resolution is None else resolution
+        self._lock = threading.Lock()
+        self._coins: Dict[str, CoinHistory] = {}
+        self._slots = 0
+        self._file = None
+        self._mm = None
+        # Файл открывается при первом обращении, а не при импорте модуля
+
+    @property
+    def _slot_size(self) -> int:
+        return SLOT_HEADER.size + 16 * self.capacity
+
+    def _ensure_open(self):
+        if self._mm is None:
+            self._open()
+
+    def _reset(self):
+        """Закрывает файл и сбрасывает состояние (после ошибки открытия или при close)"""
+        for history in self._coins.values():
+            history._detach()
+        self._coins = {}
+        self._slots = 0
+        if self._mm is not None:
+            self._mm.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._mm = None
+
+    def _open(self):
+        """Открывает файл истории или создает новый"""
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= FILE_HEADER_SIZE:
+                self._file = open(self.path, 'r+b')
+                header = FILE_HEADER.unpack(self._file.read(FILE_HEADER.size))
+                magic, version, capacity, slots = header
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError("неизвестный формат файла")
+                if capacity != self.capacity:
+                    logger.info(f"ℹ️ Емкость истории из файла: {capacity} точек (в настройках {self.capacity})")
+                    self.capacity = capacity
+                self._slots = slots
+                self._mm = mmap.mmap(self._file.fileno(), 0)
+                self._load_slots()
+                logger.info(f"📈 История цен открыта: {len(self._coins)} монет")
+                return
+        except Exception as e:
+            self._reset()
+            broken_path = f"{self.path}.corrupt-{int(time.time())}"
+            os.replace(self.path, broken_path)
+            logger.error(f"❌ Файл истории цен поврежден ({e}), сохранен как {broken_path}")
+
+        try:
+            self._file = open(self.path, 'w+b')
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION, self.capacity, 0).ljust(FILE_HEADER_SIZE, b'\0'))
+            self._file.flush()
+            self._slots = 0
+            self._grow()
+        except Exception:
+            # Следующее обращение попробует открыть файл заново
+            self._reset()
+            raise
+
+    def _load_slots(self):
+        """Читает названия монет из заголовков занятых слотов"""
+        for slot in range(self._slots):
+            offset = FILE_HEADER_SIZE + slot * self._slot_size
+            name = SLOT_HEADER.unpack_from(self._mm, offset)[0].rstrip(b'\0')
+            if name:
+                self._coins[name.decode('utf-8')] = CoinHistory(self, slot, offset)
+
+    def _grow(self):
+        """Добавляет в файл пустые слоты и отображает его заново"""
+        for history in self._coins.values():
+            history._detach()
+        if self._mm is not None:
+            self._mm.close()
+
+        self._slots += SLOT_GROW_STEP
+        self._file.truncate(FILE_HEADER_SIZE + self._slots * self._slot_size)
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        FILE_HEADER.pack_into(self._mm, 0, MAGIC, VERSION, self.capacity, self._slots)
+
+        for history in self._coins.values():
+            history._attach()
+
+    def _get(self, coin_id: str, create: bool = False) -> Optional[CoinHistory]:
+        self._ensure_open()
+        history = self._coins.get(coin_id)
+        if history is None and create:
+            encoded = coin_id.encode('utf-8')
+            if len(encoded) > 64:
+                return None
+            slot = len(self._coins)
+            if slot >= self._slots:
+                self._grow()
+            offset = FILE_HEADER_SIZE + slot * self._slot_size
+            SLOT_HEADER.pack_into(self._mm, offset, encoded, 0, 0)
+            history = CoinHistory(self, slot, offset)
+            self._coins[coin_id] = history
+        return history
+
+    def record(self, coin_id: str, price: float, timestamp: float = None):
+        """Добавляет цену монеты в историю"""
+        self.record_many({coin_id: price}, timestamp)
+
+    def record_many(self, prices: Dict[str, float], timestamp: float = None):
+        """Добавляет цены нескольких монет с общим временем тика"""
+        timestamp = timestamp or time.time()
+        with self._lock:
+            for coin_id, price in prices.items():
+                history = self._get(coin_id, create=True)
+                if history is not None:
+                    history.append(timestamp, float(price))
+
+    def latest(self, coin_id: str) -> Optional[Tuple[float, float]]:
+        """Последняя точка (время, цена)"""
+        with self._lock:
+            history = self._get(coin_id)
+            return history.latest() if history else None
+
+    def price_at(self, coin_id: str, timestamp: float) -> Optional[Tuple[float, float]]:
+        """
+        Последняя точка не позже момента timestamp (O(log n))
+
+        Returns:
+            (время, цена) или None, если история начинается позже
+        """
+        with self._lock:
+            history = self._get(coin_id)
+            if not history:
+                return None
+            index = history.bisect_right(timestamp)
+            return history.point(index - 1) if index else None
+
+    def price_minutes_ago(self, coin_id: str, minutes: float) -> Optional[Tuple[float, float]]:
+        """Цена N минут назад"""
+        return self.price_at(coin_id, time.time() - minutes * 60)
+
+    def window_min_max(self, coin_id: str, seconds: float) -> Optional[Tuple[float, float]]:
+        """min и max цены за последние seconds секунд (O(log n))"""
+        with self._lock:
+            history = self._get(coin_id)
+            if not history:
+                return None
+            return history.min_max(history.bisect_left(time.time() - seconds))
+
+    def points(self, coin_id: str, seconds: float = None) -> List[Tuple[float, float]]:
+        """Точки истории (от старых к новым), при seconds - только за это окно"""
+        with self._lock:
+            history = self._get(coin_id)
+            if not history:
+                return []
+            first = history.bisect_left(time.time() - seconds) if seconds else 0
+            return [history.point(index) for index in range(first, history.count)]
+
+    def flush(self):
+        """Сбрасывает изменения mmap на диск"""
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+
+    def close(self):
+        with self._lock:
+            if self._mm is None:
+                return
+            self._mm.flush()
+            self._reset()
+
+# Создаем глобальный объект истории цен
+price_history = PriceHistory()
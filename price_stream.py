@@ -0,0 +1,154 @@
+import json
+import random
+import asyncio
+import logging
+from typing import Dict, List
+
+from config import Config
+from crypto_api import async_crypto_api
+from database import AsyncDatabase, async_db
+from price_history import price_history
+from providers import CoinCapProvider
+
+try:
+    import websockets
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    websockets = None
+    WEBSOCKETS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+class PriceStream:
+    """
+    Потоковое получение цен через WebSocket (формат ws.coincap.io/prices).
+    Каждый тик передается в PriceChecker.check_coin_price - тот же путь,
+    что и при периодическом опросе.
+    """
+    
+    def __init__(self, price_checker, url: str = None, id_map: Dict[str, str] = None,
+                 database=None):
+        self.price_checker = price_checker
+        self.db = AsyncDatabase(database) if database else async_db
+        self.url = url or Config.PRICE_STREAM_URL
+        # Поток использует id CoinCap
+        self.provider = CoinCapProvider(base_url=self.url, id_map=id_map)
+        self.running = False
+        
+        self._subscribed = frozenset()
+        self._pending: Dict[str, float] = {}  # coin_id -> последняя необработанная цена
+        self._pending_event = asyncio.Event()
+        self.stats = {'ticks': 0, 'evaluated': 0, 'reconnects': 0}
+    
+    async def run(self):
+        """Запускает подписку и обработку тиков до вызова stop()"""
+        if not WEBSOCKETS_AVAILABLE:
+            logger.error("❌ Пакет websockets не установлен, потоковый режим недоступен")
+            return
+        
+        self.running = True
+        logger.info(f"📡 Запущен потоковый режим цен: {self.url}")
+        evaluator = asyncio.create_task(self._evaluate_loop())
+        
+        try:
+            while self.running:
+                try:
+                    await self._run_subscription()
+                except Exception as e:
+                    # Ошибка базы не должна останавливать поток навсегда
+                    logger.error(f"Ошибка в цикле потока цен: {e}")
+                    await asyncio.sleep(Config.PRICE_STREAM_RESUBSCRIBE_CHECK)
+        finally:
+            evaluator.cancel()
+    
+    async def _run_subscription(self):
+        """Держит соединения на текущий набор монет, пока он не изменится"""
+        coins = frozenset(await self.db.get_all_users_coins())
+        if not coins:
+            await asyncio.sleep(Config.PRICE_STREAM_RESUBSCRIBE_CHECK)
+            return
+        
+        self._subscribed = coins
+        connections = [
+            asyncio.create_task(self._run_connection(chunk))
+            for chunk in async_crypto_api._split_ids(sorted(coins))
+        ]
+        try:
+            # Переподключаемся, когда меняется набор отслеживаемых монет
+            while self.running and frozenset(await self.db.get_all_users_coins()) == self._subscribed:
+                await asyncio.sleep(Config.PRICE_STREAM_RESUBSCRIBE_CHECK)
+            logger.info("🔁 Набор монет изменился, переподписываемся")
+        finally:
+            for connection in connections:
+                connection.cancel()
+            await asyncio.gather(*connections, return_exceptions=True)
+    
+    async def _run_connection(self, coin_ids: List[str]):
+        """Одно WebSocket соединение на пачку монет с переподключением"""
+        assets = ','.join(self.provider.to_provider_id(coin_id) for coin_id in coin_ids)
+        url = f"{self.url}?assets={assets}"
+        attempt = 0
+        
+        while True:
+            try:
+                async with websockets.connect(url, ping_interval=20, max_size=2 ** 20) as ws:
+                    attempt = 0
+                    logger.debug(f"📡 Подписка на {len(coin_ids)} монет")
+                    async for message in ws:
+                        try:
+                            self._on_message(message)
+                        except Exception as e:
+                            logger.error(f"Ошибка разбора тика: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Поток цен прерван: {e}")
+            
+            # Экспоненциальная задержка с джиттером перед переподключением
+            self.stats['reconnects'] += 1
+            delay = random.uniform(0, min(Config.API_BACKOFF_MAX, Config.API_BACKOFF_BASE * 2 ** attempt))
+            attempt += 1
+            await asyncio.sleep(delay)
+    
+    def _on_message(self, message):
+        """Разбирает тик {provider_id: "цена"} и откладывает его на обработку"""
+        try:
+            ticks = json.loads(message)
+        except (TypeError, ValueError):
+            logger.debug(f"Некорректный тик: {message!r}")
+            return
+        
+        for provider_id, price in ticks.items():
+            try:
+                self._pending[self.provider.from_provider_id(provider_id)] = float(price)
+            except (TypeError, ValueError):
+                continue
+            self.stats['ticks'] += 1
+        
+        self._pending_event.set()
+    
+    async def _evaluate_loop(self):
+        """Прогоняет последние цены через проверку порогов"""
+        while True:
+            await self._pending_event.wait()
+            self._pending_event.clear()
+            
+            # Если тики приходят быстрее обработки - берем последнюю цену монеты
+            pending, self._pending = self._pending, {}
+            try:
+                async_crypto_api.cache.set_many(pending)
+                price_history.record_many(pending)
+            except Exception as e:
+                logger.error(f"Ошибка сохранения тиков: {e}")
+            
+            for coin_id, price in pending.items():
+                try:
+                    await self.price_checker.check_coin_price(coin_id, price)
+                    self.stats['evaluated'] += 1
+                except Exception as e:
+                    logger.error(f"Ошибка обработки тика {coin_id}: {e}")
+    
+    def stop(self):
+        """Останавливает потоковый режим"""
+        self.running = False
+        logger.info("Потоковый режим цен остановлен")
@@ -0,0 +1,212 @@
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+from config import Config
+from rate_limiter import RequestScheduler, PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+# Соответствие наших id (CoinGecko) и id CoinCap там, где они отличаются
+COINCAP_ID_MAP = {
+    'binancecoin': 'binance-coin',
+    'ripple': 'xrp',
+    'avalanche-2': 'avalanche',
+    'matic-network': 'polygon',
+    'the-open-network': 'toncoin',
+    'crypto-com-chain': 'crypto-com-coin',
+    'elrond-erd-2': 'multiversx-egld',
+}
+
+# Наибольший limit запроса CoinCap /assets
+COINCAP_MAX_LIMIT = 2000
+
+class PriceProvider:
+    """Базовый класс провайдера цен с учетом задержек и ошибок"""
+    
+    name = 'base'
+    
+    def __init__(self, base_url: str, scheduler: RequestScheduler = None,
+                 id_map: Dict[str, str] = None):
+        self.base_url = base_url
+        self.scheduler = scheduler or RequestScheduler()
+        
+        # Наш id -> id провайдера и обратно
+        self.id_map = dict(id_map or {})
+        self._reverse_id_map = {v: k for k, v in self.id_map.items()}
+        
+        self._latencies = deque(maxlen=100)
+        self._outcomes = deque(maxlen=Config.PROVIDER_HEALTH_WINDOW)
+        self._disabled_until = 0.0
+    
+    def to_provider_id(self, coin_id: str) -> str:
+        return self.id_map.get(coin_id, coin_id)
+    
+    def from_provider_id(self, provider_id: str) -> str:
+        return self._reverse_id_map.get(provider_id, provider_id)
+    
+    async def _get_json(self, api, path: str, params: dict, priority: int):
+        """GET запрос через общий HTTP клиент и планировщик этого провайдера"""
+        url = f"{self.base_url}{path}"
+        return await self.scheduler.call(lambda: api._request_json(url, params), priority)
+    
+    async def fetch_prices(self, api, coin_ids: List[str], priority: int) -> Dict[str, float]:
+        """
+        Запрашивает цены и учитывает задержку/ошибку в статистике провайдера
+        
+        Returns:
+            Словарь {coin_id: цена} в наших id; при ошибке бросает исключение
+        """
+        started = time.monotonic()
+        try:
+            prices = await self._fetch_prices(api, coin_ids, priority)
+        except asyncio.CancelledError:
+            # Проигравший хедж-запрос - это не ошибка провайдера
+            raise
+        except Exception:
+            self._record(False)
+            raise
+        
+        self._latencies.append(time.monotonic() - started)
+        self._record(True)
+        return prices
+    
+    async def _fetch_prices(self, api, coin_ids: List[str], priority: int) -> Dict[str, float]:
+        raise NotImplementedError
+    
+    async def get_coins_list(self, api) -> list:
+        """Полный список монет провайдера; есть не у всех провайдеров"""
+        raise NotImplementedError(f"{self.name} не предоставляет список монет")
+    
+    def _record(self, success: bool):
+        """Учитывает результат запроса и выводит провайдера из ротации при частых ошибках"""
+        self._outcomes.append(success)
+        
+        if len(self._outcomes) < self._outcomes.maxlen // 2:
+            return
+        
+        error_rate = self._outcomes.count(False) / len(self._outcomes)
+        if error_rate > Config.PROVIDER_MAX_ERROR_RATE:
+            self._disabled_until = time.monotonic() + Config.PROVIDER_COOLDOWN
+            self._outcomes.clear()
+            logger.warning(f"🚫 Провайдер {self.name} выведен из ротации на {Config.PROVIDER_COOLDOWN:.0f} сек "
+                           f"(ошибок {error_rate:.0%})")
+    
+    def is_available(self) -> bool:
+        """Провайдер в ротации (не выведен из-за ошибок)"""
+        return time.monotonic() >= self._disabled_until
+    
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Перцентиль задержки успешных запросов или None, если данных мало"""
+        if len(self._latencies) < 10:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+    
+    def hedge_delay(self) -> float:
+        """Через сколько секунд отправлять хедж-запрос другому провайдеру"""
+        latency = self.latency_percentile(Config.HEDGE_PERCENTILE)
+        if latency is None:
+            return Config.HEDGE_DEFAULT_DELAY
+        return max(Config.HEDGE_MIN_DELAY, latency)
+    
+    def get_stats(self) -> dict:
+        """Статистика провайдера для логов и метрик"""
+        return {
+            'available': self.is_available(),
+            'p50': self.latency_percentile(50),
+            'p95': self.latency_percentile(95),
+            **self.scheduler.stats
+        }
+
+class CoinGeckoProvider(PriceProvider):
+    """Провайдер CoinGecko (/simple/price)"""
+    
+    name = 'coingecko'
+    
+    def __init__(self, base_url: str = None, scheduler: RequestScheduler = None,
+                 id_map: Dict[str, str] = None):
+        super().__init__(base_url or Config.COINGECKO_URL, scheduler, id_map)
+    
+    async def _fetch_prices(self, api, coin_ids: List[str], priority: int) -> Dict[str, float]:
+        data = await self._get_json(api, '/simple/price', {
+            'ids': ','.join(self.to_provider_id(coin_id) for coin_id in coin_ids),
+            'vs_currencies': 'usd'
+        }, priority)
+        
+        prices = {}
+        for provider_id, values in data.items():
+            if 'usd' in values:
+                prices[self.from_provider_id(provider_id)] = values['usd']
+        return prices
+    
+    async def get_coins_list(self, api) -> list:
+        return await self._get_json(api, '/coins/list', {}, PRIORITY_BACKGROUND)
+
+class CoinCapProvider(PriceProvider):
+    """Провайдер CoinCap (/assets)"""
+    
+    name = 'coincap'
+    
+    def __init__(self, base_url: str = None, scheduler: RequestScheduler = None,
+                 id_map: Dict[str, str] = None):
+        super().__init__(
+            base_url or Config.COINCAP_URL,
+            scheduler or RequestScheduler(rate_per_minute=Config.COINCAP_RATE_PER_MINUTE),
+            COINCAP_ID_MAP if id_map is None else id_map
+        )
+    
+    async def _fetch_prices(self, api, coin_ids: List[str], priority: int) -> Dict[str, float]:
+        data = await self._get_json(api, '/assets', {
+            'ids': ','.join(self.to_provider_id(coin_id) for coin_id in coin_ids),
+            # Без limit /assets отдает не больше 100 строк, а пачка - до PRICE_BATCH_MAX_IDS
+            'limit': min(len(coin_ids), COINCAP_MAX_LIMIT)
+        }, priority)
+        
+        prices = {}
+        for asset in data.get('data', []):
+            if asset.get('priceUsd') is not None:
+                prices[self.from_provider_id(asset['id'])] = float(asset['priceUsd'])
+        return prices
+
+# Доступные провайдеры по имени
+PROVIDERS = {
+    CoinGeckoProvider.name: CoinGeckoProvider,
+    CoinCapProvider.name: CoinCapProvider,
+}
+
+def load_id_maps(path: str = None) -> Dict[str, Dict[str, str]]:
+    """Загружает дополнительные соответствия id из JSON файла {провайдер: {наш_id: id}}"""
+    path = path or Config.PROVIDER_ID_MAP_PATH
+    if not path:
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки соответствий id провайдеров: {e}")
+        return {}
+
+def build_providers(names: str = None) -> List[PriceProvider]:
+    """Создает провайдеров по списку имен из настроек"""
+    names = names or Config.PRICE_PROVIDERS
+    extra_maps = load_id_maps()
+    providers = []
+    
+    for name in names.split(','):
+        name = name.strip().lower()
+        if name not in PROVIDERS:
+            logger.warning(f"⚠️ Неизвестный провайдер цен: {name}")
+            continue
+        
+        provider = PROVIDERS[name]()
+        if name in extra_maps:
+            provider.id_map.update(extra_maps[name])
+            provider._reverse_id_map = {v: k for k, v in provider.id_map.items()}
+        providers.append(provider)
+    
+    return providers or [CoinGeckoProvider()]
@@ -0,0 +1,157 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты очереди: меньше - важнее
+PRIORITY_INTERACTIVE = 0  # запросы пользователей из bot.py
+PRIORITY_BACKGROUND = 1   # пакетные запросы PriceChecker
+
+class RequestDropped(Exception):
+    """Запрос отклонен планировщиком (очередь переполнена или исчерпаны попытки)"""
+
+class RequestScheduler:
+    """
+    Планировщик запросов к API: token bucket, две полосы приоритета,
+    учет Retry-After и экспоненциальная задержка с джиттером
+    """
+    
+    def __init__(self, rate_per_minute: float = None, burst: int = None,
+                 max_retries: int = None, queue_limit: int = None,
+                 backoff_base: float = None, backoff_max: float = None):
+        self.rate = (rate_per_minute or Config.API_RATE_PER_MINUTE) / 60.0
+        self.capacity = burst or Config.API_BURST
+        self.max_retries = Config.API_MAX_RETRIES if max_retries is None else max_retries
+        self.queue_limit = queue_limit or Config.API_QUEUE_LIMIT
+        self.backoff_base = backoff_base or Config.API_BACKOFF_BASE
+        self.backoff_max = backoff_max or Config.API_BACKOFF_MAX
+        
+        # Состояние общее для всех event loop, поэтому защищено обычной блокировкой
+        self._lock = threading.Lock()
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+        
+        self.stats = {
+            'sent': 0,        # запросов отправлено
+            'queued': 0,      # запросов ждали токен
+            'throttled': 0,   # ответов 429
+            'retried': 0,     # повторных попыток
+            'dropped': 0      # отклонено или исчерпаны попытки
+        }
+    
+    def _try_take(self, priority: int) -> float:
+        """Пытается взять токен; возвращает 0 или сколько секунд подождать"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+        
+        # Фоновые запросы пропускают вперед ожидающих пользователей
+        if priority == PRIORITY_BACKGROUND and self._waiting[PRIORITY_INTERACTIVE]:
+            return max(1.0 / self.rate, 0.05)
+        
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+    
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        """Ждет разрешения на отправку запроса"""
+        with self._lock:
+            wait = self._try_take(priority)
+            if wait == 0:
+                self.stats['sent'] += 1
+                return
+            
+            if self._waiting[priority] >= self.queue_limit:
+                self.stats['dropped'] += 1
+                raise RequestDropped("очередь запросов переполнена")
+            
+            self._waiting[priority] += 1
+            self.stats['queued'] += 1
+        
+        try:
+            while True:
+                await asyncio.sleep(wait)
+                with self._lock:
+                    wait = self._try_take(priority)
+                    if wait == 0:
+                        self.stats['sent'] += 1
+                        return
+        finally:
+            with self._lock:
+                self._waiting[priority] -= 1
+    
+    def pause(self, seconds: float):
+        """Приостанавливает все запросы (например, по Retry-After)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+    
+    def _backoff(self, attempt: int) -> float:
+        """Экспоненциальная задержка с полным джиттером"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+    
+    async def call(self, request, priority: int = PRIORITY_INTERACTIVE):
+        """
+        Выполняет запрос через планировщик с повторными попытками
+        
+        Args:
+            request: корутинная функция без аргументов, выполняющая запрос
+            priority: PRIORITY_INTERACTIVE или PRIORITY_BACKGROUND
+        """
+        attempt = 0
+        while True:
+            await self.acquire(priority)
+            try:
+                return await request()
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                if status == 429:
+                    self.stats['throttled'] += 1
+                    delay = parse_retry_after(e.response.headers.get('Retry-After'))
+                    delay = delay if delay is not None else self._backoff(attempt)
+                    self.pause(delay)
+                    logger.warning(f"⏳ API ограничил запросы (429), пауза {delay:.1f} сек")
+                elif status >= 500:
+                    delay = self._backoff(attempt)
+                else:
+                    raise
+                error = e
+            except httpx.TransportError as e:
+                delay = self._backoff(attempt)
+                error = e
+            
+            if attempt >= self.max_retries:
+                self.stats['dropped'] += 1
+                raise error
+            
+            attempt += 1
+            self.stats['retried'] += 1
+            await asyncio.sleep(delay)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
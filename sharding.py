@@ -0,0 +1,424 @@
+import os
+import sys
+import json
+import time
+import zlib
+import signal
+import asyncio
+import logging
+import sqlite3
+import threading
+import multiprocessing
+from typing import Dict, Optional, Set, Tuple
+
+from telegram.ext import Application
+
+from config import Config
+from database import async_db, db
+from digest import DigestCollector
+from notifier import Notifier
+from outbox import Outbox
+from price_checker import PriceChecker
+
+logger = logging.getLogger(__name__)
+
+LEASES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shard_leases (
+    shard     INTEGER PRIMARY KEY,
+    owner     TEXT,
+    expires   REAL NOT NULL DEFAULT 0,
+    wanted_by INTEGER
+);
+"""
+
+# Снимок цен - одна строка JSON; столько байт может занять строка и
+# неотправленные данные одного воркера, после чего он отключается
+SNAPSHOT_LIMIT = 16 * 1024 * 1024
+
+def shard_of(coin: str, shards: int) -> int:
+    """Шард монеты; одинаков во всех процессах (hash() строк в каждом процессе свой)"""
+    return zlib.crc32(coin.encode()) % shards
+
+class ShardLeases:
+    """
+    Аренда шардов в таблице SQLite (в файле базы пользователей)
+
+    Шард i по умолчанию принадлежит воркеру i. Владелец продлевает аренду
+    каждые SHARD_LEASE_TTL/3 секунд; шард с истекшей арендой забирает другой
+    воркер, но не больше одного за продление, чтобы шарды упавшего воркера
+    разошлись по живым. Перезапущенный воркер отмечает свой шард в wanted_by,
+    и текущий владелец отдает его при следующем продлении.
+    """
+
+    def __init__(self, path: str, index: int, shards: int, ttl: float = None, clock=time.time):
+        self.index = index
+        self.shards = shards
+        self.owner = f"{index}:{os.getpid()}"
+        self.ttl = ttl or Config.SHARD_LEASE_TTL
+        self.clock = clock
+        self._held: Dict[int, float] = {}  # шард -> до какого времени аренда наша
+
+        # Запросы выполняются в пуле потоков (asyncio.to_thread); блокировка не дает
+        # release закрыть соединение, пока продление еще идет
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                                     timeout=self.ttl / 3)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(LEASES_SCHEMA)
+        self._conn.executemany("INSERT OR IGNORE INTO shard_leases (shard) VALUES (?)",
+                               [(shard,) for shard in range(shards)])
+
+    def refresh(self) -> Set[int]:
+        """Продлевает свои аренды, забирает свободные шарды; возвращает свои шарды"""
+        with self._lock:
+            if self._conn is None:
+                # Шарды уже освобождены (release), продление опоздало
+                return set()
+            return self._refresh()
+
+    def _refresh(self) -> Set[int]:
+        now = self.clock()
+        expires = now + self.ttl
+        held = {}
+        taken = False
+        conn = self._conn
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT shard, owner, expires, wanted_by FROM shard_leases WHERE shard < ?", (self.shards,)
+            ).fetchall()
+            for shard, owner, lease_end, wanted_by in rows:
+                if shard == self.index:
+                    if owner in (self.owner, None) or lease_end < now:
+                        conn.execute("UPDATE shard_leases SET owner = ?, expires = ?, wanted_by = NULL "
+                                     "WHERE shard = ?", (self.owner, expires, shard))
+                        held[shard] = expires
+                    elif wanted_by != self.index:
+                        conn.execute("UPDATE shard_leases SET wanted_by = ? WHERE shard = ?", (self.index, shard))
+                elif owner == self.owner:
+                    if wanted_by == shard:
+                        # Воркер шарда вернулся - отдаем
+                        conn.execute("UPDATE shard_leases SET owner = NULL, expires = ? WHERE shard = ?",
+                                     (now, shard))
+                    else:
+                        conn.execute("UPDATE shard_leases SET expires = ? WHERE shard = ?", (expires, shard))
+                        held[shard] = expires
+                elif not taken and lease_end < now - (self.ttl if owner is None else 0):
+                    # Освобожденный шард сначала ждет своего воркера, истекший - ничей
+                    conn.execute("UPDATE shard_leases SET owner = ?, expires = ? WHERE shard = ?",
+                                 (self.owner, expires, shard))
+                    held[shard] = expires
+                    taken = True
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._held = held
+        return set(held)
+
+    def active(self) -> Set[int]:
+        """Шарды, аренда которых не истечет до следующего продления"""
+        limit = self.clock() + self.ttl / 3
+        return {shard for shard, until in self._held.items() if until > limit}
+
+    def release(self):
+        """Освобождает все свои шарды (при остановке воркера)"""
+        with self._lock:
+            if self._conn is None:
+                return
+            self._held = {}
+            self._conn.execute("UPDATE shard_leases SET owner = NULL, expires = ? WHERE owner = ?",
+                               (self.clock(), self.owner))
+            self._conn.close()
+            self._conn = None
+
+class ThresholdSummary:
+    """
+    Версии подписок и самые маленькие пороги монет для PollScheduler в
+    процессе, который сам пороги не проверяет (см. SnapshotPublisher).
+    Воркеры обновляют последние цены, но версию подписок это не меняет.
+    """
+
+    def __init__(self, database=None):
+        self.db = database or async_db
+        self._states: Dict[str, Tuple[int, Optional[float]]] = {}
+        self.stats = {'refreshed': 0}
+
+    def coin_state(self, coin: str) -> Optional[Tuple[int, Optional[float]]]:
+        return self._states.get(coin)
+
+    async def refresh(self, coins):
+        """Перечитывает пороги монет, у которых изменились подписки"""
+        versions = await self.db.get_subscription_versions(list(coins))
+        for coin, version in versions.items():
+            state = self._states.get(coin)
+            if state is None or state[0] != version:
+                # Версия прочитана раньше порогов: изменение между запросами перечитается позже
+                _, _, thresholds, _ = await self.db.get_coin_subscribers(coin)
+                self._states[coin] = (version, min(thresholds, default=None))
+                self.stats['refreshed'] += 1
+
+class SnapshotPublisher(PriceChecker):
+    """
+    Получение цен для воркеров
+
+    Цены запрашиваются так же, как в PriceChecker (адаптивный опрос, поток или
+    раз в минуту), но пороги не проверяются: цены тика одной строкой JSON
+    уходят всем воркерам через Unix сокет. Подключившийся воркер сразу
+    получает последние известные цены всех монет. Воркер, который не успевает
+    читать, отключается и получает их же после переподключения.
+    """
+
+    def __init__(self, application, socket_path: str = None):
+        super().__init__(application)
+        self.engine = ThresholdSummary()
+        self.socket_path = socket_path or Config.SHARD_SOCKET_PATH
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self._latest: Dict[str, float] = {}
+        self.stats = {'snapshots': 0, 'connects': 0, 'dropped': 0}
+
+    def start(self):
+        super().start()
+        self._tasks.append(asyncio.create_task(self._serve()))
+
+    async def _serve(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # сокет прошлого запуска
+        server = await asyncio.start_unix_server(self._client, self.socket_path)
+        logger.info(f"📤 Снимки цен для воркеров: {self.socket_path}")
+        async with server:
+            await server.serve_forever()
+
+    async def _client(self, reader, writer):
+        self._clients.add(writer)
+        self.stats['connects'] += 1
+        if self._latest:
+            self._send(writer, self._encode(self._latest))
+        try:
+            await reader.read()  # воркер ничего не пишет, ждем отключения
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _encode(prices: Dict[str, float]) -> bytes:
+        return json.dumps(prices, separators=(',', ':')).encode() + b'\n'
+
+    def _send(self, writer, line: bytes):
+        if writer.transport.get_write_buffer_size() + len(line) > SNAPSHOT_LIMIT:
+            self.stats['dropped'] += 1
+            logger.warning("Воркер не успевает читать снимки цен, отключаем")
+            self._clients.discard(writer)
+            writer.close()
+            return
+        writer.write(line)
+
+    async def process_prices(self, prices: dict):
+        """Рассылает цены тика воркерам и обновляет пороги для опроса"""
+        self._latest.update(prices)
+        line = self._encode(prices)
+        for writer in list(self._clients):
+            self._send(writer, line)
+        self.stats['snapshots'] += 1
+        await self.engine.refresh(prices)
+
+    async def shutdown(self, timeout: float = 10.0):
+        await super().shutdown(timeout)
+        for writer in list(self._clients):
+            writer.close()
+        self._clients.clear()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        logger.info(f"Рассылка снимков цен остановлена: {self.stats}")
+
+class ShardWorker(PriceChecker):
+    """
+    Процесс проверки порогов для монет своих шардов
+
+    Получает снимки цен от SnapshotPublisher и проверяет только монеты
+    арендованных шардов. У монеты один воркер, поэтому индекс подписчиков и
+    версии монеты меняет только он (и бот, когда пользователи меняют
+    подписки). Общий лимит рассылки Telegram делится между воркерами.
+    """
+
+    def __init__(self, application, index: int, shards: int, socket_path: str = None,
+                 leases: ShardLeases = None):
+        super().__init__(application)
+        self.index = index
+        self.shards = shards
+        self.socket_path = socket_path or Config.SHARD_SOCKET_PATH
+        self.leases = leases or ShardLeases(db.db_path, index, shards)
+        # Очередь уведомлений общая для воркеров: после переезда шарда ключи его
+        # уведомлений видны новому владельцу, и повтора не будет
+        self.outbox = Outbox(Outbox.default_path('-workers'), owner=index)
+        self.notifier = Notifier(application.bot, rate_per_second=Config.NOTIFY_RATE_PER_SECOND / shards,
+                                 on_done=self.outbox.on_done)
+        self.digest = DigestCollector(self.notifier)
+        self._pending: Dict[str, float] = {}  # последние необработанные цены
+        self._pending_event = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._evaluator = None
+        self.stats = {'snapshots': 0, 'evaluated': 0, 'reconnects': 0}
+
+    async def run(self):
+        """Работает до вызова stop()"""
+        self.running = True
+        logger.info(f"Воркер {self.index} из {self.shards} запущен")
+        self._tasks = [
+            asyncio.create_task(self._lease_loop()),
+            asyncio.create_task(self._read_loop()),
+            asyncio.create_task(self.outbox.run(self.digest))
+        ]
+        self._evaluator = asyncio.create_task(self._evaluate_loop())
+        await self._stopped.wait()
+
+    async def _lease_loop(self):
+        shards = set()
+        while True:
+            try:
+                held = await asyncio.to_thread(self.leases.refresh)
+                if held != shards:
+                    logger.info(f"Воркер {self.index}: шарды {sorted(held)}")
+                    shards = held
+            except sqlite3.Error as e:
+                logger.error(f"Воркер {self.index}: ошибка продления аренды шардов: {e}")
+            await asyncio.sleep(self.leases.ttl / 3)
+
+    async def _read_loop(self):
+        """Читает снимки цен; пока предыдущий проверяется, новые цены объединяются"""
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=SNAPSHOT_LIMIT)
+            except OSError as e:
+                logger.debug(f"Воркер {self.index}: нет сокета снимков цен: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    self._pending.update(json.loads(line))
+                    self._pending_event.set()
+                    self.stats['snapshots'] += 1
+            except (ConnectionError, ValueError) as e:
+                logger.warning(f"Воркер {self.index}: ошибка чтения снимков цен: {e}")
+            finally:
+                writer.close()
+
+            self.stats['reconnects'] += 1
+            await asyncio.sleep(1)
+
+    async def _evaluate_loop(self):
+        while self.running:
+            await self._pending_event.wait()
+            self._pending_event.clear()
+            prices, self._pending = self._pending, {}
+
+            shards = self.leases.active()
+            prices = {coin: price for coin, price in prices.items() if shard_of(coin, self.shards) in shards}
+            if not prices or not self.running:
+                continue
+            try:
+                await self.process_prices(prices)
+                self.stats['evaluated'] += len(prices)
+            except Exception as e:
+                logger.error(f"Воркер {self.index}: ошибка проверки цен: {e}")
+
+    def stop(self):
+        super().stop()
+        self._pending_event.set()
+        self._stopped.set()
+
+    async def shutdown(self, timeout: float = 10.0):
+        """Доделывает текущий снимок, отправляет уведомления и освобождает шарды"""
+        self.stop()
+        if self._evaluator is not None:
+            await self._evaluator
+        await super().shutdown(timeout)
+        await asyncio.to_thread(self.leases.release)
+        logger.info(f"Воркер {self.index} остановлен: {self.stats}")
+
+async def _run_worker(index: int, shards: int):
+    application = Application.builder().token(Config.TELEGRAM_TOKEN).build()
+    async with application:  # только бот для отправки, без получения обновлений
+        worker = ShardWorker(application, index, shards)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, worker.stop)
+        await worker.run()
+        await worker.shutdown()
+
+def run_worker(index: int, shards: int):
+    """Точка входа процесса-воркера"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if Config.DB_BACKEND != 'sqlite':
+        logger.error("❌ Воркерам нужна общая база: DB_BACKEND=sqlite")
+        sys.exit(1)
+    try:
+        asyncio.run(_run_worker(index, shards))
+    finally:
+        db.close()
+
+class WorkerPool:
+    """Процессы-воркеры на этой машине; завершившийся воркер запускается снова"""
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or Config.SHARD_WORKERS
+        self._context = multiprocessing.get_context('spawn')
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._supervisor = None
+        self.stats = {'restarts': 0}
+
+    def _spawn(self, index: int):
+        process = self._context.Process(target=run_worker, args=(index, self.workers),
+                                        name=f"shard-worker-{index}")
+        process.start()
+        self._processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+        self._supervisor = asyncio.create_task(self._supervise())
+        logger.info(f"✅ Запущено воркеров проверки цен: {self.workers}")
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(Config.SHARD_LEASE_TTL)
+            for index, process in list(self._processes.items()):
+                if not process.is_alive():
+                    # Пока воркер перезапускается, его шард через SHARD_LEASE_TTL заберут другие
+                    logger.warning(f"Воркер {index} завершился (код {process.exitcode}), перезапускаем")
+                    self.stats['restarts'] += 1
+                    self._spawn(index)
+
+    async def stop(self, timeout: float = 15.0):
+        """Останавливает воркеров (SIGTERM: каждый дорассылает свои уведомления)"""
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+        for process in self._processes.values():
+            process.terminate()
+
+        deadline = time.monotonic() + timeout
+        for index, process in self._processes.items():
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Воркер {index} не остановился за {timeout} сек")
+                process.kill()
+        self._processes = {}
+
+if __name__ == '__main__':
+    # Воркер под внешним супервизором: python sharding.py <номер> <число воркеров>
+    if len(sys.argv) < 3:
+        print("Использование: python sharding.py <номер воркера> <число воркеров>")
+        sys.exit(1)
+    run_worker(int(sys.argv[1]), int(sys.argv[2]))
@@ -0,0 +1,429 @@
+import os
+import sys
+import sqlite3
+import logging
+import threading
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id   INTEGER PRIMARY KEY,
+    username  TEXT,
+    threshold REAL NOT NULL DEFAULT 1.0
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    coin    TEXT NOT NULL,
+    PRIMARY KEY (user_id, coin)
+);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_coin ON subscriptions(coin);
+CREATE TABLE IF NOT EXISTS coin_thresholds (
+    user_id   INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    coin      TEXT NOT NULL,
+    threshold REAL NOT NULL,
+    PRIMARY KEY (user_id, coin)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS last_prices (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    coin    TEXT NOT NULL,
+    price   REAL NOT NULL,
+    PRIMARY KEY (user_id, coin)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS coin_versions (
+    coin    TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS subscription_versions (
+    coin    TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+TOUCH_SQL = (
+    "INSERT INTO coin_versions (coin, version) VALUES (?, 1) "
+    "ON CONFLICT(coin) DO UPDATE SET version = version + 1"
+)
+# Подписки и пороги: обновления последних цен эту версию не меняют
+SUBSCRIPTION_TOUCH_SQL = (
+    "INSERT INTO subscription_versions (coin, version) VALUES (?, 1) "
+    "ON CONFLICT(coin) DO UPDATE SET version = version + 1"
+)
+
+# Сколько монет спрашивать списком IN (...); для большего числа читается вся таблица версий
+VERSION_QUERY_MAX_IDS = 500
+
+class SQLiteDatabase:
+    """Хранилище пользователей в SQLite (WAL) с тем же API, что и Database"""
+    
+    # Запросы обращаются к диску - AsyncDatabase всегда выполняет их в пуле потоков
+    IN_MEMORY = False
+    
+    def __init__(self, db_path=None, json_path=None, import_existing=True):
+        if db_path:
+            self.db_path = db_path
+        elif Config.SQLITE_PATH:
+            self.db_path = Config.SQLITE_PATH
+        elif os.path.exists('/tmp'):  # Railway использует /tmp для записи
+            self.db_path = '/tmp/users_data.sqlite3'
+        else:
+            self.db_path = os.path.join(os.path.dirname(__file__), 'users_data.sqlite3')
+        
+        is_new = not os.path.exists(self.db_path)
+        
+        # Соединение используют и бот, и поток проверки цен - доступ через блокировку
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        logger.info(f"📁 База данных SQLite открыта: {self.db_path}")
+        
+        # Первый запуск на SQLite - переносим данные JSON хранилища. После первого
+        # двоичного снимка users_data.json уже нет: данные в .snap и .journal
+        if is_new and import_existing:
+            json_path = json_path or self.db_path.rsplit('.', 1)[0] + '.json'
+            base = os.path.splitext(json_path)[0]
+            if any(os.path.exists(path) for path in (json_path, base + '.snap', base + '.journal')):
+                self.import_json(json_path)
+    
+    def _fetchall(self, sql, params=()):
+        # Строки читаются под блокировкой: курсор общего соединения нельзя
+        # дочитывать, пока другой поток выполняет запрос
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+    
+    def _fetchone(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+    
+    def _write(self, statements, touched=(), prices_only=False):
+        """
+        Выполняет несколько запросов в одной транзакции
+        
+        Версии данных подписчиков монет touched (для ThresholdEngine) растут на 1
+        в той же транзакции: базу могут менять и другие процессы (воркеры проверки цен).
+        Если изменились не только последние цены (prices_only), растут и версии подписок.
+        """
+        with self._lock:
+            try:
+                # Блокировка записи сразу: при чтении внутри транзакции другой процесс
+                # мог бы успеть начать запись, и транзакция завершилась бы с SQLITE_BUSY
+                self._conn.execute("BEGIN IMMEDIATE")
+                cursor = None
+                for sql, params in statements:
+                    cursor = self._conn.execute(sql, params)
+                self._conn.executemany(TOUCH_SQL, [(coin,) for coin in touched])
+                if not prices_only:
+                    self._conn.executemany(SUBSCRIPTION_TOUCH_SQL, [(coin,) for coin in touched])
+                self._conn.execute("COMMIT")
+                return cursor
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def import_json(self, json_path):
+        """Разовый импорт данных JSON хранилища (снимок users_data.snap или .json и журнал)"""
+        from database import Database
+        
+        try:
+            # Только чтение: импорт не должен сворачивать журнал и переписывать исходные файлы
+            data = Database.read(json_path).to_json()
+        except Exception as e:
+            logger.error(f"❌ Не удалось прочитать {json_path}: {e}")
+            return 0
+        
+        statements = []
+        for user_id_str, user in data.get('users', {}).items():
+            user_id = int(user_id_str)
+            statements.append((
+                "INSERT OR REPLACE INTO users (user_id, username, threshold) VALUES (?, ?, ?)",
+                (user_id, user.get('username'), float(user.get('threshold', 1.0)))
+            ))
+            for coin in user.get('coins', []):
+                statements.append((
+                    "INSERT OR IGNORE INTO subscriptions (user_id, coin) VALUES (?, ?)",
+                    (user_id, coin)
+                ))
+            for coin, threshold in user.get('coin_thresholds', {}).items():
+                statements.append((
+                    "INSERT OR REPLACE INTO coin_thresholds (user_id, coin, threshold) VALUES (?, ?, ?)",
+                    (user_id, coin, float(threshold))
+                ))
+            for coin, price in user.get('last_prices', {}).items():
+                statements.append((
+                    "INSERT OR REPLACE INTO last_prices (user_id, coin, price) VALUES (?, ?, ?)",
+                    (user_id, coin, float(price))
+                ))
+        
+        self._write(statements)
+        count = len(data.get('users', {}))
+        logger.info(f"📥 Импортировано пользователей из JSON: {count}")
+        return count
+    
+    def add_user(self, user_id, username):
+        """Добавление нового пользователя"""
+        cursor = self._write([(
+            "INSERT OR IGNORE INTO users (user_id, username, threshold) VALUES (?, ?, 1.0)",
+            (int(user_id), username)
+        )])
+        
+        if cursor.rowcount:
+            logger.info(f"👤 Добавлен новый пользователь: {username} ({user_id})")
+            return True
+        
+        logger.debug(f"ℹ️ Пользователь уже существует: {username}")
+        return False
+    
+    def _user_exists(self, user_id):
+        return self._fetchone("SELECT 1 FROM users WHERE user_id = ?", (int(user_id),)) is not None
+    
+    def get_user(self, user_id):
+        """Получение данных пользователя (в том же виде, что и в JSON)"""
+        user_id = int(user_id)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT username, threshold FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            
+            coins = [coin for (coin,) in self._conn.execute(
+                "SELECT coin FROM subscriptions WHERE user_id = ? ORDER BY rowid", (user_id,))]
+            coin_thresholds = dict(self._conn.execute(
+                "SELECT coin, threshold FROM coin_thresholds WHERE user_id = ?", (user_id,)))
+            last_prices = dict(self._conn.execute(
+                "SELECT coin, price FROM last_prices WHERE user_id = ?", (user_id,)))
+        
+        return {
+            'username': row[0],
+            'coins': coins,
+            'threshold': row[1],
+            'coin_thresholds': coin_thresholds,
+            'last_prices': last_prices
+        }
+    
+    def get_user_coins(self, user_id):
+        """Получение списка монет пользователя"""
+        return [coin for (coin,) in self._fetchall(
+            "SELECT coin FROM subscriptions WHERE user_id = ? ORDER BY rowid", (int(user_id),))]
+    
+    def add_coin(self, user_id, coin_name):
+        """Добавление монеты пользователю"""
+        with self._lock:  # проверка и вставка - одна операция для других потоков
+            if not self._user_exists(user_id):
+                logger.warning(f"⚠️ Пользователь {user_id} не найден")
+                return False
+            
+            cursor = self._write([(
+                "INSERT OR IGNORE INTO subscriptions (user_id, coin) VALUES (?, ?)",
+                (int(user_id), coin_name)
+            )], touched=[coin_name])
+        
+        if cursor.rowcount:
+            logger.info(f"✅ Монета '{coin_name}' добавлена пользователю {user_id}")
+            return True
+        
+        logger.debug(f"ℹ️ Монета '{coin_name}' уже есть у пользователя {user_id}")
+        return False
+    
+    def remove_coin(self, user_id, coin_name):
+        """Удаление монеты у пользователя"""
+        params = (int(user_id), coin_name)
+        cursor = self._write([
+            ("DELETE FROM coin_thresholds WHERE user_id = ? AND coin = ?", params),
+            ("DELETE FROM last_prices WHERE user_id = ? AND coin = ?", params),
+            ("DELETE FROM subscriptions WHERE user_id = ? AND coin = ?", params),
+        ], touched=[coin_name])
+        
+        if cursor.rowcount:
+            logger.info(f"🗑 Монета '{coin_name}' удалена у пользователя {user_id}")
+            return True
+        return False
+    
+    def set_threshold(self, user_id, threshold):
+        """Установка общего порога для пользователя"""
+        with self._lock:
+            cursor = self._write([(
+                "UPDATE users SET threshold = ? WHERE user_id = ?", (float(threshold), int(user_id))
+            )], touched=self.get_user_coins(user_id))
+        
+        if cursor.rowcount:
+            logger.info(f"⚙️ Общий порог установлен: {threshold}% для {user_id}")
+            return True
+        return False
+    
+    def set_coin_threshold(self, user_id, coin_name, threshold):
+        """Установка индивидуального порога для монеты"""
+        with self._lock:
+            if not self._user_exists(user_id):
+                return False
+            
+            self._write([(
+                "INSERT OR REPLACE INTO coin_thresholds (user_id, coin, threshold) VALUES (?, ?, ?)",
+                (int(user_id), coin_name, float(threshold))
+            )], touched=[coin_name])
+        logger.info(f"🔸 Индивидуальный порог для {coin_name}: {threshold}%")
+        return True
+    
+    def get_coin_threshold(self, user_id, coin_name):
+        """Получение порога для монеты (индивидуальный или общий)"""
+        row = self._fetchone(
+            "SELECT COALESCE(t.threshold, u.threshold) FROM users u "
+            "LEFT JOIN coin_thresholds t ON t.user_id = u.user_id AND t.coin = ? "
+            "WHERE u.user_id = ?", (coin_name, int(user_id))
+        )
+        return row[0] if row else 1.0
+    
+    def has_individual_threshold(self, user_id, coin_name):
+        """Проверка, задан ли для монеты индивидуальный порог"""
+        return self._fetchone(
+            "SELECT 1 FROM coin_thresholds WHERE user_id = ? AND coin = ?", (int(user_id), coin_name)
+        ) is not None
+    
+    def update_price(self, user_id, coin_name, price):
+        """Обновление последней известной цены"""
+        with self._lock:
+            if not self._user_exists(user_id):
+                return False
+            
+            self._write([(
+                "INSERT OR REPLACE INTO last_prices (user_id, coin, price) VALUES (?, ?, ?)",
+                (int(user_id), coin_name, float(price))
+            )], touched=[coin_name], prices_only=True)
+        logger.debug(f"💰 Обновлена цена {coin_name}: ${price}")
+        return True
+    
+    def update_prices(self, updates):
+        """Обновление последних цен пачкой в одной транзакции"""
+        statements = [(
+            "INSERT OR REPLACE INTO last_prices (user_id, coin, price) "
+            "SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM users WHERE user_id = ?)",
+            (int(user_id), coin_name, float(price), int(user_id))
+        ) for user_id, coin_name, price in updates]
+        if not statements:
+            return 0
+        
+        # Каждая монета пачки - ровно +1 к версии, даже если пользователя уже нет
+        coins = {coin_name for _, coin_name, _ in updates}
+        with self._lock:
+            before = self._conn.total_changes
+            self._write(statements, touched=coins, prices_only=True)
+            # Версия каждой монеты - одна измененная строка coin_versions
+            applied = self._conn.total_changes - before - len(coins)
+        logger.debug(f"💰 Обновлено цен: {applied}")
+        return applied
+    
+    def get_last_price(self, user_id, coin_name):
+        """Получение последней известной цены"""
+        row = self._fetchone(
+            "SELECT price FROM last_prices WHERE user_id = ? AND coin = ?", (int(user_id), coin_name)
+        )
+        return row[0] if row else None
+    
+    def get_all_users(self):
+        """Получение списка всех пользователей"""
+        return [str(user_id) for (user_id,) in self._fetchall("SELECT user_id FROM users")]
+    
+    def get_all_users_coins(self):
+        """Список всех отслеживаемых монет без повторов"""
+        return [coin for (coin,) in self._fetchall("SELECT DISTINCT coin FROM subscriptions")]
+    
+    def get_users_for_coin(self, coin_name):
+        """Подписчики монеты с действующим порогом и последней ценой"""
+        rows = self._fetchall(
+            "SELECT s.user_id, COALESCE(t.threshold, u.threshold), p.price "
+            "FROM subscriptions s "
+            "JOIN users u ON u.user_id = s.user_id "
+            "LEFT JOIN coin_thresholds t ON t.user_id = s.user_id AND t.coin = s.coin "
+            "LEFT JOIN last_prices p ON p.user_id = s.user_id AND p.coin = s.coin "
+            "WHERE s.coin = ?", (coin_name,)
+        )
+        return [
+            {'user_id': user_id, 'threshold': threshold, 'last_price': last_price}
+            for user_id, threshold, last_price in rows
+        ]
+    
+    def get_coin_versions(self, coin_names):
+        """Версии данных подписчиков монет: {монета: версия}"""
+        return self._versions('coin_versions', coin_names)
+    
+    def get_subscription_versions(self, coin_names):
+        """Версии подписок и порогов монет: {монета: версия}; обновления цен их не меняют"""
+        return self._versions('subscription_versions', coin_names)
+    
+    def _versions(self, table, coin_names):
+        coin_names = list(coin_names)
+        if len(coin_names) > VERSION_QUERY_MAX_IDS:
+            versions = dict(self._fetchall(f"SELECT coin, version FROM {table}"))
+        else:
+            versions = dict(self._fetchall(
+                f"SELECT coin, version FROM {table} WHERE coin IN ({','.join('?' * len(coin_names))})",
+                coin_names
+            ))
+        return {coin_name: versions.get(coin_name, 0) for coin_name in coin_names}
+    
+    def get_coin_subscribers(self, coin_name):
+        """
+        Подписчики монеты по колонкам (для ThresholdEngine)
+        
+        Returns:
+            (версия, id пользователей, действующие пороги, последние цены или None)
+        """
+        with self._lock:
+            # Версия читается раньше строк: если другой процесс изменит монету
+            # между запросами, версия окажется старой и индекс перечитается
+            version = self.get_coin_versions([coin_name])[coin_name]
+            rows = self.get_users_for_coin(coin_name)
+        return (
+            version,
+            [row['user_id'] for row in rows],
+            [row['threshold'] for row in rows],
+            [row['last_price'] for row in rows]
+        )
+    
+    def has_coin(self, user_id, coin_name):
+        """Проверка, есть ли у пользователя монета"""
+        return self._fetchone(
+            "SELECT 1 FROM subscriptions WHERE user_id = ? AND coin = ?", (int(user_id), coin_name)
+        ) is not None
+    
+    def remove_individual_threshold(self, user_id, coin_name):
+        """Удаление индивидуального порога"""
+        cursor = self._write([(
+            "DELETE FROM coin_thresholds WHERE user_id = ? AND coin = ?", (int(user_id), coin_name)
+        )], touched=[coin_name])
+        
+        if cursor.rowcount:
+            logger.info(f"🗑 Удален инд. порог для {coin_name}")
+            return True
+        return False
+    
+    def clear_user_data(self, user_id):
+        """Очистка всех данных пользователя"""
+        with self._lock:
+            coins = self.get_user_coins(user_id)
+            cursor = self._write([("DELETE FROM users WHERE user_id = ?", (int(user_id),))], touched=coins)
+        
+        if cursor.rowcount:
+            logger.info(f"🧹 Данные пользователя {user_id} очищены")
+            return True
+        return False
+    
+    def close(self):
+        """Закрывает соединение с базой"""
+        with self._lock:
+            self._conn.close()
+
+if __name__ == '__main__':
+    # Разовый импорт: python sqlite_database.py users_data.json [users_data.sqlite3]
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2:
+        print("Использование: python sqlite_database.py <users_data.json> [база.sqlite3]")
+        sys.exit(1)
+    
+    store = SQLiteDatabase(db_path=sys.argv[2] if len(sys.argv) > 2 else None, import_existing=False)
+    store.import_json(sys.argv[1])
+    store.close()
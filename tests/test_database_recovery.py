@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database import Database
+
+class CorruptSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'users_data.json')
+        self.snapshot_format = Config.DB_SNAPSHOT_FORMAT
+
+        # Старый JSON с одним пользователем, затем переход на двоичный снимок
+        Config.DB_SNAPSHOT_FORMAT = 'json'
+        store = Database(self.path)
+        store.add_user(1, 'alice')
+        store.close()
+        Config.DB_SNAPSHOT_FORMAT = 'binary'
+        self.store = Database(self.path)
+        self.store.add_user(2, 'bob')
+        self.store.flush()
+        self.store.compact()  # bob только в снимке, журнал пуст
+
+    def tearDown(self):
+        Config.DB_SNAPSHOT_FORMAT = self.snapshot_format
+        self.dir.cleanup()
+
+    def _corrupt_and_reload(self):
+        self.store.flush()
+        self.store._closed = True  # процесс упал: без сворачивания журнала при выходе
+        self.store._flusher.join()
+        with open(self.store.snapshot_path, 'r+b') as f:
+            f.write(b'XXXX')
+        store = Database(self.path)
+        store.close()
+        return sorted(store.get_all_users())
+
+    def test_empty_journal_falls_back_to_migrated_json(self):
+        with self.assertLogs('database', 'ERROR'):
+            users = self._corrupt_and_reload()
+        self.assertEqual(users, ['1'])
+
+    def test_journal_after_snapshot_is_replayed(self):
+        self.store.add_user(3, 'carol')
+        with self.assertLogs('database', 'ERROR'):
+            users = self._corrupt_and_reload()
+        self.assertEqual(users, ['1', '3'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notifier import Notification
+from outbox import Outbox
+from threshold_engine import Alert
+
+class OutboxDedupTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.outbox = Outbox(os.path.join(self.dir.name, 'outbox.sqlite3'))
+
+    async def asyncTearDown(self):
+        await self.outbox.close()
+        self.dir.cleanup()
+
+    async def test_same_alert_before_save_is_duplicate(self):
+        alert = Alert(1, 'tether', 1.0, 0.998, 0.2)
+        self.assertEqual(len(await self.outbox.put([alert])), 1)
+        # Цена не сохранена (например, процесс упал) - то же срабатывание не повторяется
+        self.assertEqual(await self.outbox.put([alert]), [])
+
+    async def test_anchor_returning_to_old_price_alerts_again(self):
+        # Стейблкоин: 1.0 -> 0.998 -> 1.0 -> 0.998, каждое движение - отдельное срабатывание
+        down = Alert(1, 'tether', 1.0, 0.998, 0.2)
+        up = Alert(1, 'tether', 0.998, 1.0, 0.2)
+        for alert in (down, up, down):
+            new = await self.outbox.put([alert])
+            self.assertEqual([a for _, a in new], [alert])
+            await self.outbox.mark_anchored([alert])
+
+        # Ни одно уведомление еще не доставлено - все три остаются в очереди
+        self.assertEqual(self.outbox.get_stats()['depth'], 3)
+
+class OutboxInFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.outbox = Outbox(os.path.join(self.dir.name, 'outbox.sqlite3'))
+
+    async def asyncTearDown(self):
+        await self.outbox.close()
+        self.dir.cleanup()
+
+    def _take_due(self):
+        # Уведомление ждет в Notifier дольше OUTBOX_RETRY_MAX
+        self.outbox._connect().execute("UPDATE outbox SET next_attempt = 0")
+        return [row_id for row_id, _ in self.outbox._take_due(frozenset(self.outbox._in_flight))]
+
+    async def test_not_resent_until_outcome(self):
+        [(row_id, _)] = await self.outbox.put([Alert(1, 'bitcoin', 100.0, 110.0, 10.0)])
+        self.assertEqual(self._take_due(), [])
+
+        self.outbox.on_done(Notification(1, 'text', None, 0.0, [row_id]), 'failed')
+        await self.outbox.flush_results()
+        self.assertEqual(self._take_due(), [row_id])
+
+class SharedOutboxHandoverTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.dir.name, 'outbox.sqlite3')
+        self.old_owner = Outbox(path, owner=0)
+        self.new_owner = Outbox(path, owner=1)
+
+    async def asyncTearDown(self):
+        await self.old_owner.close()
+        await self.new_owner.close()
+        self.dir.cleanup()
+
+    async def test_new_lease_owner_does_not_resend(self):
+        alert = Alert(1, 'bitcoin', 100.0, 110.0, 10.0)
+        # Прежний владелец шарда поставил уведомление, но цену еще не сохранил
+        [(row_id, _)] = await self.old_owner.put([alert])
+
+        # Аренда переехала: новый владелец видит то же срабатывание
+        self.assertEqual(await self.new_owner.put([alert]), [])
+        await self.new_owner.mark_anchored([alert])
+        self.new_owner._connect().execute("UPDATE outbox SET next_attempt = 0")
+        self.assertEqual(self.new_owner._take_due(frozenset()), [])
+
+        # Повторяет уведомление тот, кто его поставил
+        self.old_owner.on_done(Notification(1, 'text', None, 0.0, [row_id]), 'failed')
+        await self.old_owner.flush_results()
+        self.old_owner._connect().execute("UPDATE outbox SET next_attempt = 0")
+        due = self.old_owner._take_due(frozenset(self.old_owner._in_flight))
+        self.assertEqual([r for r, _ in due], [row_id])
+
+if __name__ == '__main__':
+    unittest.main()
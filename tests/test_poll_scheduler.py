@@ -0,0 +1,70 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from poll_scheduler import PollScheduler
+
+class Clock:
+    now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class FakeEngine:
+    def coin_state(self, coin):
+        return 0, 1.0
+
+class FlakyChecker:
+    def __init__(self):
+        self.engine = FakeEngine()
+        self.fail = True
+        self.calls = []
+
+    async def check_coins(self, coins):
+        self.calls.append(list(coins))
+        if self.fail:
+            raise ConnectionError("провайдер недоступен")
+        return {coin: 1.0 for coin in coins}
+
+class FakeDatabase:
+    async def get_all_users_coins(self):
+        return ['bitcoin', 'ethereum']
+
+    async def get_subscription_versions(self, coins):
+        return {coin: 0 for coin in coins}
+
+class NoHistory:
+    def points(self, coin, seconds=None):
+        return []
+
+class PollSchedulerFailureTest(unittest.IsolatedAsyncioTestCase):
+    async def test_failed_round_is_rescheduled(self):
+        clock = Clock()
+        checker = FlakyChecker()
+        scheduler = PollScheduler(checker, FakeDatabase(), NoHistory(), clock)
+
+        with self.assertRaises(ConnectionError):
+            await scheduler.poll_due()
+        self.assertEqual(scheduler.next_due(), clock.now + Config.POLL_MIN_INTERVAL)
+
+        checker.fail = False
+        clock.now += Config.POLL_MIN_INTERVAL
+        prices = await scheduler.poll_due()
+        self.assertEqual(sorted(prices), ['bitcoin', 'ethereum'])
+
+    async def test_sync_returns_coins_missing_from_queue(self):
+        clock = Clock()
+        scheduler = PollScheduler(FlakyChecker(), FakeDatabase(), NoHistory(), clock)
+        await scheduler._sync_coins(clock.now)
+        # Монеты сняты с очереди, а опрос так и не закончился
+        self.assertEqual(sorted(scheduler._take_due(clock.now)), ['bitcoin', 'ethereum'])
+        self.assertIsNone(scheduler.next_due())
+
+        await scheduler._sync_coins(clock.now)
+        self.assertEqual(scheduler.next_due(), clock.now)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crypto_api import PriceCache
+
+class PriceCacheOutageTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = PriceCache(ttl=60, stale_while_revalidate=30, stale_if_error=3600,
+                                stale_wait=0.05, error_backoff=30)
+        self.cache.set('bitcoin', 100.0)
+        # Цена старше ttl + stale_while_revalidate, но еще в пределах stale_if_error
+        price, fetched_at, as_of = self.cache._entries['bitcoin']
+        self.cache._entries['bitcoin'] = (price, fetched_at - 120, as_of - 120)
+        self.fetches = 0
+
+    async def _failing_fetch(self, coin_id):
+        # Провайдеры недоступны: ответ только после таймаутов и повторов
+        self.fetches += 1
+        await asyncio.sleep(0.5)
+        return None
+
+    async def test_stale_quote_is_served_without_waiting(self):
+        for _ in range(3):
+            started = time.monotonic()
+            quote = await self.cache.get_or_fetch('bitcoin', self._failing_fetch)
+            self.assertLess(time.monotonic() - started, 0.3)
+            self.assertEqual(quote.price, 100.0)
+            self.assertTrue(quote.stale)
+        self.assertEqual(self.fetches, 1)
+
+    async def test_failed_fetch_is_not_repeated_during_backoff(self):
+        await self.cache.get_or_fetch('bitcoin', self._failing_fetch)
+        await asyncio.sleep(0.6)  # фоновая загрузка закончилась ошибкой
+        quote = await self.cache.get_or_fetch('bitcoin', self._failing_fetch)
+        self.assertEqual(quote.price, 100.0)
+        self.assertEqual(self.fetches, 1)
+
+        # Пачка цен от опроса снимает запрет
+        self.cache.set_many({'bitcoin': 101.0})
+        quote = await self.cache.get_or_fetch('bitcoin', self._failing_fetch)
+        self.assertEqual((quote.price, quote.stale), (101.0, False))
+
+    async def test_miss_without_quote_waits_for_fetch(self):
+        async def fetch(coin_id):
+            await asyncio.sleep(0.1)
+            return 5.0
+        quote = await self.cache.get_or_fetch('ethereum', fetch)
+        self.assertEqual(quote.price, 5.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_history import PriceHistory
+
+class PriceHistoryOpenTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'history.bin')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_file_opened_on_first_use(self):
+        history = PriceHistory(self.path, capacity=8, resolution=0)
+        self.assertFalse(os.path.exists(self.path))
+
+        history.record('bitcoin', 100.0, timestamp=1.0)
+        history.close()
+
+        reopened = PriceHistory(self.path, capacity=8, resolution=0)
+        self.assertEqual(reopened.latest('bitcoin'), (1.0, 100.0))
+        reopened.close()
+
+    def test_corrupt_file_is_replaced(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\xff' * 4096)
+
+        history = PriceHistory(self.path, capacity=8, resolution=0)
+        history.record('bitcoin', 100.0, timestamp=1.0)
+        self.assertEqual(history.points('bitcoin'), [(1.0, 100.0)])
+        history.close()
+        self.assertEqual(len([name for name in os.listdir(self.dir.name) if '.corrupt-' in name]), 1)
+
+    def test_failed_open_leaves_no_state(self):
+        missing_dir = os.path.join(self.dir.name, 'missing')
+        history = PriceHistory(os.path.join(missing_dir, 'history.bin'), capacity=8, resolution=0)
+
+        with self.assertRaises(OSError):
+            history.record('bitcoin', 100.0, timestamp=1.0)
+        self.assertIsNone(history._file)
+        self.assertIsNone(history._mm)
+
+        # Каталог появился - следующее обращение открывает файл заново
+        os.mkdir(missing_dir)
+        history.record('bitcoin', 100.0, timestamp=1.0)
+        self.assertEqual(history.latest('bitcoin'), (1.0, 100.0))
+        history.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import price_stream
+from price_stream import PriceStream
+
+class FlakyDatabase:
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.calls = 0
+
+    async def get_all_users_coins(self):
+        self.calls += 1
+        if self.calls == 1:
+            raise OSError("база недоступна")
+        self.stream.stop()
+        return []
+
+class RecordingChecker:
+    def __init__(self):
+        self.checked = []
+
+    async def check_coin_price(self, coin_id, price):
+        if coin_id == 'bitcoin':
+            raise RuntimeError("ошибка проверки")
+        self.checked.append((coin_id, price))
+
+class PriceStreamErrorsTest(unittest.IsolatedAsyncioTestCase):
+    def _stream(self, checker=None):
+        stream = PriceStream(checker or RecordingChecker())
+        stream.db = FlakyDatabase(stream)
+        return stream
+
+    async def test_database_error_does_not_end_stream(self):
+        stream = self._stream()
+        with mock.patch.object(price_stream.Config, 'PRICE_STREAM_RESUBSCRIBE_CHECK', 0):
+            await asyncio.wait_for(stream.run(), 5)
+        self.assertEqual(stream.db.calls, 2)
+
+    async def test_bad_tick_and_failed_check_keep_evaluating(self):
+        checker = RecordingChecker()
+        stream = self._stream(checker)
+        evaluator = asyncio.create_task(stream._evaluate_loop())
+        try:
+            with self.assertRaises(AttributeError):
+                stream._on_message('["не словарь"]')
+
+            with mock.patch.object(price_stream.price_history, 'record_many', side_effect=OSError("диск")):
+                stream._on_message('{"bitcoin": "100", "ethereum": "10"}')
+                await asyncio.sleep(0.05)
+            self.assertEqual(checker.checked, [('ethereum', 10.0)])
+
+            stream._on_message('{"ethereum": "11"}')
+            await asyncio.sleep(0.05)
+            self.assertEqual(checker.checked[-1], ('ethereum', 11.0))
+        finally:
+            evaluator.cancel()
+            await asyncio.gather(evaluator, return_exceptions=True)
+
+if __name__ == '__main__':
+    unittest.main()
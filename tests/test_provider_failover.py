@@ -0,0 +1,103 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from crypto_api import AsyncCryptoAPI
+from providers import CoinCapProvider, PriceProvider
+
+class StubProvider(PriceProvider):
+    """Провайдер без сети: знает часть монет, может ошибаться и отвечать медленно"""
+
+    def __init__(self, name, prices, error=None, delay=0.0):
+        super().__init__(f"http://{name}.invalid")
+        self.name = name
+        self.prices = prices
+        self.error = error
+        self.delay = delay
+        self.requests = []
+
+    async def _fetch_prices(self, api, coin_ids, priority):
+        self.requests.append(list(coin_ids))
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return {coin_id: self.prices[coin_id] for coin_id in coin_ids if coin_id in self.prices}
+
+class ProviderFailoverTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.hedge_delay = Config.HEDGE_DEFAULT_DELAY
+        Config.HEDGE_DEFAULT_DELAY = 0.05
+
+    def tearDown(self):
+        Config.HEDGE_DEFAULT_DELAY = self.hedge_delay
+
+    async def test_partial_answer_is_completed_by_next_provider(self):
+        primary = StubProvider('primary', {'bitcoin': 1.0})
+        secondary = StubProvider('secondary', {'bitcoin': 2.0, 'ethereum': 3.0})
+        api = AsyncCryptoAPI(providers=[primary, secondary])
+
+        prices = await api._fetch_prices(['bitcoin', 'ethereum'], 0)
+        self.assertEqual(prices, {'bitcoin': 1.0, 'ethereum': 3.0})
+        self.assertEqual(secondary.requests, [['ethereum']])
+
+    async def test_coins_missing_everywhere_are_reported_failed(self):
+        api = AsyncCryptoAPI(providers=[StubProvider('primary', {'bitcoin': 1.0}),
+                                        StubProvider('secondary', {})])
+        result = await api.get_multiple_prices_detailed(['bitcoin', 'unknown-coin'])
+        self.assertEqual(result.prices, {'bitcoin': 1.0})
+        self.assertEqual(result.failed_chunks, [['unknown-coin']])
+
+    async def test_error_fails_over(self):
+        primary = StubProvider('primary', {}, error=ConnectionError("недоступен"))
+        secondary = StubProvider('secondary', {'bitcoin': 2.0})
+        api = AsyncCryptoAPI(providers=[primary, secondary])
+        self.assertEqual(await api._fetch_prices(['bitcoin'], 0), {'bitcoin': 2.0})
+
+    async def test_all_providers_failing_raises(self):
+        api = AsyncCryptoAPI(providers=[StubProvider('primary', {}, error=ConnectionError("1")),
+                                        StubProvider('secondary', {}, error=ConnectionError("2"))])
+        with self.assertRaises(ConnectionError):
+            await api._fetch_prices(['bitcoin'], 0)
+        result = await api.get_multiple_prices_detailed(['bitcoin'])
+        self.assertEqual(result.failed_chunks, [['bitcoin']])
+
+    async def test_slow_primary_is_hedged(self):
+        primary = StubProvider('primary', {'bitcoin': 1.0}, delay=1.0)
+        secondary = StubProvider('secondary', {'bitcoin': 2.0})
+        api = AsyncCryptoAPI(providers=[primary, secondary])
+
+        started = asyncio.get_running_loop().time()
+        self.assertEqual(await api._fetch_prices(['bitcoin'], 0), {'bitcoin': 2.0})
+        self.assertLess(asyncio.get_running_loop().time() - started, 0.5)
+
+    async def test_failing_provider_is_put_on_cooldown(self):
+        primary = StubProvider('primary', {}, error=ConnectionError("недоступен"))
+        secondary = StubProvider('secondary', {'bitcoin': 2.0})
+        api = AsyncCryptoAPI(providers=[primary, secondary])
+
+        for _ in range(Config.PROVIDER_HEALTH_WINDOW // 2):
+            await api._fetch_prices(['bitcoin'], 0)
+        self.assertFalse(primary.is_available())
+
+        asked = len(primary.requests)
+        self.assertEqual(await api._fetch_prices(['bitcoin'], 0), {'bitcoin': 2.0})
+        self.assertEqual(len(primary.requests), asked)
+
+class CoinCapLimitTest(unittest.IsolatedAsyncioTestCase):
+    async def test_limit_covers_whole_chunk(self):
+        class FakeApi:
+            async def _request_json(self, url, params):
+                self.params = params
+                return {'data': []}
+
+        api = FakeApi()
+        coin_ids = [f"coin-{i}" for i in range(250)]
+        await CoinCapProvider('http://coincap.invalid').fetch_prices(api, coin_ids, 0)
+        self.assertEqual(api.params['limit'], 250)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database import Database
+from sqlite_database import SQLiteDatabase
+
+class SQLiteImportTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.dir.name, 'users_data.json')
+        self.sqlite_path = os.path.join(self.dir.name, 'users_data.sqlite3')
+        self.snapshot_format = Config.DB_SNAPSHOT_FORMAT
+        Config.DB_SNAPSHOT_FORMAT = 'binary'
+
+    def tearDown(self):
+        Config.DB_SNAPSHOT_FORMAT = self.snapshot_format
+        self.dir.cleanup()
+
+    def test_import_from_binary_snapshot_and_journal(self):
+        store = Database(self.json_path)
+        store.add_user(1, 'alice')
+        store.add_coin(1, 'bitcoin')
+        store.set_coin_threshold(1, 'bitcoin', 2.5)
+        store.compact()
+        # Второй пользователь есть только в журнале
+        store.add_user(2, 'bob')
+        store.flush()
+        try:
+            self.assertFalse(os.path.exists(self.json_path))
+            sqlite_store = SQLiteDatabase(self.sqlite_path)
+            self.assertEqual(sorted(sqlite_store.get_all_users()), ['1', '2'])
+            self.assertEqual(sqlite_store.get_user_coins(1), ['bitcoin'])
+            self.assertEqual(sqlite_store.get_coin_threshold(1, 'bitcoin'), 2.5)
+        finally:
+            store.close()
+
+if __name__ == '__main__':
+    unittest.main()
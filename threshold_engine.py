@@ -0,0 +1,351 @@
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from itertools import repeat
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from config import Config
+from database import async_db
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:  # без NumPy работает построчная проверка на чистом Python
+    np = None
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MISSING = float('nan')
+
+# Запас поиска по границам срабатывания (относительный): граница считается
+# умножением и может отличаться от проверки формулой на несколько ulp, поэтому
+# кандидаты берутся с запасом и проверяются той же формулой, что и раньше
+BAND_SLACK = 1e-9
+
+class Alert(NamedTuple):
+    """Сработавшая подписка"""
+    user_id: int
+    coin: str
+    old_price: float
+    new_price: float
+    change_percent: float
+
+class TickResult(NamedTuple):
+    alerts: List[Alert]
+    # Подписки без последней цены: цену нужно только запомнить, без уведомления
+    anchors: List[Tuple[int, str, float]]
+
+class CoinColumns:
+    """Подписчики одной монеты по колонкам: id, пороги, последние цены"""
+
+    __slots__ = ('version', 'min_threshold', 'user_ids', 'thresholds', 'last_prices', '_positions')
+
+    def __init__(self, version, user_ids, thresholds, last_prices, use_numpy):
+        self.version = version
+        self.min_threshold = min(thresholds, default=None)
+        last_prices = [MISSING if price is None else price for price in last_prices]
+        if use_numpy:
+            self.user_ids = np.array(user_ids, dtype=np.int64)
+            self.thresholds = np.array(thresholds, dtype=np.float64)
+            self.last_prices = np.array(last_prices, dtype=np.float64)
+        else:
+            self.user_ids = array('q', user_ids)
+            self.thresholds = array('d', thresholds)
+            self.last_prices = array('d', last_prices)
+        self._positions = None
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def set_last_price(self, user_id: int, price: float):
+        if self._positions is None:
+            self._positions = {int(uid): i for i, uid in enumerate(self.user_ids)}
+        position = self._positions.get(user_id)
+        if position is not None:
+            self.last_prices[position] = price
+
+    def set_last_prices(self, items: List[Tuple[int, float]]):
+        for user_id, price in items:
+            self.set_last_price(user_id, price)
+
+class CoinBands:
+    """
+    Подписчики одной монеты, отсортированные по ценам срабатывания
+
+    Подписка с последней ценой last и порогом t срабатывает, когда цена
+    поднимается до last * (1 + t/100) или опускается до last * (1 - t/100).
+    Верхние и нижние границы хранятся в отсортированных массивах, и новая
+    цена находит все пересеченные границы бинарным поиском: тик стоит
+    O(log n + сработавшие) вместо прохода по всем подписчикам.
+    """
+
+    __slots__ = ('version', 'min_threshold', 'upper_prices', 'upper_ids', 'lower_prices', 'lower_ids',
+                 '_subscriptions', '_unanchored')
+
+    # Если за раз переносится больше этой доли подписок, границы проще
+    # отсортировать заново, чем вставлять по одной
+    REBUILD_FRACTION = 0.5
+
+    def __init__(self, version, user_ids, thresholds, last_prices):
+        self.version = version
+        self.min_threshold = min(thresholds, default=None)
+        # id -> [порог, последняя цена]
+        self._subscriptions = {user_id: [threshold, last]
+                               for user_id, threshold, last in zip(user_ids, thresholds, last_prices)}
+        self._rebuild()
+
+    def _rebuild(self):
+        """Заново строит отсортированные границы по всем подпискам"""
+        self._unanchored = {}  # подписки без последней цены (упорядоченное множество)
+        ids, uppers, lowers = [], [], []
+        for user_id, (threshold, last) in self._subscriptions.items():
+            if last is not None and last > 0:
+                ids.append(user_id)
+                uppers.append(self._upper(last, threshold))
+                lowers.append(self._lower(last, threshold))
+            else:
+                self._unanchored[user_id] = None
+
+        order = sorted(range(len(ids)), key=uppers.__getitem__)
+        self.upper_prices = array('d', [uppers[i] for i in order])
+        self.upper_ids = array('q', [ids[i] for i in order])
+        order = sorted(range(len(ids)), key=lowers.__getitem__)
+        self.lower_prices = array('d', [lowers[i] for i in order])
+        self.lower_ids = array('q', [ids[i] for i in order])
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    @staticmethod
+    def _upper(last, threshold):
+        return last * (1 + threshold / 100)
+
+    @staticmethod
+    def _lower(last, threshold):
+        return last * (1 - threshold / 100)
+
+    @staticmethod
+    def _insert(prices, ids, price, user_id):
+        position = bisect_right(prices, price)
+        prices.insert(position, price)
+        ids.insert(position, user_id)
+
+    @staticmethod
+    def _remove(prices, ids, price, user_id):
+        position = bisect_left(prices, price)
+        while ids[position] != user_id:  # одинаковые границы у разных подписок
+            position += 1
+        del prices[position]
+        del ids[position]
+
+    def set_last_price(self, user_id: int, price: float):
+        """Переносит границы подписки к новой последней цене"""
+        subscription = self._subscriptions.get(user_id)
+        if subscription is None:
+            return
+        threshold, last = subscription
+        if user_id in self._unanchored:
+            del self._unanchored[user_id]
+        else:
+            self._remove(self.upper_prices, self.upper_ids, self._upper(last, threshold), user_id)
+            self._remove(self.lower_prices, self.lower_ids, self._lower(last, threshold), user_id)
+
+        subscription[1] = price
+        if price > 0:
+            self._insert(self.upper_prices, self.upper_ids, self._upper(price, threshold), user_id)
+            self._insert(self.lower_prices, self.lower_ids, self._lower(price, threshold), user_id)
+        else:
+            self._unanchored[user_id] = None
+
+    def set_last_prices(self, items: List[Tuple[int, float]]):
+        """Переносит границы нескольких подписок"""
+        if len(items) <= len(self._subscriptions) * self.REBUILD_FRACTION:
+            for user_id, price in items:
+                self.set_last_price(user_id, price)
+            return
+        for user_id, price in items:
+            subscription = self._subscriptions.get(user_id)
+            if subscription is not None:
+                subscription[1] = price
+        self._rebuild()
+
+    def evaluate(self, coin, price, alerts, anchors) -> int:
+        """
+        Добавляет сработавшие подписки и подписки без цены
+
+        Returns:
+            Сколько подписок пришлось проверить
+        """
+        anchors.extend(zip(self._unanchored, repeat(coin), repeat(price)))
+        subscriptions = self._subscriptions
+
+        # Рост: верхние границы не выше цены; падение: нижние не ниже цены.
+        # Каждая подписка проверяется только в одном направлении.
+        end = bisect_right(self.upper_prices, price * (1 + BAND_SLACK))
+        start = bisect_left(self.lower_prices, price * (1 - BAND_SLACK))
+        candidates = self.upper_ids[:end].tolist() + self.lower_ids[start:].tolist()
+
+        for position, user_id in enumerate(candidates):
+            threshold, last = subscriptions[user_id]
+            if (price >= last) != (position < end):
+                continue
+            change = abs((price - last) / last * 100)
+            if change >= threshold:
+                alerts.append(Alert(user_id, coin, last, price, change))
+        return len(candidates)
+
+class CoinBlock:
+    """
+    Колонки нескольких монет подряд в общих массивах NumPy
+
+    Колонки монет после сборки блока становятся срезами его массивов, поэтому
+    обновление последней цены через CoinColumns сразу видно и в блоке.
+    """
+
+    def __init__(self, coins: List[str], columns: List[CoinColumns]):
+        self.coins = coins
+        self.lengths = np.array([len(c) for c in columns], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(self.lengths)))
+        self.user_ids = np.concatenate([c.user_ids for c in columns]) if columns else np.empty(0, np.int64)
+        self.thresholds = np.concatenate([c.thresholds for c in columns]) if columns else np.empty(0)
+        self.last_prices = np.concatenate([c.last_prices for c in columns]) if columns else np.empty(0)
+
+        for c, start, end in zip(columns, self.offsets[:-1].tolist(), self.offsets[1:].tolist()):
+            c.user_ids = self.user_ids[start:end]
+            c.thresholds = self.thresholds[start:end]
+            c.last_prices = self.last_prices[start:end]
+
+    def coins_of(self, positions) -> List[str]:
+        """Монета для каждой позиции блока"""
+        coins = self.coins
+        return [coins[i] for i in (np.searchsorted(self.offsets, positions, side='right') - 1).tolist()]
+
+class ThresholdEngine:
+    """
+    Проверка порогов всех подписок за тик
+
+    По умолчанию (THRESHOLD_INDEX=bands) подписки монеты хранятся в индексе
+    границ срабатывания CoinBands, и тик проверяет только пересеченные
+    границы. При THRESHOLD_INDEX=columns пороги и последние цены хранятся
+    колонками, и изменение цены считается для всех подписок одним векторным
+    проходом (NumPy) или простым циклом по массивам, если NumPy нет.
+    Индекс монеты перечитывается из базы, только когда меняется версия ее
+    подписчиков.
+    """
+
+    def __init__(self, database=None, index: str = None, use_numpy: bool = None):
+        self.db = database or async_db
+        self.index = index or Config.THRESHOLD_INDEX
+        self.use_numpy = self.index == 'columns' and (NUMPY_AVAILABLE if use_numpy is None
+                                                      else use_numpy and NUMPY_AVAILABLE)
+        self._columns: Dict[str, CoinColumns] = {}
+        self._block = None  # колонки монет последнего тика одним блоком (NumPy)
+        self.stats = {'ticks': 0, 'evaluated': 0, 'fired': 0, 'rebuilds': 0}
+
+    async def _get_columns(self, coin: str, version: int) -> CoinColumns:
+        columns = self._columns.get(coin)
+        if columns is None or columns.version != version:
+            subscribers = await self.db.get_coin_subscribers(coin)
+            if self.index == 'columns':
+                columns = CoinColumns(*subscribers, self.use_numpy)
+            else:
+                columns = CoinBands(*subscribers)
+            self.stats['rebuilds'] += 1
+            # Пустой индекс тоже запоминается: монету без подписчиков не нужно
+            # перечитывать из базы каждый тик
+            self._columns[coin] = columns
+        return columns
+
+    def coin_state(self, coin: str) -> Optional[Tuple[int, Optional[float]]]:
+        """Версия и самый маленький порог подписчиков монеты из кэша или None"""
+        index = self._columns.get(coin)
+        if index is None:
+            return None
+        return index.version, index.min_threshold
+
+    async def evaluate(self, prices: Dict[str, float]) -> TickResult:
+        """Находит сработавшие подписки для цен тика {монета: цена}"""
+        alerts, anchors = [], []
+        versions = await self.db.get_coin_versions(list(prices))
+        rebuilds = self.stats['rebuilds']
+        coins = []
+
+        for coin in prices:
+            index = await self._get_columns(coin, versions.get(coin, 0))
+            if not len(index):
+                continue
+            if self.index == 'columns':
+                coins.append(coin)
+                self.stats['evaluated'] += len(index)
+            else:
+                self.stats['evaluated'] += index.evaluate(coin, float(prices[coin]), alerts, anchors)
+
+        if self.use_numpy:
+            if self._block is None or self._block.coins != coins or self.stats['rebuilds'] != rebuilds:
+                self._block = CoinBlock(coins, [self._columns[coin] for coin in coins])
+            self._evaluate_numpy(self._block, prices, alerts, anchors)
+        else:
+            for coin in coins:
+                self._evaluate_python(coin, float(prices[coin]), self._columns[coin], alerts, anchors)
+
+        self.stats['ticks'] += 1
+        self.stats['fired'] += len(alerts)
+        return TickResult(alerts, anchors)
+
+    @staticmethod
+    def _evaluate_numpy(block, prices, alerts, anchors):
+        """Один векторный проход по подпискам всех монет тика"""
+        if not block.coins:
+            return
+        tick_prices = np.repeat(np.array([prices[coin] for coin in block.coins], dtype=np.float64), block.lengths)
+        last = block.last_prices
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = np.abs((tick_prices - last) / last * 100)
+        valid = last > 0  # NaN (цены еще нет) и 0 дают False
+
+        fired = np.flatnonzero(valid & (change >= block.thresholds))
+        if len(fired):
+            # Объекты Python создаются только для сработавших подписок
+            alerts.extend(map(Alert, block.user_ids[fired].tolist(), block.coins_of(fired),
+                              last[fired].tolist(), tick_prices[fired].tolist(), change[fired].tolist()))
+        missing = np.flatnonzero(~valid)
+        if len(missing):
+            anchors.extend(zip(block.user_ids[missing].tolist(), block.coins_of(missing),
+                               tick_prices[missing].tolist()))
+
+    @staticmethod
+    def _evaluate_python(coin, price, columns, alerts, anchors):
+        for user_id, threshold, last in zip(columns.user_ids, columns.thresholds, columns.last_prices):
+            if not last > 0:  # NaN - цены еще нет
+                anchors.append((user_id, coin, price))
+                continue
+            change = abs((price - last) / last * 100)
+            if change >= threshold:
+                alerts.append(Alert(user_id, coin, last, price, change))
+
+    async def save(self, updates: Iterable[Tuple[int, str, float]]):
+        """Сохраняет новые последние цены в базу и в колонки движка"""
+        updates = list(updates)
+        if not updates:
+            return
+
+        versions = await self.db.get_coin_versions({coin for _, coin, _ in updates})
+        await self.db.update_prices(updates)
+
+        by_coin = defaultdict(list)
+        for user_id, coin, price in updates:
+            by_coin[coin].append((user_id, price))
+
+        for coin, items in by_coin.items():
+            columns = self._columns.get(coin)
+            if columns is None:
+                continue
+            if columns.version != versions[coin]:
+                # Колонки уже устарели - перечитаем на следующем тике
+                continue
+            columns.set_last_prices(items)
+            # update_prices увеличивает версию монеты ровно на 1; если кто-то еще
+            # менял монету, версии не совпадут и колонки перечитаются
+            columns.version += 1